@@ -0,0 +1,313 @@
+# bench/carga_webhook.py
+# Teste de carga do /whatsapp com tudo local: um stub que serve os PDFs das MediaUrlN, um stub da API de
+# mensagens do Twilio (o server aponta para ele via TWILIO_API_BASE) que registra cada envio, e um driver
+# que reproduz conversas reais (upload → menu → resposta "1"/"2") numa taxa configurável.
+# Mede a latência de resposta do webhook, o tempo até o link do PDF chegar ao "WhatsApp" e as mensagens perdidas.
+# Uso: python bench/carga_webhook.py [--conversas 40] [--taxa 4] [--pdfs 1-3] [--pensar 1.0] [--timeout 180]
+#                                    [--comando "gunicorn -w 2 -k gthread --threads 4 -b 127.0.0.1:{porta} server:app"]
+#                                    [--alvo http://127.0.0.1:5000] [--erro-twilio 0.05] [--json saida.json]
+#   Sem --alvo o script sobe o server (comando acima, o mesmo do Dockerfile) com pastas/DBs temporários.
+#   Com --alvo, o server já rodando precisa ter TWILIO_API_BASE=http://127.0.0.1:<--porta-twilio> e
+#   credenciais Twilio quaisquer — o script mostra as variáveis ao iniciar.
+import os, sys, json, time, uuid, shlex, random, socket, argparse, tempfile, threading, subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import fitz  # PyMuPDF
+import requests
+from throughput import EMISSORES, _chave, _pagina_digital
+
+COMANDO_PADRAO = "gunicorn -w 2 -k gthread --threads 4 --timeout 120 -b 127.0.0.1:{porta} server:app"
+FROM_WHATSAPP  = "whatsapp:+14155238886"
+
+# ===== Stubs =====
+class _Silencioso(BaseHTTPRequestHandler):
+    def log_message(self, *a):
+        pass
+
+def _servir(handler, porta: int) -> ThreadingHTTPServer:
+    srv = ThreadingHTTPServer(("127.0.0.1", porta), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name=f"stub-{srv.server_port}", daemon=True).start()
+    return srv
+
+def stub_midias(pdfs: Dict[str, bytes], porta: int = 0) -> ThreadingHTTPServer:
+    """GET /midia/<nome> → o PDF (como a URL de mídia do Twilio, que o server baixa com auth básica)."""
+    class H(_Silencioso):
+        def do_GET(self):
+            corpo = pdfs.get(self.path.rsplit("/", 1)[-1])
+            if corpo is None:
+                self.send_error(404); return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+    return _servir(H, porta)
+
+class RegistroTwilio:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mensagens: List[Dict[str, Any]] = []
+        self.recusadas = 0
+
+    def por_destino(self, to: str) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [m for m in self.mensagens if m["to"] == to]
+
+def stub_twilio(reg: RegistroTwilio, porta: int = 0, erro: float = 0.0, latencia_ms: float = 0.0) -> ThreadingHTTPServer:
+    """POST /2010-04-01/Accounts/<sid>/Messages.json — registra e responde como a API (ou 429 com prob. `erro`)."""
+    rng = random.Random(1)
+    class H(_Silencioso):
+        def do_POST(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            form = parse_qs(self.rfile.read(n).decode("utf-8"))
+            if latencia_ms:
+                time.sleep(latencia_ms / 1000)
+            with reg.lock:
+                recusa = erro and rng.random() < erro
+                if recusa:
+                    reg.recusadas += 1
+                else:
+                    reg.mensagens.append({"t": time.time(), "to": form.get("To", [""])[0], "body": form.get("Body", [""])[0],
+                                          "media": form.get("MediaUrl", [])})
+            if recusa:
+                corpo = json.dumps({"code": 20429, "message": "Too Many Requests", "status": 429}).encode()
+                self.send_response(429)
+            else:
+                corpo = json.dumps({"sid": "SM" + uuid.uuid4().hex, "status": "queued", "to": form.get("To", [""])[0],
+                                    "from": form.get("From", [""])[0], "body": form.get("Body", [""])[0],
+                                    "num_media": str(len(form.get("MediaUrl", [])))}).encode()
+                self.send_response(201)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+    return _servir(H, porta)
+
+# ===== Corpus =====
+def gerar_pdfs(total: int, seed: int) -> Dict[str, bytes]:
+    """Um CT-e digital de 1 página por PDF, cada um com número próprio (a saída não colide entre conversas)."""
+    rng = random.Random(seed)
+    pdfs: Dict[str, bytes] = {}
+    numero = 10000 + rng.randint(0, 50000)
+    for k in range(total):
+        numero += 1
+        emissor = rng.choice(sorted(EMISSORES))
+        caso = {"emissor": emissor, "cnpj": EMISSORES[emissor], "numero": numero}
+        caso["chave"] = _chave(rng, caso["cnpj"], numero)
+        doc = fitz.open()
+        _pagina_digital(doc, caso, None)
+        pdfs[f"cte_{k+1:05d}.pdf"] = doc.tobytes(garbage=1, deflate=True)
+        doc.close()
+    return pdfs
+
+# ===== Server =====
+def subir_server(comando: str, porta: int, porta_twilio: int, pasta: str, log) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        # credenciais falsas + host da API no stub: nada sai para o Twilio de verdade (e o .env não sobrescreve)
+        "TWILIO_ACCOUNT_SID": "AC" + "0" * 32, "TWILIO_AUTH_TOKEN": "stub", "TWILIO_WHATSAPP_FROM": FROM_WHATSAPP,
+        "TWILIO_API_BASE": f"http://127.0.0.1:{porta_twilio}",
+        "INPUT_DIR": os.path.join(pasta, "entradas"), "OUTPUT_DIR": os.path.join(pasta, "renomeados"),
+        "PENDENTES_DIR": os.path.join(pasta, "pendentes"), "PROCESSED_DIR": os.path.join(pasta, "processados"),
+        "PUBLIC_BASE_URL": f"http://127.0.0.1:{porta}",
+        "FILA_DB": os.path.join(pasta, "fila.sqlite"), "CATALOGO_DB": os.path.join(pasta, "catalogo.sqlite"),
+        "CACHE_DB": os.path.join(pasta, "cache.sqlite"), "SESSION_DB": os.path.join(pasta, "sessoes.sqlite"),
+        "METRICAS_DB": os.path.join(pasta, "metricas.sqlite"), "FAXINA_DB": os.path.join(pasta, "faxina.sqlite"),
+        "PYTHONPATH": RAIZ + os.pathsep + os.environ.get("PYTHONPATH", ""),
+    })
+    env.setdefault("SESSION_BACKEND", "sqlite")   # -w 2: upload e resposta podem cair em workers diferentes
+    p = subprocess.Popen(shlex.split(comando.format(porta=porta)), cwd=RAIZ, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base = f"http://127.0.0.1:{porta}"
+    limite = time.monotonic() + 60
+    while time.monotonic() < limite:
+        if p.poll() is not None:
+            raise RuntimeError(f"server saiu com código {p.returncode} (veja o log)")
+        try:
+            if requests.get(base + "/health", timeout=1).ok:
+                return p
+        except requests.RequestException:
+            pass
+        time.sleep(0.3)
+    p.terminate()
+    raise RuntimeError("server não respondeu /health em 60s")
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+# ===== Driver =====
+def conversa(i: int, alvo: str, base_midia: str, nomes: List[str], pensar: float, rng: random.Random) -> Dict[str, Any]:
+    """Um remetente: manda os PDFs, espera o menu (pensando um pouco) e responde 1 ou 2."""
+    to = f"whatsapp:+55719{i:08d}"
+    r: Dict[str, Any] = {"to": to, "pdfs": len(nomes), "webhook_ms": [], "erros": []}
+    s = requests.Session()
+    form = {"From": to, "To": FROM_WHATSAPP, "Body": "", "NumMedia": str(len(nomes))}
+    for k, nome in enumerate(nomes):
+        form[f"MediaUrl{k}"] = f"{base_midia}/midia/{nome}"
+        form[f"MediaContentType{k}"] = "application/pdf"
+    r["t_upload"] = time.time()
+    for etapa, dados in (("upload", form), ("escolha", {"From": to, "To": FROM_WHATSAPP, "Body": rng.choice("12"), "NumMedia": "0"})):
+        if etapa == "escolha":
+            time.sleep(pensar * rng.uniform(0.5, 1.5))
+            r["t_escolha"] = time.time()
+        t0 = time.perf_counter()
+        try:
+            resp = s.post(alvo + "/whatsapp", data=dados, timeout=30)
+            if resp.status_code != 200:
+                r["erros"].append(f"{etapa}: HTTP {resp.status_code}")
+        except requests.RequestException as e:
+            r["erros"].append(f"{etapa}: {e}")
+        r["webhook_ms"].append((etapa, (time.perf_counter() - t0) * 1000))
+    return r
+
+def aguardar_entregas(reg: RegistroTwilio, conversas: List[Dict[str, Any]], timeout: float) -> None:
+    """Espera até cada conversa receber um link por PDF (ou estourar o timeout) e anota os tempos."""
+    limite = time.monotonic() + timeout
+    pendentes = list(conversas)
+    while pendentes and time.monotonic() < limite:
+        time.sleep(0.5)
+        pendentes = [c for c in pendentes if len([m for m in reg.por_destino(c["to"]) if m["media"]]) < c["pdfs"]]
+    for c in conversas:
+        midias = sorted((m for m in reg.por_destino(c["to"]) if m["media"]), key=lambda m: m["t"])
+        links = [u for m in midias for u in m["media"]]
+        c["links"] = links
+        c["entregues"] = len(set(links))
+        c["duplicados"] = len(links) - len(set(links))
+        if midias and "t_escolha" in c:
+            c["primeiro_link_s"] = midias[0]["t"] - c["t_escolha"]
+            c["ultimo_link_s"] = midias[min(len(midias), c["pdfs"]) - 1]["t"] - c["t_escolha"]
+
+def _pct(v: List[float], q: float) -> Optional[float]:
+    v = sorted(v)
+    return round(v[min(len(v) - 1, int(len(v) * q))], 1) if v else None
+
+def relatorio(conversas: List[Dict[str, Any]], reg: RegistroTwilio, duracao: float, links_ok: Optional[int]) -> Dict[str, Any]:
+    wh: Dict[str, List[float]] = {}
+    for c in conversas:
+        for etapa, ms in c["webhook_ms"]:
+            wh.setdefault(etapa, []).append(ms)
+    esperados = sum(c["pdfs"] for c in conversas)
+    entregues = sum(min(c["entregues"], c["pdfs"]) for c in conversas)
+    prim = [c["primeiro_link_s"] * 1000 for c in conversas if "primeiro_link_s" in c]
+    ult = [c["ultimo_link_s"] * 1000 for c in conversas if "ultimo_link_s" in c and c["entregues"] >= c["pdfs"]]
+    return {
+        "conversas": len(conversas), "pdfs": esperados, "duracao_s": round(duracao, 1),
+        "webhook_ms": {e: {"n": len(v), "p50": _pct(v, 0.5), "p95": _pct(v, 0.95), "p99": _pct(v, 0.99),
+                           "max": round(max(v), 1)} for e, v in wh.items()},
+        "ate_primeiro_link_ms": {"p50": _pct(prim, 0.5), "p95": _pct(prim, 0.95), "max": round(max(prim), 1) if prim else None},
+        "ate_ultimo_link_ms": {"p50": _pct(ult, 0.5), "p95": _pct(ult, 0.95), "max": round(max(ult), 1) if ult else None},
+        "links_entregues": entregues, "links_perdidos": esperados - entregues,
+        "links_duplicados": sum(c["duplicados"] for c in conversas),
+        "links_baixaveis": links_ok,
+        "pdfs_por_s": round(entregues / duracao, 2) if duracao else None,
+        "mensagens_twilio": len(reg.mensagens), "twilio_429": reg.recusadas,
+        "erros_webhook": [e for c in conversas for e in c["erros"]][:50],
+    }
+
+def _conferir_links(conversas: List[Dict[str, Any]]) -> int:
+    """Baixa cada link entregue (é o que o destinatário abriria)."""
+    ok = 0
+    s = requests.Session()
+    for c in conversas:
+        for u in set(c["links"]):
+            try:
+                r = s.get(u, timeout=15)
+                ok += r.ok and r.content[:4] == b"%PDF"
+            except requests.RequestException:
+                pass
+    return ok
+
+# ===== CLI =====
+def main():
+    ap = argparse.ArgumentParser(description="Teste de carga do webhook /whatsapp com stubs locais de mídia e Twilio")
+    ap.add_argument("--conversas", type=int, default=40)
+    ap.add_argument("--taxa", type=float, default=4.0, help="Conversas iniciadas por segundo")
+    ap.add_argument("--pdfs", default="1-3", help="PDFs por conversa (N ou MIN-MAX)")
+    ap.add_argument("--pensar", type=float, default=1.0, help="Segundos (±50%%) entre o upload e a resposta 1/2")
+    ap.add_argument("--timeout", type=float, default=180, help="Espera máxima pelas entregas depois da última conversa")
+    ap.add_argument("--comando", default=COMANDO_PADRAO, help="Comando do server ({porta} é substituído)")
+    ap.add_argument("--alvo", help="URL de um server já rodando (não sobe outro)")
+    ap.add_argument("--porta-midia", type=int, default=0)
+    ap.add_argument("--porta-twilio", type=int, default=0)
+    ap.add_argument("--erro-twilio", type=float, default=0.0, help="Fração de envios respondidos com 429")
+    ap.add_argument("--latencia-twilio", type=float, default=0.0, help="ms de latência simulada da API do Twilio")
+    ap.add_argument("--seed", type=int, default=11)
+    ap.add_argument("--log", help="Grava a saída do server neste arquivo")
+    ap.add_argument("--json", help="Grava o resultado neste arquivo")
+    a = ap.parse_args()
+
+    lo, _, hi = a.pdfs.partition("-")
+    lo, hi = int(lo), int(hi or lo)
+    rng = random.Random(a.seed)
+    qtds = [rng.randint(lo, hi) for _ in range(a.conversas)]
+    pdfs = gerar_pdfs(sum(qtds), a.seed)
+    nomes = sorted(pdfs)
+
+    reg = RegistroTwilio()
+    midia = stub_midias(pdfs, a.porta_midia)
+    twilio = stub_twilio(reg, a.porta_twilio, a.erro_twilio, a.latencia_twilio)
+    base_midia = f"http://127.0.0.1:{midia.server_port}"
+    tmp = tempfile.TemporaryDirectory()
+    log = open(a.log, "w") if a.log else subprocess.DEVNULL
+    server = None
+    try:
+        if a.alvo:
+            alvo = a.alvo.rstrip("/")
+            print(f"ℹ️ Usando {alvo}: o server precisa de TWILIO_API_BASE=http://127.0.0.1:{twilio.server_port} "
+                  f"e TWILIO_ACCOUNT_SID/TWILIO_AUTH_TOKEN/TWILIO_WHATSAPP_FROM quaisquer")
+        else:
+            porta = _porta_livre()
+            server = subir_server(a.comando, porta, twilio.server_port, tmp.name, log)
+            alvo = f"http://127.0.0.1:{porta}"
+            print(f"🚀 Server no ar: {a.comando.format(porta=porta)}")
+
+        print(f"📨 {a.conversas} conversa(s), {len(pdfs)} PDF(s), {a.taxa}/s")
+        t0 = time.time()
+        futs, k = [], 0
+        with ThreadPoolExecutor(max_workers=max(1, a.conversas)) as ex:
+            for i, q in enumerate(qtds):
+                espera = t0 + i / a.taxa - time.time()
+                if espera > 0: time.sleep(espera)
+                futs.append(ex.submit(conversa, i, alvo, base_midia, nomes[k:k + q], a.pensar, random.Random(a.seed + i)))
+                k += q
+            conversas = [f.result() for f in futs]
+        aguardar_entregas(reg, conversas, a.timeout)
+        duracao = max([m["t"] for m in reg.mensagens if m["media"]] or [time.time()]) - t0
+        res = relatorio(conversas, reg, duracao, _conferir_links(conversas))
+    finally:
+        if server:
+            server.terminate()
+            try: server.wait(15)
+            except subprocess.TimeoutExpired: server.kill()
+        midia.shutdown(); twilio.shutdown()
+        if a.log: log.close()
+        tmp.cleanup()
+
+    res["config"] = {"conversas": a.conversas, "taxa": a.taxa, "pdfs": a.pdfs, "pensar": a.pensar,
+                     "comando": None if a.alvo else a.comando, "alvo": a.alvo, "erro_twilio": a.erro_twilio,
+                     "latencia_twilio": a.latencia_twilio, "seed": a.seed}
+    print(f"\n{'webhook':<10}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'máx ms':>10}")
+    for e, v in res["webhook_ms"].items():
+        print(f"{e:<10}{v['n']:>6}{v['p50']:>10}{v['p95']:>10}{v['p99']:>10}{v['max']:>10}")
+    p, u = res["ate_primeiro_link_ms"], res["ate_ultimo_link_ms"]
+    print(f"\nescolha → 1º link: p50 {p['p50']} ms · p95 {p['p95']} ms · máx {p['max']} ms")
+    print(f"escolha → último link: p50 {u['p50']} ms · p95 {u['p95']} ms · máx {u['max']} ms")
+    print(f"links: {res['links_entregues']}/{res['pdfs']} entregues, {res['links_perdidos']} perdido(s), "
+          f"{res['links_duplicados']} duplicado(s), {res['links_baixaveis']} baixável(is) · {res['pdfs_por_s']} PDF/s")
+    print(f"Twilio: {res['mensagens_twilio']} mensagem(ns) registradas, {res['twilio_429']} recusada(s) com 429")
+    if res["erros_webhook"]:
+        print(f"⚠️ {len(res['erros_webhook'])} erro(s) no webhook, ex.: {res['erros_webhook'][0]}")
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# bench/heuristica.py
+# Regressão + micro-benchmark da heurística de emissor: compara a implementação atual (casador pré-compilado)
+# com a anterior (cópia abaixo) sobre dicts de ocr_data gravados em JSON e um corpus sintético de DACTEs.
+# Uso: python bench/heuristica.py [ocr1.json ocr2.json ...] [--sinteticos 300] [--densidade 1] [--repeticoes 5] [--json saida.json]
+# Cada JSON pode ser um dict do image_to_data ou uma lista deles ({"data": ..., "cnpj": "..."} também vale).
+# Sai com código 1 se algum resultado divergir.
+import os, re, sys, json, time, random, argparse, statistics
+from typing import Optional, Dict, Any, Tuple, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import renomear_cte_mesma_pasta as R
+from renomear_cte_mesma_pasta import NEG_TOKENS, ROLE_TOKENS, PREF_TOKENS, remover_acentos, _digits_only
+
+# ===== Implementação anterior (referência — não editar) =====
+def _ref_is_bad_line(s: str) -> bool:
+    u = remover_acentos(s).upper()
+    if sum(c.isdigit() for c in u) > max(2, len(u)//4):
+        return True
+    return any(tok in u for tok in NEG_TOKENS)
+
+def _ref_looks_like_address(s: str) -> bool:
+    u = remover_acentos(s).upper()
+    if any(tok in u for tok in ("AVENIDA", "AV ", "AV.", "RUA", "R.", "RODOVIA", "ROD.", "BR-", "BA-", "KM", "CEP", "BAIRRO", "SALA", "LOTE", "QUADRA")):
+        return True
+    if re.search(r"\b\d{2,5}\b", u) and ("CEP" in u or "RUA" in u or "AV" in u or "KM" in u):
+        return True
+    return False
+
+def _ref_clean_company_line(s: str) -> str:
+    s = s.strip(" :.-\t")
+    s = re.sub(r"^(RAZAO\s+SOCIAL|RAZAO|EMITENTE|EMISSOR|PRESTADOR(?:\s+DE\s+SERVI[ÇC]O)?|EMPRESA)\s*[:\-]*\s*", "", s, flags=re.I)
+    cut_regex = r"\b(" + "|".join(list(ROLE_TOKENS) + ["MUNICIPIO", "CEP", "ENDERECO", "ENDEREÇO", "UF"]) + r")\b"
+    s = re.split(cut_regex, remover_acentos(s), maxsplit=1, flags=re.I)[0]
+    s = re.sub(r"\s{2,}", " ", s).strip()
+    return s
+
+def _ref_score_company_line(s: str) -> int:
+    u = remover_acentos(s).upper()
+    score = len(u)
+    for t in PREF_TOKENS:
+        if t in u: score += 25
+    if _ref_is_bad_line(u) or _ref_looks_like_address(u): score -= 200
+    if "DECLARO" in u or "RECEBI" in u or "VOLUMES" in u: score -= 300
+    return score
+
+def _ref_guess_emissor_from_data(data: Dict[str, Any], cnpj14: Optional[str]) -> Optional[str]:
+    n = len(data.get("text", []))
+    if n == 0: return None
+
+    # monta linhas por (block, par, line)
+    lines: Dict[Tuple[int,int,int], Dict[str, Any]] = {}
+    page_h = 0
+    for i in range(n):
+        txt = (data["text"][i] or "").strip()
+        if not txt: continue
+        conf_raw = str(data.get("conf", ["-1"])[i])
+        try: conf = int(float(conf_raw))
+        except: conf = -1
+        if conf < 35: continue
+        b = int(data.get("block_num", [0])[i] or 0)
+        p = int(data.get("par_num", [0])[i] or 0)
+        ln = int(data.get("line_num", [0])[i] or 0)
+        key = (b,p,ln)
+        rec = lines.setdefault(key, {"words": [], "xs": [], "left": 10**9, "right": -1, "top": 10**9, "bottom": -1, "block": b})
+        left = int(data.get("left", [0])[i] or 0)
+        width = int(data.get("width", [0])[i] or 0)
+        top = int(data.get("top", [0])[i] or 0)
+        h   = int(data.get("height", [0])[i] or 0)
+        x_center = left + width/2.0
+        rec["words"].append(txt)
+        rec["xs"].append(x_center)
+        rec["left"] = min(rec["left"], left)
+        rec["right"] = max(rec["right"], left + width)
+        rec["top"] = min(rec["top"], top)
+        rec["bottom"] = max(rec["bottom"], top+h)
+        page_h = max(page_h, rec["bottom"])
+
+    # âncoras
+    dacte_top = None
+    label_blocks: set[int] = set()
+    for (b,p,ln), rec in lines.items():
+        uline = remover_acentos(" ".join(rec["words"])).upper()
+        if "DACTE" in uline:
+            if dacte_top is None or rec["top"] < dacte_top:
+                dacte_top = rec["top"]
+        if any(tok in uline for tok in ("EMITENTE", "EMISSOR", "PRESTADOR", "TRANSPORTADOR")):
+            label_blocks.add(b)
+
+    # CNPJs detectados
+    def _fmt_cnpj(c):
+        if not c or len(c)!=14: return None
+        return f"{c[0:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:14]}"
+    cnpj_fmt = _fmt_cnpj(cnpj14)
+
+    candidates = []
+    for key, rec in lines.items():
+        line_text = " ".join(rec["words"])
+        u = remover_acentos(line_text).upper()
+        if "CNPJ" in u or (cnpj14 and cnpj14 in _digits_only(u)) or (cnpj_fmt and cnpj_fmt in u):
+            candidates.append((key, rec))
+
+    if not candidates:
+        return None
+
+    by_label = [(k,r) for (k,r) in candidates if r.get("block") in label_blocks]
+    if by_label:
+        candidates = by_label
+
+    candidates.sort(key=lambda kv: kv[1]["top"])
+    if dacte_top is not None:
+        near = [kv for kv in candidates if kv[1]["top"] <= dacte_top + 220]
+        if near:
+            candidates = near
+
+    top_half = [kv for kv in candidates if kv[1]["top"] <= page_h * 0.60]
+    if top_half:
+        candidates = top_half
+
+    (b,p,ln), cnpj_rec = candidates[0]
+    cnpj_x_med = statistics.median(cnpj_rec["xs"]) if cnpj_rec["xs"] else (cnpj_rec["left"] + cnpj_rec["right"]) / 2.0
+
+    best_name = None
+    best_score = -10**9
+
+    for offset in (1,2,3,4,5):
+        prev_key = (b,p,ln - offset)
+        prev = lines.get(prev_key)
+        if not prev: continue
+        if prev["top"] > page_h * 0.60:
+            continue
+        words_filtered = [w for w,x in zip(prev["words"], prev["xs"]) if x <= cnpj_x_med + 40]
+        cand = _ref_clean_company_line(" ".join(words_filtered)) if words_filtered else _ref_clean_company_line(" ".join(prev["words"]))
+        if not cand: continue
+        if _ref_is_bad_line(cand) or _ref_looks_like_address(cand): continue
+        sc = _ref_score_company_line(cand)
+        if sc > best_score:
+            best_score, best_name = sc, cand
+
+    if not best_name:
+        cutoff = page_h * 0.30
+        for (kb,kp,kl), rec in sorted(lines.items(), key=lambda kv: kv[1]["top"]):
+            if rec["top"] > cutoff: break
+            cand = _ref_clean_company_line(" ".join(rec["words"]))
+            if not cand or len(remover_acentos(cand)) < 8: continue
+            if _ref_is_bad_line(cand) or _ref_looks_like_address(cand): continue
+            sc = _ref_score_company_line(cand)
+            if sc > best_score:
+                best_score, best_name = sc, cand
+
+    return best_name
+
+# ===== Corpus =====
+_EMPRESAS = ["TRANSPORTADORA RIO VERDE LTDA", "Logística São João S/A", "WANDER PEREIRA DE MATOS ME",
+             "Comercial Bahia Distribuição EPP", "TRANS NORTE SUL TRANSPORTES", "Indústria de Cargas Ômega LTDA"]
+_RUIDO = ["DACTE - DOCUMENTO AUXILIAR DO CONHECIMENTO DE TRANSPORTE ELETRÔNICO", "RUA DAS FLORES, 123 - CENTRO",
+          "AV. BRASIL 4500 SALA 2", "CEP 44000-000 FEIRA DE SANTANA BA", "MODELO 57 SÉRIE 1 NÚMERO 12345",
+          "REMETENTE: FULANO DE TAL", "DESTINATÁRIO: CICLANO", "DECLARO QUE RECEBI OS VOLUMES", "TRAVESSA 12 KM 3",
+          "PROTOCOLO DE AUTORIZAÇÃO 1234567890", "Emitente: Razão Social", "RODOVIA BR-116 KM 90 LOTE 4"]
+
+def _linha(rng: random.Random, words: List[str], top: int, bloco: int, par: int, ln: int, x0: int = 100) -> Dict[str, List[Any]]:
+    d: Dict[str, List[Any]] = {k: [] for k in ("text", "conf", "left", "top", "width", "height", "block_num", "par_num", "line_num")}
+    x = x0
+    for w in words:
+        d["text"].append(w); d["conf"].append(str(rng.choice([20, 60, 90, 96]))); d["left"].append(x)
+        d["top"].append(top); d["width"].append(12 * len(w)); d["height"].append(24)
+        d["block_num"].append(bloco); d["par_num"].append(par); d["line_num"].append(ln)
+        x += 12 * len(w) + 14
+    return d
+
+def sintetico(rng: random.Random, densidade: int = 1) -> Tuple[Dict[str, List[Any]], Optional[str]]:
+    """Página DACTE fake: rótulo/emitente/CNPJ em blocos, cercados de ruído de layout e endereço.
+    `densidade` multiplica o número de blocos (10+ ≈ página real densa, centenas de palavras)."""
+    cnpj = "".join(rng.choice("0123456789") for _ in range(14))
+    linhas = []
+    top = 40
+    for b in range(1, rng.randint(3, 7) * max(1, densidade)):
+        for ln in range(1, rng.randint(2, 6)):
+            escolha = rng.random()
+            if escolha < 0.2: txt = rng.choice(_EMPRESAS)
+            elif escolha < 0.35: txt = f"CNPJ: {cnpj[0:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
+            elif escolha < 0.45: txt = rng.choice(["EMITENTE", "PRESTADOR DE SERVIÇO", "TRANSPORTADOR"])
+            else: txt = rng.choice(_RUIDO)
+            linhas.append(_linha(rng, txt.split(), top, b, 1, ln, x0=rng.choice([60, 100, 900])))
+            top += rng.randint(20, 60)
+    data = {k: [v for l in linhas for v in l[k]] for k in linhas[0]}
+    return data, (cnpj if rng.random() < 0.5 else None)
+
+def carregar(caminhos: List[str]) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    casos = []
+    for c in caminhos:
+        with open(c, encoding="utf-8") as f:
+            v = json.load(f)
+        for item in (v if isinstance(v, list) else [v]):
+            if "data" in item: casos.append((item["data"], item.get("cnpj")))
+            else: casos.append((item, None))
+    return casos
+
+# ===== Execução =====
+def comparar(casos) -> List[str]:
+    divergencias = []
+    linhas = set()
+    for i, (data, cnpj) in enumerate(casos):
+        a, b = _ref_guess_emissor_from_data(data, cnpj), R.guess_emissor_from_data(data, cnpj)
+        if a != b: divergencias.append(f"caso {i}: antes={a!r} agora={b!r}")
+        linhas.update(R.texto_from_data(data).splitlines())
+    linhas.update(_EMPRESAS + _RUIDO)
+    for l in linhas:
+        for ref, novo in ((_ref_is_bad_line, R._is_bad_line), (_ref_looks_like_address, R._looks_like_address),
+                          (_ref_clean_company_line, R._clean_company_line), (_ref_score_company_line, R._score_company_line)):
+            if ref(l) != novo(l): divergencias.append(f"{novo.__name__}({l!r}): antes={ref(l)!r} agora={novo(l)!r}")
+    return divergencias
+
+def medir(fn, casos, repeticoes: int) -> float:
+    tempos = []
+    for _ in range(repeticoes):
+        R._analisar.cache_clear()   # sem cache quente entre repetições
+        t0 = time.perf_counter()
+        for data, cnpj in casos: fn(data, cnpj)
+        tempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tempos)
+
+def main():
+    ap = argparse.ArgumentParser(description="Regressão e benchmark da heurística de emissor")
+    ap.add_argument("ocr_json", nargs="*", help="JSONs com dicts de ocr_data gravados")
+    ap.add_argument("--sinteticos", type=int, default=300)
+    ap.add_argument("--densidade", type=int, default=1, help="Multiplica os blocos por página sintética")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    ap.add_argument("--json", help="Grava o resultado neste arquivo")
+    a = ap.parse_args()
+
+    rng = random.Random(42)
+    casos = carregar(a.ocr_json) + [sintetico(rng, a.densidade) for _ in range(a.sinteticos)]
+    div = comparar(casos)
+    ms_ref, ms_novo = medir(_ref_guess_emissor_from_data, casos, a.repeticoes), medir(R.guess_emissor_from_data, casos, a.repeticoes)
+    res = {"casos": len(casos), "divergencias": len(div), "ms_anterior": round(ms_ref, 1), "ms_atual": round(ms_novo, 1),
+           "us_por_pagina_anterior": round(ms_ref * 1000 / max(1, len(casos)), 1),
+           "us_por_pagina_atual": round(ms_novo * 1000 / max(1, len(casos)), 1)}
+    for d in div[:20]: print("❌", d)
+    print(f"\n{len(casos)} página(s) · divergências: {len(div)}")
+    print(f"anterior: {res['ms_anterior']} ms ({res['us_por_pagina_anterior']} µs/pág) · atual: {res['ms_atual']} ms ({res['us_por_pagina_atual']} µs/pág)")
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if div else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# bench/remetente_retry.py
+# Regressão da política de retry e da ordem por destinatário do Remetente, contra um Client stub (sem rede).
+# Uso: python bench/remetente_retry.py [--destinos 4] [--mensagens 6]
+# Sai com código 1 se alguma verificação falhar.
+import os, sys, time, argparse, threading
+from types import SimpleNamespace
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from requests.exceptions import ConnectionError as ErroConexao, ReadTimeout, ConnectTimeout
+from urllib3.exceptions import MaxRetryError, NewConnectionError, ProtocolError
+from twilio.base.exceptions import TwilioRestException
+from remetente_whatsapp import Remetente
+
+def _http(status: int) -> TwilioRestException:
+    return TwilioRestException(status, "/Messages.json", f"HTTP {status}")
+
+def _sem_conexao() -> ErroConexao:
+    return ErroConexao(MaxRetryError(None, "/Messages.json", NewConnectionError(None, "Connection refused")))
+
+def _derrubada() -> ErroConexao:
+    return ErroConexao(ProtocolError("Connection aborted.", ConnectionResetError(104, "reset")))
+
+class ClienteStub:
+    """messages.create levanta os erros roteirizados para cada body (na ordem) e depois entrega.
+    Registra chamadas, entregas por destinatário e a concorrência máxima por destinatário."""
+
+    def __init__(self, roteiro: Dict[str, List[Exception]]):
+        self.roteiro = {k: list(v) for k, v in roteiro.items()}
+        self.chamadas: Dict[str, int] = {}
+        self.entregues: Dict[str, List[str]] = {}
+        self.ativos: Dict[str, int] = {}
+        self.pico = 0
+        self.lock = threading.Lock()
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, from_: str, to: str, body: str = "", **kw):
+        with self.lock:
+            self.chamadas[body] = self.chamadas.get(body, 0) + 1
+            self.ativos[to] = self.ativos.get(to, 0) + 1
+            self.pico = max(self.pico, self.ativos[to])
+            erros = self.roteiro.get(body)
+            erro = erros.pop(0) if erros else None
+        try:
+            time.sleep(0.002)
+            if erro is not None:
+                raise erro
+            with self.lock:
+                self.entregues.setdefault(to, []).append(body)
+            return SimpleNamespace(sid=f"SM{body}")
+        finally:
+            with self.lock:
+                self.ativos[to] -= 1
+
+# (body, erros roteirizados, chamadas esperadas, deve entregar?) com tentativas=3
+CASOS = [
+    ("ok",           [],                                 1, True),
+    ("429-429-ok",   [_http(429), _http(429)],           3, True),
+    ("503-ok",       [_http(503)],                       2, True),
+    ("503-esgota",   [_http(503)] * 3,                   3, False),
+    ("400",          [_http(400)],                       1, False),
+    ("sem-conexao",  [_sem_conexao()],                   2, True),
+    ("connect-to",   [ConnectTimeout("connect timeout")], 2, True),
+    ("read-timeout", [ReadTimeout("read timeout")],      1, False),
+    ("derrubada",    [_derrubada()],                     1, False),
+    ("oserror",      [OSError("broken pipe")],           1, False),
+]
+
+def verificar_retries() -> List[str]:
+    stub = ClienteStub({body: erros for body, erros, _, _ in CASOS})
+    rem = Remetente(max_paralelo=len(CASOS), por_seg=0, tentativas=3, cliente=stub)
+    futs = {body: rem.enviar("whatsapp:+1", f"whatsapp:+55{k}", body) for k, (body, _, _, _) in enumerate(CASOS)}
+    falhas = []
+    for body, _, esperado, entrega in CASOS:
+        try:
+            futs[body].result(timeout=30); entregou = True
+        except Exception:
+            entregou = False
+        n = stub.chamadas.get(body, 0)
+        ok = n == esperado and entregou == entrega
+        print(f"{'✅' if ok else '❌'} {body:<14} chamadas {n} (esperado {esperado}) · entregue {entregou}")
+        if not ok:
+            falhas.append(body)
+    return falhas
+
+def verificar_ordem(destinos: int, mensagens: int) -> List[str]:
+    # erros transitórios espalhados: a mensagem seguinte do mesmo destinatário tem de esperar o retry
+    roteiro = {f"{d}:{m}": [_http(429)] if (d + m) % 3 == 0 else [] for d in range(destinos) for m in range(mensagens)}
+    stub = ClienteStub(roteiro)
+    rem = Remetente(max_paralelo=destinos * 2, por_seg=0, tentativas=3, cliente=stub)
+    futs = [rem.enviar("whatsapp:+1", f"whatsapp:+55{d}", f"{d}:{m}") for m in range(mensagens) for d in range(destinos)]
+    for f in futs:
+        f.result(timeout=60)
+    falhas = []
+    for d in range(destinos):
+        esperado = [f"{d}:{m}" for m in range(mensagens)]
+        if stub.entregues.get(f"whatsapp:+55{d}") != esperado:
+            falhas.append(f"ordem do destinatário {d}: {stub.entregues.get(f'whatsapp:+55{d}')}")
+    if stub.pico > 1:
+        falhas.append(f"{stub.pico} envios simultâneos para o mesmo destinatário")
+    print(f"{'✅' if not falhas else '❌'} ordem por destinatário ({destinos}×{mensagens}, pico {stub.pico}) · {rem.stats()}")
+    return falhas
+
+def main():
+    ap = argparse.ArgumentParser(description="Regressão do retry/ordem do remetente WhatsApp")
+    ap.add_argument("--destinos", type=int, default=4)
+    ap.add_argument("--mensagens", type=int, default=6)
+    a = ap.parse_args()
+    falhas = verificar_retries() + verificar_ordem(a.destinos, a.mensagens)
+    for f in falhas:
+        print(f"⚠️ {f}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
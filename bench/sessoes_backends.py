@@ -0,0 +1,129 @@
+# bench/sessoes_backends.py
+# Regressão do contrato dos backends de sessão (anexar, retirar, limpar, TTL, anexos concorrentes):
+# memória, SQLite em arquivo temporário e Redis com um cliente injetado — o stand-in em memória abaixo,
+# o fakeredis se estiver instalado, ou um Redis de verdade com --redis.
+# Uso: python bench/sessoes_backends.py [--redis redis://localhost:6379/15] [--ttl 2]
+# Sai com código 1 se algum backend divergir.
+import os, sys, time, argparse, tempfile, threading
+from typing import Any, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sessoes import SessoesMemoria, SessoesSQLite, SessoesRedis
+
+# ===== Stand-in do Redis =====
+class RedisMemoria:
+    """Só o que o SessoesRedis usa: listas com expiração, DEL e pipeline transacional (MULTI/EXEC)."""
+
+    def __init__(self):
+        self._d: Dict[str, Tuple[List[bytes], float]] = {}
+        self._lock = threading.RLock()   # a pipeline segura o lock e chama os comandos
+
+    def _lista(self, k: str) -> List[bytes]:
+        v = self._d.get(k)
+        if v and v[1] and v[1] <= time.time():
+            self._d.pop(k, None)
+            v = None
+        return v[0] if v else []
+
+    def rpush(self, k: str, *vals) -> int:
+        with self._lock:
+            lst = self._lista(k) + [v.encode() if isinstance(v, str) else v for v in vals]
+            self._d[k] = (lst, self._d.get(k, (None, 0.0))[1])
+            return len(lst)
+
+    def expire(self, k: str, seg: int) -> bool:
+        with self._lock:
+            if not self._lista(k):
+                return False
+            self._d[k] = (self._d[k][0], time.time() + int(seg))
+            return True
+
+    def llen(self, k: str) -> int:
+        with self._lock:
+            return len(self._lista(k))
+
+    def lrange(self, k: str, ini: int, fim: int) -> List[bytes]:
+        with self._lock:
+            lst = self._lista(k)
+            return lst[ini:(None if fim == -1 else fim + 1)]
+
+    def delete(self, *ks: str) -> int:
+        with self._lock:
+            return sum(1 for k in ks if self._lista(k) and self._d.pop(k, None))
+
+    def pipeline(self, transaction: bool = True) -> "_Pipeline":
+        return _Pipeline(self)
+
+class _Pipeline:
+    def __init__(self, r: RedisMemoria):
+        self.r, self.cmds = r, []
+
+    def __getattr__(self, nome: str):
+        return lambda *a: self.cmds.append((nome, a))
+
+    def execute(self) -> List[Any]:
+        with self.r._lock:   # MULTI/EXEC: nenhum outro comando entre os enfileirados
+            return [getattr(RedisMemoria, nome)(self.r, *a) for nome, a in self.cmds]
+
+# ===== Contrato =====
+def verificar(backend, ttl: int, origem: str = "") -> List[str]:
+    falhas = []
+    def checa(desc: str, obtido, esperado):
+        if obtido != esperado:
+            falhas.append(f"{backend.nome}: {desc} — obtido {obtido!r}, esperado {esperado!r}")
+
+    checa("anexar 2", backend.anexar_pendentes("5511", [{"url": "a"}, {"url": "b"}]), 2)
+    checa("anexar +1", backend.anexar_pendentes("5511", [{"url": "c"}]), 3)
+    checa("outro número isolado", backend.retirar_pendentes("5522"), [])
+    checa("retirar na ordem", backend.retirar_pendentes("5511"), [{"url": "a"}, {"url": "b"}, {"url": "c"}])
+    checa("retirar esvazia", backend.retirar_pendentes("5511"), [])
+    checa("anexar vazio", backend.anexar_pendentes("5533", []), 0)
+    backend.anexar_pendentes("5544", ["x"])
+    backend.limpar("5544")
+    checa("limpar", backend.retirar_pendentes("5544"), [])
+
+    threads = [threading.Thread(target=backend.anexar_pendentes, args=("5555", [f"{t}:{i}" for i in range(5)]))
+               for t in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    itens = backend.retirar_pendentes("5555")
+    checa("anexos concorrentes (total)", len(itens), 40)
+    checa("anexos concorrentes (ordem por lote)", all(itens.index(f"{t}:{i}") < itens.index(f"{t}:{i+1}")
+                                                      for t in range(8) for i in range(4)) if len(itens) == 40 else False, True)
+
+    # TTL: cada anexo renova o prazo; sem anexo por mais que o TTL a sessão some
+    backend.anexar_pendentes("5566", ["vence"])
+    backend.anexar_pendentes("5577", ["1"])
+    time.sleep(ttl * 0.6)
+    backend.anexar_pendentes("5577", ["2"])
+    time.sleep(ttl * 0.6)
+    checa("TTL renovado pelo anexo", backend.retirar_pendentes("5577"), ["1", "2"])
+    time.sleep(ttl * 0.3)
+    checa("TTL vencido", backend.retirar_pendentes("5566"), [])
+    print(f"{'✅' if not falhas else '❌'} {backend.nome:<8} {origem}")
+    return falhas
+
+def main():
+    ap = argparse.ArgumentParser(description="Regressão dos backends de sessão")
+    ap.add_argument("--redis", help="URL de um Redis de verdade (use um DB descartável)")
+    ap.add_argument("--ttl", type=int, default=2, help="TTL das sessões no teste (s, inteiro — EXPIRE do Redis)")
+    a = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backends = [(SessoesMemoria(ttl=a.ttl), ""),
+                    (SessoesSQLite(os.path.join(tmp, "sessoes.sqlite"), ttl=a.ttl), ""),
+                    (SessoesRedis(ttl=a.ttl, cliente=RedisMemoria()), "stand-in em memória")]
+        try:
+            import fakeredis
+            backends.append((SessoesRedis(ttl=a.ttl, cliente=fakeredis.FakeRedis()), "fakeredis"))
+        except ImportError:
+            print("ℹ️ fakeredis não instalado — Redis só com o stand-in")
+        if a.redis:
+            backends.append((SessoesRedis(a.redis, ttl=a.ttl, prefixo=f"bench:sess:{os.getpid()}:"), a.redis))
+        falhas = [f for b, origem in backends for f in verificar(b, a.ttl, origem)]
+    for f in falhas:
+        print(f"⚠️ {f}")
+    sys.exit(1 if falhas else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# bench/split_pdf.py
+# Compara os perfis de gravação do split (fast x compact): tempo por página e tamanho das saídas.
+# Uso: python bench/split_pdf.py entrada.pdf [--repeticoes 3] [--json saida.json]
+import os, sys, json, argparse, tempfile, statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fitz  # PyMuPDF
+from renomear_cte_mesma_pasta import salvar_pagina, SPLIT_PERFIS
+
+def medir(caminho: str, perfil: str, repeticoes: int):
+    doc = fitz.open(caminho)
+    tempos, tamanho = [], 0
+    try:
+        for _ in range(repeticoes):
+            with tempfile.TemporaryDirectory() as tmp:
+                destinos = [(i, os.path.join(tmp, f"p{i+1}.pdf")) for i in range(doc.page_count)]
+                ms, erros = 0.0, 0
+                for i, destino in destinos:
+                    try: ms += salvar_pagina(doc, i, destino, perfil)
+                    except Exception: erros += 1
+                if erros:
+                    print(f"⚠️ {perfil}: {erros} página(s) com erro")
+                tempos.append(ms)
+                tamanho = sum(os.path.getsize(d) for _, d in destinos if os.path.exists(d))
+        paginas = doc.page_count
+    finally:
+        doc.close()
+    med = statistics.median(tempos)
+    return {
+        "perfil": perfil,
+        "paginas": paginas,
+        "ms_total_mediana": round(med, 1),
+        "ms_por_pagina": round(med / max(1, paginas), 2),
+        "bytes_saida": tamanho,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark dos perfis de split de PDF")
+    ap.add_argument("pdf")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--json", help="Grava o resultado neste arquivo")
+    a = ap.parse_args()
+
+    resultados = [medir(a.pdf, perfil, a.repeticoes) for perfil in SPLIT_PERFIS]
+    print(f"\n{'perfil':<10}{'páginas':>9}{'ms total':>12}{'ms/pág':>10}{'KiB':>10}")
+    for r in resultados:
+        print(f"{r['perfil']:<10}{r['paginas']:>9}{r['ms_total_mediana']:>12}{r['ms_por_pagina']:>10}{r['bytes_saida']/1024:>10.0f}")
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump({"entrada": os.path.abspath(a.pdf), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# bench/startup.py
+# Tempo de partida: importa cada módulo num interpretador novo (como um worker do gunicorn ou do pool faria)
+# e mede o import, quais libs pesadas já vieram junto e o custo de aquecer() depois.
+# Uso: python bench/startup.py [--modulos renomear_cte_mesma_pasta server] [--repeticoes 10] [--rev HEAD~1] [--json saida.json]
+#   --rev mede também uma revisão do git (extraída com `git archive`) para comparar antes x depois.
+import os, sys, json, argparse, tempfile, subprocess, statistics
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PESADAS = ("fitz", "numpy", "PIL.Image", "pyzbar.pyzbar", "pytesseract", "tesserocr")
+
+_SONDA = r"""
+import sys, time, json
+t0 = time.perf_counter()
+import {mod} as m
+t1 = time.perf_counter()
+r = {{"import_ms": (t1 - t0) * 1000, "pesadas": [k for k in {pesadas!r} if k in sys.modules]}}
+if {aquecer} and hasattr(m, "aquecer"):
+    m.aquecer()
+    r["aquecer_ms"] = (time.perf_counter() - t1) * 1000
+print("@@" + json.dumps(r))
+"""
+
+def _uma(codigo: str, cwd: str, pythonpath: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=pythonpath + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    p = subprocess.run([sys.executable, "-c", codigo], cwd=cwd, env=env, capture_output=True, text=True, timeout=120)
+    for ln in p.stdout.splitlines():
+        if ln.startswith("@@"):
+            return json.loads(ln[2:])
+    raise RuntimeError((p.stderr or p.stdout).strip().splitlines()[-1] if (p.stderr or p.stdout) else f"código {p.returncode}")
+
+def medir(mod: str, fonte: str, repeticoes: int) -> dict:
+    imports, aquecer, pesadas = [], [], []
+    with tempfile.TemporaryDirectory() as cwd:   # o código antigo criava pastas no cwd
+        for k in range(repeticoes):
+            r = _uma(_SONDA.format(mod=mod, pesadas=PESADAS, aquecer=(k == 0)), cwd, fonte)
+            imports.append(r["import_ms"])
+            if "aquecer_ms" in r: aquecer.append(r["aquecer_ms"])
+            pesadas = r["pesadas"]
+    return {"modulo": mod, "import_ms_mediana": round(statistics.median(imports), 1),
+            "import_ms_min": round(min(imports), 1), "pesadas_no_import": pesadas,
+            "aquecer_ms": round(aquecer[0], 1) if aquecer else None}
+
+def _extrair_rev(rev: str, destino: str):
+    arq = subprocess.run(["git", "-C", RAIZ, "archive", rev], capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", destino], input=arq, check=True)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de tempo de partida (import) dos módulos")
+    ap.add_argument("--modulos", nargs="+", default=["renomear_cte_mesma_pasta"])
+    ap.add_argument("--repeticoes", type=int, default=10)
+    ap.add_argument("--rev", help="Revisão do git para comparar (ex.: HEAD~1)")
+    ap.add_argument("--json", help="Grava o resultado neste arquivo")
+    a = ap.parse_args()
+
+    fontes = {"atual": RAIZ}
+    tmp = tempfile.TemporaryDirectory() if a.rev else None
+    if tmp:
+        _extrair_rev(a.rev, tmp.name)
+        fontes[a.rev] = tmp.name
+    resultados = []
+    try:
+        for rotulo, fonte in fontes.items():
+            for mod in a.modulos:
+                try:
+                    r = medir(mod, fonte, a.repeticoes)
+                except Exception as e:
+                    print(f"⚠️ {rotulo}/{mod}: {e}")
+                    continue
+                r["versao"] = rotulo
+                resultados.append(r)
+    finally:
+        if tmp: tmp.cleanup()
+
+    print(f"\n{'versão':<12}{'módulo':<28}{'import ms':>11}{'mín':>8}{'aquecer ms':>12}  libs pesadas no import")
+    for r in resultados:
+        aq = "-" if r["aquecer_ms"] is None else r["aquecer_ms"]
+        print(f"{r['versao']:<12}{r['modulo']:<28}{r['import_ms_mediana']:>11}{r['import_ms_min']:>8}{aq:>12}  "
+              f"{', '.join(r['pesadas_no_import']) or '-'}")
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump({"repeticoes": a.repeticoes, "resultados": resultados}, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
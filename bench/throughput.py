@@ -0,0 +1,294 @@
+# bench/throughput.py
+# Vazão do motor inteiro sobre um corpus sintético e determinístico de DACTEs gerado com PyMuPDF:
+# páginas digitais (camada de texto), scans em vários DPIs com QR da chave, scans tortos/ruidosos e
+# arquivos com várias páginas. Mede por página (extrair_meta_pagina, com tempo por etapa via metricas)
+# e ponta a ponta (processar_arquivos com o pool), e confere o que foi extraído contra o gabarito.
+# Uso: python bench/throughput.py [--arquivos 20] [--seed 7] [--dpis 150,200,300] [--workers 4] [--repeticoes 3]
+#                                 [--corpus pasta] [--sem-canon] [--json saida.json] [--comparar anterior.json]
+# O QR é gerado com segno ou qrcode (o que estiver instalado); sem nenhum dos dois os scans saem sem QR.
+import os, io, sys, json, time, random, resource, argparse, tempfile, subprocess, statistics
+from typing import Optional, Dict, Any, List, Tuple
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+import fitz  # PyMuPDF
+import numpy as np
+from PIL import Image
+
+# emissores do corpus (os dois layouts de MODELOS) → CNPJ usado nas chaves
+EMISSORES = {
+    "WANDER_PEREIRA_DE_MATOS":           "20263922000107",
+    "WASHINGTON_BALTAZAR_SOUZA_LIMA_ME": "12512889000154",
+}
+TIPOS = (("digital", 0.35), ("scan", 0.45), ("torto", 0.20))   # peso de cada tipo de página
+
+# ===== QR (opcional) =====
+def _gerador_qr():
+    try:
+        import segno
+        def _png(payload: str) -> bytes:
+            buf = io.BytesIO(); segno.make(payload, error="m").save(buf, kind="png", scale=6, border=4)
+            return buf.getvalue()
+        return "segno", _png
+    except ImportError:
+        pass
+    try:
+        import qrcode
+        def _png(payload: str) -> bytes:
+            buf = io.BytesIO(); qrcode.make(payload, box_size=6, border=4).save(buf, format="PNG")
+            return buf.getvalue()
+        return "qrcode", _png
+    except ImportError:
+        return None, None
+
+# ===== Corpus =====
+def _chave(rng: random.Random, cnpj: str, numero: int) -> str:
+    base = f"29{rng.randint(20, 25):02d}{rng.randint(1, 12):02d}{cnpj}57001{numero:09d}1{rng.randint(0, 10**8 - 1):08d}"
+    soma = sum(int(d) * (2 + k % 8) for k, d in enumerate(reversed(base)))
+    resto = soma % 11
+    return base + str(0 if resto < 2 else 11 - resto)
+
+def _pagina_digital(doc: fitz.Document, caso: Dict[str, Any], qr_png) -> fitz.Page:
+    """DACTE com camada de texto no formato que os regex de MODELOS esperam + QR no canto superior direito."""
+    p = doc.new_page(width=595, height=842)
+    cnpj = caso["cnpj"]
+    cnpj_fmt = f"{cnpj[0:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
+    grupos = " ".join(caso["chave"][i:i + 4] for i in range(0, 44, 4))
+    if caso["emissor"] == "WANDER_PEREIRA_DE_MATOS":
+        cab = f"DACTE\nDOCUMENTO AUXILIAR DO CONHECIMENTO DE TRANSPORTE ELETRONICO\nWANDER PEREIRA DE MATOS  CNPJ: {cnpj_fmt}  IE: 123456\nMODELO 57  SERIE 1 {caso['numero']}"
+    else:
+        cab = f"DACTE\nWASHINGTON BALTAZAR SOUZA LIMA ME\nCNPJ: {cnpj_fmt}\nNUMERO {caso['numero']}  SERIE 1"
+    p.insert_textbox(fitz.Rect(36, 36, 380, 160), cab, fontsize=9, fontname="helv")
+    p.insert_textbox(fitz.Rect(36, 170, 560, 200), f"CHAVE DE ACESSO\n{grupos}", fontsize=9, fontname="helv")
+    rng = random.Random(caso["numero"])
+    y = 220
+    for rotulo in ("REMETENTE", "DESTINATARIO", "EXPEDIDOR", "RECEBEDOR", "TOMADOR DO SERVICO"):
+        p.insert_textbox(fitz.Rect(36, y, 560, y + 40),
+                         f"{rotulo}: EMPRESA {rng.randint(100, 999)} LTDA\nRUA {rng.randint(1, 99)} NUMERO {rng.randint(1, 999)} CEP 40000-000",
+                         fontsize=8, fontname="helv")
+        y += 48
+    if qr_png:
+        url = f"https://dfe-portal.svrs.rs.gov.br/cte/qrCode?chCTe={caso['chave']}&tpAmb=1"
+        p.insert_image(fitz.Rect(440, 36, 560, 156), stream=qr_png(url))
+    return p
+
+def _como_scan(doc_saida: fitz.Document, pagina: fitz.Page, dpi: int, torto: bool, rng: random.Random):
+    """Rasteriza a página e a reinsere só como imagem (JPEG), opcionalmente girada e com ruído."""
+    pix = pagina.get_pixmap(matrix=fitz.Matrix(dpi / 72.0, dpi / 72.0), colorspace=fitz.csGRAY, alpha=False)
+    img = Image.frombytes("L", (pix.width, pix.height), pix.samples)
+    if torto:
+        img = img.rotate(rng.uniform(-2.0, 2.0), resample=Image.BILINEAR, fillcolor=255)
+        a = np.asarray(img, dtype=np.int16)
+        ruido = np.random.default_rng(rng.randint(0, 2**31)).normal(0, 18, a.shape)
+        img = Image.fromarray(np.clip(a + ruido, 0, 255).astype(np.uint8))
+    buf = io.BytesIO(); img.save(buf, format="JPEG", quality=80, dpi=(dpi, dpi))
+    nova = doc_saida.new_page(width=pagina.rect.width, height=pagina.rect.height)
+    nova.insert_image(nova.rect, stream=buf.getvalue())
+
+def gerar_corpus(pasta: str, arquivos: int, seed: int, dpis: List[int]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Gera `arquivos` PDFs (1–4 páginas) em `pasta`. Retorna (gabarito por página, gerador de QR usado)."""
+    rng = random.Random(seed)
+    nome_qr, qr_png = _gerador_qr()
+    gabarito: List[Dict[str, Any]] = []
+    numero = 1000 + rng.randint(0, 5000)
+    for k in range(arquivos):
+        caminho = os.path.join(pasta, f"dacte_{k+1:03d}.pdf")
+        saida, rascunho = fitz.open(), fitz.open()
+        for pg in range(rng.choice((1, 1, 1, 2, 3, 4))):
+            numero += rng.randint(1, 7)
+            emissor = rng.choice(sorted(EMISSORES))
+            tipo = rng.choices([t for t, _ in TIPOS], [w for _, w in TIPOS])[0]
+            dpi = rng.choice(dpis) if tipo == "scan" else max(dpis) if tipo == "torto" else None
+            caso = {"arquivo": caminho, "pagina": pg + 1, "tipo": tipo if dpi is None else f"{tipo}@{dpi}",
+                    "emissor": emissor, "cnpj": EMISSORES[emissor], "numero": numero}
+            caso["chave"] = _chave(rng, caso["cnpj"], numero)
+            p = _pagina_digital(rascunho if dpi else saida, caso, qr_png)
+            if dpi:
+                _como_scan(saida, p, dpi, tipo == "torto", rng)
+            gabarito.append(caso)
+        saida.save(caminho, garbage=1, deflate=True)
+        saida.close(); rascunho.close()
+    return gabarito, nome_qr
+
+# ===== Medição =====
+def _pct(v: List[float], q: float) -> float:
+    v = sorted(v)
+    return round(v[min(len(v) - 1, int(len(v) * q))], 1) if v else 0.0
+
+def _confere(caso: Dict[str, Any], meta) -> Dict[str, bool]:
+    if meta is None:
+        return {"numero": False, "emissor": False, "cte_ok": False}
+    return {"numero": meta.numero == str(caso["numero"]), "emissor": meta.emissor == caso["emissor"],
+            "cte_ok": meta.tipo == "CTE" and meta.numero not in ("", "000") and meta.emissor != "EMISSOR_DESCONHECIDO"}
+
+def _acuracia(conferencias: List[Tuple[str, Dict[str, bool]]]) -> Dict[str, Any]:
+    por_tipo: Dict[str, List[Dict[str, bool]]] = {}
+    for tipo, c in conferencias:
+        por_tipo.setdefault(tipo.split("@")[0] if tipo.startswith("torto") else tipo, []).append(c)
+    fr = lambda cs, k: round(sum(c[k] for c in cs) / len(cs), 4) if cs else 0.0
+    todos = [c for _, c in conferencias]
+    return {"numero": fr(todos, "numero"), "emissor": fr(todos, "emissor"), "cte_ok": fr(todos, "cte_ok"),
+            "por_tipo": {t: {"paginas": len(cs), "numero": fr(cs, "numero"), "emissor": fr(cs, "emissor")}
+                         for t, cs in sorted(por_tipo.items())}}
+
+def medir_etapas(proc, metricas, gabarito: List[Dict[str, Any]], opts) -> Dict[str, Any]:
+    """Uma página por vez no processo atual: latência por página e tempo por etapa."""
+    lat: Dict[str, List[float]] = {}
+    conferencias = []
+    docs: Dict[str, fitz.Document] = {}
+    with metricas.coletando() as col:
+        for caso in gabarito:
+            doc = docs.get(caso["arquivo"]) or docs.setdefault(caso["arquivo"], fitz.open(caso["arquivo"]))
+            t0 = time.perf_counter()
+            try:
+                meta = proc.extrair_meta_pagina(doc.load_page(caso["pagina"] - 1), opts)
+            except Exception as e:
+                print(f"⚠️ {os.path.basename(caso['arquivo'])} p{caso['pagina']}: {e}")
+                meta = None
+            lat.setdefault(caso["tipo"], []).append((time.perf_counter() - t0) * 1000)
+            conferencias.append((caso["tipo"], _confere(caso, meta)))
+    for d in docs.values(): d.close()
+    todas = [x for v in lat.values() for x in v]
+    return {"paginas": len(todas), "ms_p50": _pct(todas, 0.5), "ms_p95": _pct(todas, 0.95),
+            "ms_medio": round(statistics.mean(todas), 1) if todas else 0.0,
+            "por_tipo": {t: {"paginas": len(v), "ms_p50": _pct(v, 0.5), "ms_p95": _pct(v, 0.95)} for t, v in sorted(lat.items())},
+            "etapas_ms": {k: v["ms"] for k, v in sorted(col.resumo().items(), key=lambda kv: -kv[1]["ms"])},
+            "acuracia": _acuracia(conferencias)}
+
+def medir_ponta_a_ponta(proc, gabarito: List[Dict[str, Any]], opts, repeticoes: int) -> Dict[str, Any]:
+    """processar_arquivos sobre o corpus inteiro (pool de páginas, gravação, cache/catálogo desligados)."""
+    arquivos = sorted({c["arquivo"] for c in gabarito})
+    por_pagina = {(c["arquivo"], c["pagina"]): c for c in gabarito}
+    tempos, entregas, conferencias = [], [], []
+    for k in range(repeticoes):
+        resultados = []
+        t0 = time.perf_counter()
+        marcas: List[float] = []
+        def _on_pagina(r):
+            marcas.append((time.perf_counter() - t0) * 1000); resultados.append(r)
+        proc.processar_arquivos(arquivos, opts, on_pagina=_on_pagina)
+        tempos.append(time.perf_counter() - t0)
+        entregas.append(marcas)
+        if k == 0:
+            conferencias = [(por_pagina[(r.arquivo, r.pagina)]["tipo"], _confere(por_pagina[(r.arquivo, r.pagina)], r.meta))
+                            for r in resultados if (r.arquivo, r.pagina) in por_pagina]
+    med = statistics.median(tempos)
+    intervalos = [b - a for m in entregas for a, b in zip([0.0] + m, m)]
+    return {"arquivos": len(arquivos), "paginas": len(gabarito), "s_mediana": round(med, 3),
+            "paginas_por_s": round(len(gabarito) / med, 2) if med else 0.0,
+            "ms_entre_paginas_p50": _pct(intervalos, 0.5), "ms_entre_paginas_p95": _pct(intervalos, 0.95),
+            "acuracia": _acuracia(conferencias)}
+
+def _vmhwm_mib(pid: int) -> float:
+    """Pico de RSS (VmHWM) de um processo vivo; 0 fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for ln in f:
+                if ln.startswith("VmHWM:"):
+                    return round(int(ln.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return 0.0
+
+def _encerrar_pool(proc) -> float:
+    """Fecha o pool de páginas e devolve o maior pico de RSS entre os workers (lido antes de saírem —
+    o ru_maxrss de RUSAGE_CHILDREN herda o RSS do pai no fork que precede o exec do spawn)."""
+    if proc._POOL is None:
+        return 0.0
+    pico = max([_vmhwm_mib(pid) for pid in list(proc._POOL._processes or {})] or [0.0])
+    proc._POOL.shutdown(wait=True)
+    proc._POOL = None
+    return pico
+
+def _rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "-C", RAIZ, "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def _comparar(atual: Dict[str, Any], caminho: str):
+    with open(caminho, encoding="utf-8") as f:
+        antes = json.load(f)
+    print(f"\ncomparação com {caminho} (rev {antes['config'].get('rev')}):")
+    for secao, chave in (("ponta_a_ponta", "paginas_por_s"), ("etapas", "ms_p50"), ("etapas", "ms_p95"),
+                         ("ponta_a_ponta", "acuracia.numero"), ("etapas", "acuracia.numero")):
+        a, b = antes.get(secao) or {}, atual.get(secao) or {}
+        for parte in chave.split("."):
+            a, b = (a or {}).get(parte), (b or {}).get(parte)
+        if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+            delta = f"{(b - a) / a:+.1%}" if a else "-"
+            print(f"  {secao}.{chave:<22}{a:>10} → {b:<10} {delta}")
+
+# ===== CLI =====
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark de vazão do processamento sobre DACTEs sintéticos")
+    ap.add_argument("--arquivos", type=int, default=20)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--dpis", default="150,200,300", help="DPIs dos scans sintéticos")
+    ap.add_argument("--workers", type=int, default=None, help="PDF_WORKERS do ponta a ponta (padrão: o do ambiente)")
+    ap.add_argument("--repeticoes", type=int, default=3)
+    ap.add_argument("--corpus", help="Gera/mantém o corpus nesta pasta (padrão: temporária)")
+    ap.add_argument("--sem-canon", action="store_true", help="Não mapeia os CNPJs do corpus (nome só por texto/OCR)")
+    ap.add_argument("--so-etapas", action="store_true", help="Pula o ponta a ponta")
+    ap.add_argument("--json", help="Grava o resultado neste arquivo")
+    ap.add_argument("--comparar", help="JSON de uma rodada anterior para mostrar a diferença")
+    a = ap.parse_args()
+
+    # antes do import: o módulo lê a config do ambiente (e os workers do pool herdam)
+    os.environ["CACHE_ENABLED"] = "false"
+    os.environ["CATALOGO_ENABLED"] = "false"
+    if a.workers:
+        os.environ["PDF_WORKERS"] = str(a.workers)
+    if not a.sem_canon:
+        os.environ["CNPJ_CANON_JSON"] = json.dumps({v: k for k, v in EMISSORES.items()})
+    import renomear_cte_mesma_pasta as proc
+    import metricas
+
+    dpis = [int(x) for x in a.dpis.split(",") if x.strip()]
+    tmp = tempfile.TemporaryDirectory()
+    pasta = a.corpus or os.path.join(tmp.name, "corpus")
+    os.makedirs(pasta, exist_ok=True)
+    try:
+        gabarito, nome_qr = gerar_corpus(pasta, a.arquivos, a.seed, dpis)
+        if not nome_qr:
+            print("⚠️ segno/qrcode não instalados: scans sem QR (só OCR resolve)")
+        opts = proc.opcoes_padrao(pasta_saida=os.path.join(tmp.name, "saida"),
+                                  pasta_pendentes=os.path.join(tmp.name, "pendentes"))
+        opts = proc.replace(opts, disposition="keep", overwrite="replace")
+        proc.aquecer()
+
+        etapas = medir_etapas(proc, metricas, gabarito, opts)
+        ponta = None if a.so_etapas else medir_ponta_a_ponta(proc, gabarito, opts, max(1, a.repeticoes))
+        rss_workers = _encerrar_pool(proc)
+    finally:
+        tmp.cleanup()
+
+    res = {"config": {"rev": _rev(), "seed": a.seed, "arquivos": a.arquivos, "paginas": len(gabarito), "dpis": dpis,
+                      "workers": proc.PDF_WORKERS, "qr_gerador": nome_qr, "canon": not a.sem_canon,
+                      "ocr_backend": proc.OCR_BACKEND, "pre_backend": proc.PRE_BACKEND},
+           "etapas": etapas, "ponta_a_ponta": ponta,
+           "rss_pico_mib": {"processo": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),  # KiB no Linux
+                            "maior_worker": rss_workers}}
+
+    print(f"\ncorpus: {a.arquivos} arquivo(s), {len(gabarito)} página(s), seed={a.seed}, QR={nome_qr or '-'}")
+    print(f"\n{'tipo':<12}{'páginas':>9}{'p50 ms':>10}{'p95 ms':>10}")
+    for t, v in etapas["por_tipo"].items():
+        print(f"{t:<12}{v['paginas']:>9}{v['ms_p50']:>10}{v['ms_p95']:>10}")
+    print(f"{'(todas)':<12}{etapas['paginas']:>9}{etapas['ms_p50']:>10}{etapas['ms_p95']:>10}")
+    print("\netapas (ms somados): " + " · ".join(f"{k} {v:.0f}" for k, v in etapas["etapas_ms"].items()))
+    ac = etapas["acuracia"]
+    print(f"acurácia por página: número {ac['numero']:.1%} · emissor {ac['emissor']:.1%} · CTE ok {ac['cte_ok']:.1%}")
+    if ponta:
+        print(f"\nponta a ponta ({proc.PDF_WORKERS} worker(s)): {ponta['paginas_por_s']} pág/s "
+              f"(mediana {ponta['s_mediana']}s em {a.repeticoes}x) · entre páginas p50 {ponta['ms_entre_paginas_p50']} ms "
+              f"p95 {ponta['ms_entre_paginas_p95']} ms · número {ponta['acuracia']['numero']:.1%}")
+    print(f"RSS pico: {res['rss_pico_mib']['processo']} MiB (processo), {res['rss_pico_mib']['maior_worker']} MiB (maior worker)")
+    if a.comparar:
+        _comparar(res, a.comparar)
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump(res, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# cache_resultados.py
+# Cache persistente (SQLite) de resultados por hash de conteúdo: PDFs reenviados não são reprocessados.
+import os, json, time, sqlite3, hashlib, threading
+from typing import Optional, Dict, Any
+import metricas
+
+def _default_db() -> str:
+    v = os.getenv("CACHE_DB")
+    if v:
+        return v
+    base = "/data" if os.path.isdir("/data") else os.getcwd()
+    return os.path.join(base, "cache_cte.sqlite")
+
+CACHE_DB          = _default_db()
+CACHE_ENABLED     = (os.getenv("CACHE_ENABLED", "true").lower() == "true")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+CACHE_MAX_MB      = float(os.getenv("CACHE_MAX_MB", "64"))
+CACHE_TTL_DAYS    = float(os.getenv("CACHE_TTL_DAYS", "30"))
+_EVICT_EVERY      = 200   # gravações entre duas faxinas
+
+_LOCK = threading.Lock()
+_STATS = {"hits_arquivo": 0, "hits_pagina": 0, "misses_arquivo": 0, "misses_pagina": 0, "gravacoes": 0, "removidos": 0}
+_schema_ok = False
+
+def _conn() -> sqlite3.Connection:
+    global _schema_ok
+    c = sqlite3.connect(CACHE_DB, timeout=10)
+    if not _schema_ok:
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("""CREATE TABLE IF NOT EXISTS resultados (
+                        chave   TEXT PRIMARY KEY,
+                        valor   TEXT NOT NULL,
+                        tamanho INTEGER NOT NULL,
+                        criado  REAL NOT NULL,
+                        usado   REAL NOT NULL)""")
+        c.execute("CREATE INDEX IF NOT EXISTS ix_resultados_usado ON resultados(usado)")
+        c.commit()
+        _schema_ok = True
+    return c
+
+def _conta(nome: str, n: int = 1):
+    with _LOCK:
+        _STATS[nome] = _STATS.get(nome, 0) + n
+
+def sha256_arquivo(caminho: str) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+def _chave(escopo: str, digest: str, modo: str) -> str:
+    return f"{escopo}:{digest}:{modo}"
+
+def obter(escopo: str, digest: str, modo: str) -> Optional[Any]:
+    """escopo: 'arquivo' | 'pagina'. Retorna o valor gravado ou None (e conta hit/miss)."""
+    if not CACHE_ENABLED:
+        return None
+    k = _chave(escopo, digest, modo)
+    try:
+        c = _conn()
+        try:
+            row = c.execute("SELECT valor, criado FROM resultados WHERE chave=?", (k,)).fetchone()
+            if row and (time.time() - row[1]) <= CACHE_TTL_DAYS * 86400:
+                c.execute("UPDATE resultados SET usado=? WHERE chave=?", (time.time(), k))
+                c.commit()
+                _conta(f"hits_{escopo}")
+                metricas.contar("cache_consultas_total", escopo=escopo, resultado="hit")
+                return json.loads(row[0])
+        finally:
+            c.close()
+    except Exception as e:
+        print(f"⚠️ Cache indisponível (leitura): {e}")
+    _conta(f"misses_{escopo}")
+    metricas.contar("cache_consultas_total", escopo=escopo, resultado="miss")
+    return None
+
+def gravar(escopo: str, digest: str, modo: str, valor: Any):
+    if not CACHE_ENABLED:
+        return
+    txt = json.dumps(valor, ensure_ascii=False)
+    agora = time.time()
+    try:
+        c = _conn()
+        try:
+            c.execute("INSERT OR REPLACE INTO resultados (chave, valor, tamanho, criado, usado) VALUES (?,?,?,?,?)",
+                      (_chave(escopo, digest, modo), txt, len(txt), agora, agora))
+            c.commit()
+        finally:
+            c.close()
+    except Exception as e:
+        print(f"⚠️ Cache indisponível (gravação): {e}")
+        return
+    _conta("gravacoes")
+    metricas.contar("cache_gravacoes_total", escopo=escopo)
+    if _STATS["gravacoes"] % _EVICT_EVERY == 0:
+        expurgar()
+
+def expurgar() -> int:
+    """Remove entradas vencidas (CACHE_TTL_DAYS) e, se passar dos limites, as menos usadas recentemente."""
+    removidos = 0
+    try:
+        c = _conn()
+        try:
+            cur = c.execute("DELETE FROM resultados WHERE criado < ?", (time.time() - CACHE_TTL_DAYS * 86400,))
+            removidos += cur.rowcount
+            n, total = c.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM resultados").fetchone()
+            limite_bytes = CACHE_MAX_MB * 1024 * 1024
+            if n > CACHE_MAX_ENTRIES or total > limite_bytes:
+                # corta para 90% dos limites, do menos usado para o mais usado
+                alvo_n = int(min(CACHE_MAX_ENTRIES, n) * 0.9)
+                alvo_b = limite_bytes * 0.9
+                excesso, acumulado = 0, total
+                for (tam,) in c.execute("SELECT tamanho FROM resultados ORDER BY usado ASC"):
+                    if n - excesso <= alvo_n and acumulado <= alvo_b:
+                        break
+                    excesso += 1; acumulado -= tam
+                if excesso:
+                    cur = c.execute("DELETE FROM resultados WHERE chave IN (SELECT chave FROM resultados ORDER BY usado ASC LIMIT ?)", (excesso,))
+                    removidos += cur.rowcount
+            c.commit()
+        finally:
+            c.close()
+    except Exception as e:
+        print(f"⚠️ Falha ao expurgar cache: {e}")
+    if removidos:
+        _conta("removidos", removidos)
+        metricas.contar("cache_removidos_total", removidos)
+        print(f"🧹 Cache: {removidos} entrada(s) removida(s)")
+    return removidos
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        s = dict(_STATS)
+    hits = s["hits_arquivo"] + s["hits_pagina"]
+    consultas = hits + s["misses_arquivo"] + s["misses_pagina"]
+    s["hit_ratio"] = round(hits / consultas, 4) if consultas else 0.0
+    s["db"] = CACHE_DB
+    return s
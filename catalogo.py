@@ -0,0 +1,178 @@
+# catalogo.py
+# Catálogo (SQLite) dos documentos gerados: atualizado por quem grava as páginas, consultado pelo /files
+# com filtros e paginação por cursor — sem listar as pastas a cada requisição.
+import os, re, time, sqlite3, threading
+from typing import Optional, Dict, Any, List, Iterable
+
+def _default_db() -> str:
+    v = os.getenv("CATALOGO_DB")
+    if v:
+        return v
+    base = "/data" if os.path.isdir("/data") else os.getcwd()
+    return os.path.join(base, "catalogo.sqlite")
+
+CATALOGO_DB      = _default_db()
+CATALOGO_ENABLED = (os.getenv("CATALOGO_ENABLED", "true").lower() == "true")
+LIMITE_MAX       = 1000
+
+# status de um documento
+ATIVO, REMOVIDO = "ativo", "removido"
+
+_CAMPOS = ("caminho", "nome", "emissor", "tipo", "numero", "chave", "tier", "origem", "pagina", "tamanho", "pendente")
+_RE_NOME = re.compile(r"^(?P<emissor>.+)_(?P<tipo>[A-Z]+)_(?P<numero>\d+)\.pdf$", re.I)
+
+_schema_ok = False
+_schema_lock = threading.Lock()
+
+def _conn() -> sqlite3.Connection:
+    global _schema_ok
+    c = sqlite3.connect(CATALOGO_DB, timeout=15, isolation_level=None)  # transações explícitas
+    c.row_factory = sqlite3.Row
+    if not _schema_ok:
+        with _schema_lock:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("""CREATE TABLE IF NOT EXISTS documentos (
+                            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                            caminho    TEXT NOT NULL UNIQUE,
+                            nome       TEXT NOT NULL,
+                            emissor    TEXT COLLATE NOCASE,
+                            tipo       TEXT,
+                            numero     INTEGER,
+                            chave      TEXT,
+                            tier       TEXT,
+                            origem     TEXT,
+                            pagina     INTEGER,
+                            tamanho    INTEGER,
+                            pendente   INTEGER NOT NULL DEFAULT 0,
+                            status     TEXT NOT NULL,
+                            criado     REAL NOT NULL,
+                            atualizado REAL NOT NULL,
+                            removido   REAL)""")
+            c.execute("CREATE INDEX IF NOT EXISTS ix_doc_status   ON documentos(status, pendente, id)")
+            c.execute("CREATE INDEX IF NOT EXISTS ix_doc_emissor  ON documentos(emissor, numero)")
+            c.execute("CREATE INDEX IF NOT EXISTS ix_doc_numero   ON documentos(numero)")
+            c.execute("CREATE INDEX IF NOT EXISTS ix_doc_criado   ON documentos(criado)")
+            c.execute("CREATE INDEX IF NOT EXISTS ix_doc_chave    ON documentos(chave)")
+            _schema_ok = True
+    return c
+
+def registrar_muitos(docs: Iterable[Dict[str, Any]]) -> int:
+    """Upsert por caminho numa transação só. Cada dict traz os campos de _CAMPOS (faltantes viram NULL).
+    Regravar o mesmo caminho (OUTPUT_OVERWRITE=replace) atualiza a entrada e a reativa."""
+    if not CATALOGO_ENABLED:
+        return 0
+    agora = time.time()
+    linhas = [tuple((1 if d.get(k) else 0) if k == "pendente" else d.get(k) for k in _CAMPOS) + (ATIVO, agora, agora)
+              for d in docs]
+    if not linhas:
+        return 0
+    try:
+        c = _conn()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            c.executemany(f"""INSERT INTO documentos ({", ".join(_CAMPOS)}, status, criado, atualizado)
+                              VALUES ({", ".join("?" * (len(_CAMPOS) + 3))})
+                              ON CONFLICT(caminho) DO UPDATE SET
+                                {", ".join(f"{k}=excluded.{k}" for k in _CAMPOS[1:])},
+                                status=excluded.status, atualizado=excluded.atualizado, removido=NULL""", linhas)
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        finally:
+            c.close()
+    except Exception as e:
+        print(f"⚠️ Catálogo indisponível (gravação): {e}")
+        return 0
+    return len(linhas)
+
+def registrar(**doc) -> int:
+    return registrar_muitos([doc])
+
+def marcar_removido(caminho: str) -> bool:
+    if not CATALOGO_ENABLED:
+        return False
+    try:
+        c = _conn()
+        try:
+            agora = time.time()
+            cur = c.execute("UPDATE documentos SET status=?, removido=?, atualizado=? WHERE caminho=? AND status<>?",
+                            (REMOVIDO, agora, agora, os.path.abspath(caminho), REMOVIDO))
+            return cur.rowcount > 0
+        finally:
+            c.close()
+    except Exception as e:
+        print(f"⚠️ Catálogo indisponível (remoção): {e}")
+        return False
+
+def consultar(emissor: Optional[str] = None, numero_de: Optional[int] = None, numero_ate: Optional[int] = None,
+              desde: Optional[float] = None, ate: Optional[float] = None, pendente: Optional[bool] = None,
+              status: Optional[str] = ATIVO, chave: Optional[str] = None,
+              limite: int = 100, cursor: Optional[int] = None) -> Dict[str, Any]:
+    """Mais recentes primeiro. `emissor` é prefixo sem diferenciar maiúsculas; `cursor` é o `proximo_cursor`
+    da página anterior (paginação por id — não degrada com offset alto)."""
+    where, args = [], []
+    if status:               where.append("status=?");      args.append(status)
+    if pendente is not None: where.append("pendente=?");    args.append(1 if pendente else 0)
+    if emissor:              where.append("emissor>=? AND emissor<?"); args += [emissor, emissor + "\U0010ffff"]  # prefixo (índice NOCASE)
+    if numero_de is not None: where.append("numero>=?");    args.append(int(numero_de))
+    if numero_ate is not None: where.append("numero<=?");   args.append(int(numero_ate))
+    if desde is not None:    where.append("criado>=?");     args.append(float(desde))
+    if ate is not None:      where.append("criado<?");      args.append(float(ate))
+    if chave:                where.append("chave=?");       args.append(chave)
+    if cursor:               where.append("id<?");          args.append(int(cursor))
+    limite = max(1, min(int(limite or 100), LIMITE_MAX))
+    sql = "SELECT * FROM documentos"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    c = _conn()
+    try:
+        rows = c.execute(sql, args + [limite + 1]).fetchall()
+    finally:
+        c.close()
+    itens = [dict(r) for r in rows[:limite]]
+    return {"itens": itens, "proximo_cursor": itens[-1]["id"] if len(rows) > limite else None}
+
+def contagem() -> Dict[str, int]:
+    c = _conn()
+    try:
+        out = {"ativos": 0, "pendentes": 0, "removidos": 0}
+        for status, pendente, n in c.execute("SELECT status, pendente, COUNT(*) FROM documentos GROUP BY status, pendente"):
+            if status == REMOVIDO: out["removidos"] += n
+            elif pendente: out["pendentes"] += n
+            else: out["ativos"] += n
+        return out
+    finally:
+        c.close()
+
+def _doc_de_arquivo(caminho: str, pendente: bool) -> Dict[str, Any]:
+    nome = os.path.basename(caminho)
+    m = _RE_NOME.match(nome)
+    return {"caminho": os.path.abspath(caminho), "nome": nome, "pendente": 1 if pendente else 0,
+            "tamanho": os.path.getsize(caminho),
+            "emissor": m.group("emissor") if m else None, "tipo": m.group("tipo").upper() if m else None,
+            "numero": int(m.group("numero")) if m else None}
+
+def importar_pastas(pastas: Dict[str, bool]) -> int:
+    """Carga inicial: registra os PDFs já existentes em {pasta: pendente}. Só roda com o catálogo vazio
+    (volumes que já tinham arquivos antes do catálogo existir); depois disso quem mantém é o gravador."""
+    if not CATALOGO_ENABLED:
+        return 0
+    c = _conn()
+    try:
+        if c.execute("SELECT 1 FROM documentos LIMIT 1").fetchone():
+            return 0
+    finally:
+        c.close()
+    docs: List[Dict[str, Any]] = []
+    for pasta, pendente in pastas.items():
+        try:
+            with os.scandir(pasta) as it:
+                docs.extend(_doc_de_arquivo(e.path, pendente) for e in it if e.is_file() and e.name.lower().endswith(".pdf"))
+        except OSError:
+            continue
+    n = registrar_muitos(docs)
+    if n:
+        print(f"🗂️ Catálogo: {n} documento(s) existente(s) importado(s)")
+    return n
@@ -0,0 +1,254 @@
+# faxina.py
+# Limpeza de arquivos numa thread só: remoções agendadas (heap por horário, gravadas em SQLite — sobrevivem a
+# restart/deploy) + varredura periódica das pastas com retenção por idade e cota de tamanho.
+# Vários processos (workers do gunicorn) podem usar o mesmo DB: cada remoção/varredura é reivindicada no banco.
+import os, time, heapq, sqlite3, threading
+from typing import Optional, Dict, Any, List, Tuple, Iterable, Callable, NamedTuple
+import metricas
+
+def _default_db() -> str:
+    v = os.getenv("FAXINA_DB")
+    if v:
+        return v
+    base = "/data" if os.path.isdir("/data") else os.getcwd()
+    return os.path.join(base, "faxina.sqlite")
+
+FAXINA_DB                = _default_db()
+FAXINA_VARREDURA_SECONDS = float(os.getenv("FAXINA_VARREDURA_SECONDS", "900"))
+
+class Politica(NamedTuple):
+    retencao_s: float    # 0 = sem limite de idade
+    cota_bytes: int      # 0 = sem cota
+
+def politica(nome: str, horas_padrao: float = 0, mb_padrao: float = 0) -> Politica:
+    """Lê FAXINA_<NOME>_HORAS (idade máxima) e FAXINA_<NOME>_MB (cota da pasta; remove os mais antigos primeiro)."""
+    horas = float(os.getenv(f"FAXINA_{nome}_HORAS", str(horas_padrao)))
+    mb = float(os.getenv(f"FAXINA_{nome}_MB", str(mb_padrao)))
+    return Politica(max(0.0, horas) * 3600, int(max(0.0, mb) * 1024 * 1024))
+
+_COND = threading.Condition()
+_HEAP: List[Tuple[float, str]] = []
+_QUANDO: Dict[str, float] = {}          # caminho → horário vigente (entradas antigas do heap são ignoradas)
+_PASTAS: Dict[str, Politica] = {}
+_AO_REMOVER: Optional[Callable[[str], Any]] = None
+_THREAD: Optional[threading.Thread] = None
+_STATS = {"removidos": 0, "bytes_liberados": 0}
+_ULTIMA: Dict[str, Any] = {}
+
+def _conn() -> sqlite3.Connection:
+    return sqlite3.connect(FAXINA_DB, timeout=15, isolation_level=None)   # transações explícitas
+
+def _criar_schema():
+    c = _conn()
+    try:
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("CREATE TABLE IF NOT EXISTS agenda (caminho TEXT PRIMARY KEY, quando REAL NOT NULL)")
+        c.execute("CREATE INDEX IF NOT EXISTS ix_agenda_quando ON agenda(quando)")
+        c.execute("CREATE TABLE IF NOT EXISTS estado (chave TEXT PRIMARY KEY, valor REAL NOT NULL)")
+    finally:
+        c.close()
+
+# ===== Remoção =====
+def _remover(caminho: str, motivo: str) -> int:
+    """Apaga o arquivo; devolve os bytes liberados (0 se já não existia ou falhou)."""
+    try:
+        tamanho = os.path.getsize(caminho)
+        os.remove(caminho)
+    except FileNotFoundError:
+        tamanho = 0
+    except Exception as e:
+        print(f"⚠️ Faxina: erro ao remover {caminho}: {e}")
+        return 0
+    if tamanho and motivo == "agendado":
+        print(f"🧹 Removido: {caminho}")
+    if _AO_REMOVER:
+        try: _AO_REMOVER(caminho)
+        except Exception as e: print(f"⚠️ Faxina: callback de remoção falhou para {caminho}: {e}")
+    if tamanho:
+        metricas.contar("faxina_bytes_total", tamanho, motivo=motivo)
+        metricas.contar("faxina_arquivos_total", motivo=motivo)
+    return tamanho
+
+def _contabilizar(n: int, liberados: int):
+    with _COND:
+        _STATS["removidos"] += n
+        _STATS["bytes_liberados"] += liberados
+    if not n:
+        return
+    c = _conn()
+    try:
+        for chave, v in (("removidos", n), ("bytes_liberados", liberados)):
+            c.execute("INSERT INTO estado (chave, valor) VALUES (?,?) ON CONFLICT(chave) DO UPDATE SET valor=valor+excluded.valor",
+                      (chave, v))
+    finally:
+        c.close()
+
+# ===== Agenda =====
+def agendar(caminhos: Iterable[str], atraso: float) -> int:
+    """Agenda a remoção de cada caminho daqui a `atraso` segundos (reagendar um caminho troca o horário)."""
+    quando = time.time() + max(0.0, atraso)
+    caminhos = [os.path.abspath(c) for c in caminhos]
+    if not caminhos:
+        return 0
+    c = _conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        c.executemany("INSERT INTO agenda (caminho, quando) VALUES (?,?) ON CONFLICT(caminho) DO UPDATE SET quando=excluded.quando",
+                      [(p, quando) for p in caminhos])
+        c.execute("COMMIT")
+    finally:
+        c.close()
+    with _COND:
+        for p in caminhos:
+            _QUANDO[p] = quando
+            heapq.heappush(_HEAP, (quando, p))
+        _COND.notify()
+    return len(caminhos)
+
+def _carregar_agenda() -> int:
+    c = _conn()
+    try:
+        linhas = c.execute("SELECT caminho, quando FROM agenda").fetchall()
+    finally:
+        c.close()
+    with _COND:
+        for p, quando in linhas:
+            _QUANDO[p] = quando
+            _HEAP.append((quando, p))
+        heapq.heapify(_HEAP)
+    return len(linhas)
+
+def _reivindicar(caminho: str, quando: float) -> bool:
+    """Tira o caminho da agenda; só quem conseguiu apagar a linha remove o arquivo (outro worker pode ter feito)."""
+    c = _conn()
+    try:
+        return c.execute("DELETE FROM agenda WHERE caminho=? AND quando<=?", (caminho, quando)).rowcount > 0
+    finally:
+        c.close()
+
+def _executar_vencidos() -> Tuple[int, int]:
+    agora = time.time()
+    vencidos: List[Tuple[float, str]] = []
+    with _COND:
+        while _HEAP and _HEAP[0][0] <= agora:
+            quando, p = heapq.heappop(_HEAP)
+            if _QUANDO.get(p) == quando:
+                _QUANDO.pop(p)
+                vencidos.append((quando, p))
+    n = liberados = 0
+    for quando, p in vencidos:
+        if _reivindicar(p, quando):
+            liberados += _remover(p, "agendado")
+            n += 1
+    _contabilizar(n, liberados)
+    return n, liberados
+
+# ===== Varredura por retenção/cota =====
+def _reivindicar_varredura(intervalo: float) -> bool:
+    agora = time.time()
+    c = _conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        row = c.execute("SELECT valor FROM estado WHERE chave='varredura'").fetchone()
+        if row and agora - row[0] < intervalo * 0.9:
+            c.execute("ROLLBACK")
+            return False
+        c.execute("INSERT INTO estado (chave, valor) VALUES ('varredura', ?) ON CONFLICT(chave) DO UPDATE SET valor=excluded.valor",
+                  (agora,))
+        c.execute("COMMIT")
+        return True
+    finally:
+        c.close()
+
+def _varrer_pasta(pasta: str, pol: Politica, agora: float) -> Tuple[int, int]:
+    try:
+        with os.scandir(pasta) as it:
+            arquivos = []
+            for e in it:
+                if e.is_file(follow_symlinks=False):
+                    st = e.stat(follow_symlinks=False)
+                    arquivos.append((st.st_mtime, st.st_size, e.path))
+    except OSError:
+        return 0, 0
+    arquivos.sort()   # mais antigos primeiro
+    n = liberados = 0
+    restante = sum(a[1] for a in arquivos)
+    for mtime, tamanho, caminho in arquivos:
+        if pol.retencao_s and agora - mtime > pol.retencao_s:
+            motivo = "retencao"
+        elif pol.cota_bytes and restante > pol.cota_bytes:
+            motivo = "cota"
+        else:
+            continue
+        b = _remover(caminho, motivo)
+        restante -= tamanho
+        n += 1; liberados += b
+    return n, liberados
+
+def varrer(forcar: bool = False) -> Dict[str, Any]:
+    """Aplica retenção e cota em cada pasta registrada. Sem `forcar`, só roda se nenhum processo varreu há pouco."""
+    if not forcar and not _reivindicar_varredura(FAXINA_VARREDURA_SECONDS):
+        return {}
+    agora = time.time()
+    res: Dict[str, Any] = {}
+    n_total = b_total = 0
+    for pasta, pol in _PASTAS.items():
+        if not (pol.retencao_s or pol.cota_bytes):
+            continue
+        n, b = _varrer_pasta(pasta, pol, agora)
+        res[pasta] = {"removidos": n, "bytes_liberados": b}
+        n_total += n; b_total += b
+    _contabilizar(n_total, b_total)
+    if n_total:
+        print(f"🧹 Faxina: {n_total} arquivo(s) antigo(s)/acima da cota removido(s), {b_total/1024/1024:.1f} MiB liberados")
+    with _COND:
+        _ULTIMA.clear(); _ULTIMA.update({"quando": agora, "pastas": res})
+    return res
+
+# ===== Thread =====
+def _loop():
+    proxima_varredura = time.time()
+    while True:
+        try:
+            _executar_vencidos()
+            if time.time() >= proxima_varredura:
+                varrer()
+                proxima_varredura = time.time() + FAXINA_VARREDURA_SECONDS
+        except Exception as e:
+            print(f"⚠️ Faxina: {e}")
+        with _COND:
+            prazo = min(proxima_varredura, _HEAP[0][0] if _HEAP else proxima_varredura)
+            espera = prazo - time.time()
+            if espera > 0:
+                _COND.wait(min(espera, 300))   # acorda no agendar(); teto para pegar mudanças de relógio
+
+def iniciar(pastas: Dict[str, Politica], ao_remover: Optional[Callable[[str], Any]] = None):
+    """Registra as pastas varridas, carrega a agenda persistida e sobe a thread (idempotente)."""
+    global _THREAD, _AO_REMOVER
+    with _COND:
+        _PASTAS.update({os.path.abspath(p): pol for p, pol in pastas.items()})
+        _AO_REMOVER = ao_remover
+        if _THREAD is not None:
+            return
+        _criar_schema()
+        _THREAD = threading.Thread(target=_loop, name="faxina", daemon=True)
+    n = _carregar_agenda()
+    _THREAD.start()
+    ativas = {os.path.basename(p) or p: f"{pol.retencao_s/3600:g}h/{pol.cota_bytes//(1024*1024)}MB"
+              for p, pol in _PASTAS.items() if pol.retencao_s or pol.cota_bytes}
+    print(f"🧹 Faxina iniciada: {n} remoção(ões) pendente(s) recuperada(s); varredura a cada {FAXINA_VARREDURA_SECONDS:g}s "
+          f"{ativas or '(sem retenção/cota)'} — {FAXINA_DB}")
+
+def stats() -> Dict[str, Any]:
+    """Neste processo + acumulado no DB (todos os processos, desde sempre)."""
+    with _COND:
+        s = {"agendados": len(_QUANDO), **_STATS, "ultima_varredura": dict(_ULTIMA)}
+    try:
+        c = _conn()
+        try:
+            s["total"] = {k: int(v) for k, v in c.execute("SELECT chave, valor FROM estado WHERE chave<>'varredura'")}
+        finally:
+            c.close()
+    except Exception as e:
+        s["total"] = {"erro": str(e)}
+    return s
@@ -0,0 +1,244 @@
+# fila_jobs.py
+# Fila de processamento limitada, persistida em SQLite, consumida por um pool fixo de threads.
+import os, json, time, uuid, socket, sqlite3, threading
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+def _default_db() -> str:
+    v = os.getenv("FILA_DB")
+    if v:
+        return v
+    base = "/data" if os.path.isdir("/data") else os.getcwd()
+    return os.path.join(base, "fila_jobs.sqlite")
+
+FILA_DB            = _default_db()
+FILA_WORKERS       = int(os.getenv("FILA_WORKERS", "2"))
+FILA_MAX           = int(os.getenv("FILA_MAX", "50"))          # jobs aguardando (todas as instâncias que usam o mesmo DB)
+FILA_POLL_SECONDS  = float(os.getenv("FILA_POLL_SECONDS", "2"))
+FILA_RETENCAO_DIAS = float(os.getenv("FILA_RETENCAO_DIAS", "7"))
+FILA_LEASE_SECONDS = float(os.getenv("FILA_LEASE_SECONDS", "90"))   # sem batida por esse tempo = dono morreu
+FILA_MAX_TENTATIVAS = int(os.getenv("FILA_MAX_TENTATIVAS", "3"))    # execuções interrompidas antes de desistir do job
+
+# estados de um job
+NA_FILA, PROCESSANDO, CONCLUIDO, FALHOU = "na_fila", "processando", "concluido", "falhou"
+
+class FilaCheia(Exception):
+    pass
+
+_DONO = ""   # host:pid:boot — gerado no iniciar(); pid e hostname se repetem depois de um restart do container
+_HANDLER: Optional[Callable[[Dict[str, Any]], Any]] = None
+_COND = threading.Condition()
+_THREADS: List[threading.Thread] = []
+_OCUPADOS = 0
+_ATUAL = threading.local()   # job em execução na thread do worker
+
+def _conn() -> sqlite3.Connection:
+    c = sqlite3.connect(FILA_DB, timeout=15, isolation_level=None)  # transações explícitas
+    c.row_factory = sqlite3.Row
+    return c
+
+def _criar_schema():
+    c = _conn()
+    try:
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+                        estado     TEXT NOT NULL,
+                        payload    TEXT NOT NULL,
+                        dono       TEXT,
+                        criado     REAL NOT NULL,
+                        iniciado   REAL,
+                        finalizado REAL,
+                        erro       TEXT,
+                        resultado  TEXT)""")
+        c.execute("CREATE INDEX IF NOT EXISTS ix_jobs_estado ON jobs(estado, id)")
+        colunas = {r["name"] for r in c.execute("PRAGMA table_info(jobs)")}
+        if "batida" not in colunas:
+            c.execute("ALTER TABLE jobs ADD COLUMN batida REAL")   # DBs criados antes do lease
+        if "tentativas" not in colunas:
+            c.execute("ALTER TABLE jobs ADD COLUMN tentativas INTEGER NOT NULL DEFAULT 0")
+    finally:
+        c.close()
+
+# ===== Lease =====
+# Cada processo renova a `batida` dos jobs que está rodando; job 'processando' sem batida há mais de
+# FILA_LEASE_SECONDS é de um processo que morreu (restart/deploy/OOM) — em qualquer host que use o mesmo DB.
+def _bater():
+    c = _conn()
+    try:
+        c.execute("UPDATE jobs SET batida=? WHERE estado=? AND dono=?", (time.time(), PROCESSANDO, _DONO))
+    finally:
+        c.close()
+
+def _recuperar_orfaos():
+    """Jobs 'processando' com lease vencido voltam para a fila — ou vão para 'falhou' se já foram reservados
+    FILA_MAX_TENTATIVAS vezes (um PDF que derruba o processo não fica em loop); concluídos/falhos antigos são apagados."""
+    agora = time.time()
+    orfao = "estado=? AND dono<>? AND COALESCE(batida, iniciado, 0) < ?"
+    args = (PROCESSANDO, _DONO, agora - FILA_LEASE_SECONDS)
+    c = _conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        cur = c.execute(f"UPDATE jobs SET estado=?, finalizado=?, erro=? WHERE {orfao} AND tentativas>=?",
+                        (FALHOU, agora, f"interrompido {FILA_MAX_TENTATIVAS} vez(es) sem concluir") + args + (FILA_MAX_TENTATIVAS,))
+        desistidos = cur.rowcount
+        cur = c.execute(f"UPDATE jobs SET estado=?, dono=NULL, iniciado=NULL, batida=NULL WHERE {orfao}",
+                        (NA_FILA,) + args)
+        n = cur.rowcount
+        c.execute("DELETE FROM jobs WHERE estado IN (?,?) AND finalizado < ?",
+                  (CONCLUIDO, FALHOU, agora - FILA_RETENCAO_DIAS * 86400))
+        c.execute("COMMIT")
+        if n:
+            print(f"♻️ Fila: {n} job(s) interrompido(s) recolocado(s) na fila")
+        if desistidos:
+            print(f"⚠️ Fila: {desistidos} job(s) interrompido(s) {FILA_MAX_TENTATIVAS} vez(es) marcado(s) como falhou")
+    finally:
+        c.close()
+
+def _lease_loop():
+    while True:
+        time.sleep(max(1.0, FILA_LEASE_SECONDS / 3))
+        try:
+            _bater()
+            _recuperar_orfaos()
+        except Exception as e:
+            print(f"⚠️ Fila: falha ao renovar lease: {e}")
+
+def enfileirar(payload: Dict[str, Any]) -> Tuple[int, int]:
+    """Grava o job e acorda um worker. Retorna (job_id, posição na fila — 1 = próximo). Levanta FilaCheia."""
+    c = _conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        (n,) = c.execute("SELECT COUNT(*) FROM jobs WHERE estado=?", (NA_FILA,)).fetchone()
+        if n >= FILA_MAX:
+            c.execute("ROLLBACK")
+            raise FilaCheia(f"{n} job(s) aguardando")
+        cur = c.execute("INSERT INTO jobs (estado, payload, criado) VALUES (?,?,?)",
+                        (NA_FILA, json.dumps(payload, ensure_ascii=False), time.time()))
+        c.execute("COMMIT")
+        jid = cur.lastrowid
+    finally:
+        c.close()
+    with _COND:
+        _COND.notify()
+    return jid, n + 1
+
+def _reservar() -> Optional[sqlite3.Row]:
+    c = _conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        row = c.execute("SELECT * FROM jobs WHERE estado=? ORDER BY id LIMIT 1", (NA_FILA,)).fetchone()
+        if row:
+            agora = time.time()
+            c.execute("UPDATE jobs SET estado=?, dono=?, iniciado=?, batida=?, tentativas=tentativas+1 WHERE id=?",
+                      (PROCESSANDO, _DONO, agora, agora, row["id"]))
+        c.execute("COMMIT")
+        return row
+    finally:
+        c.close()
+
+def _finalizar(jid: int, estado: str, resultado: Any = None, erro: Optional[str] = None):
+    c = _conn()
+    try:
+        # dono=? : se o lease venceu e outro processo reassumiu o job, o resultado dele é que vale
+        c.execute("UPDATE jobs SET estado=?, finalizado=?, resultado=?, erro=? WHERE id=? AND dono=?",
+                  (estado, time.time(), json.dumps(resultado, ensure_ascii=False) if resultado is not None else None, erro, jid, _DONO))
+    finally:
+        c.close()
+
+def _worker_loop():
+    global _OCUPADOS
+    while True:
+        try:
+            row = _reservar()
+        except Exception as e:
+            print(f"⚠️ Fila: falha ao reservar job: {e}")
+            row = None
+        if row is None:
+            with _COND:
+                _COND.wait(FILA_POLL_SECONDS)   # acorda no enfileirar ou faz polling (outras instâncias)
+            continue
+        with _COND:
+            _OCUPADOS += 1
+        jid = row["id"]
+        _ATUAL.jid = jid
+        print(f"▶️ Job {jid} iniciado")
+        try:
+            res = _HANDLER(json.loads(row["payload"]))
+            _finalizar(jid, CONCLUIDO, res)
+            print(f"✔️ Job {jid} concluído")
+        except Exception as e:
+            print(f"⚠️ Job {jid} falhou: {e}")
+            try: _finalizar(jid, FALHOU, erro=str(e))
+            except Exception as e2: print(f"⚠️ Fila: falha ao registrar erro do job {jid}: {e2}")
+        finally:
+            _ATUAL.jid = None
+            with _COND:
+                _OCUPADOS -= 1
+
+def iniciar(handler: Callable[[Dict[str, Any]], Any]):
+    """Cria o schema, recupera jobs órfãos e sobe FILA_WORKERS threads + a do lease (idempotente)."""
+    global _HANDLER, _DONO
+    _HANDLER = handler
+    with _COND:
+        if _THREADS:
+            return
+        _DONO = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        _criar_schema()
+        _recuperar_orfaos()
+        threading.Thread(target=_lease_loop, name="fila-lease", daemon=True).start()
+        for k in range(max(1, FILA_WORKERS)):
+            t = threading.Thread(target=_worker_loop, name=f"fila-worker-{k+1}", daemon=True)
+            t.start()
+            _THREADS.append(t)
+    print(f"🧾 Fila iniciada: {FILA_WORKERS} worker(s), máx {FILA_MAX} aguardando — {FILA_DB}")
+
+def livres() -> int:
+    """Workers ociosos neste processo."""
+    with _COND:
+        return max(0, len(_THREADS) - _OCUPADOS)
+
+def ocupados() -> int:
+    """Jobs em execução neste processo."""
+    with _COND:
+        return _OCUPADOS
+
+def job_atual() -> Optional[int]:
+    """Id do job que a thread atual está executando (None fora de um worker da fila)."""
+    return getattr(_ATUAL, "jid", None)
+
+def _row_dict(r: sqlite3.Row) -> Dict[str, Any]:
+    d = dict(r)
+    d["payload"] = json.loads(d["payload"]) if d.get("payload") else None
+    d["resultado"] = json.loads(d["resultado"]) if d.get("resultado") else None
+    return d
+
+def consultar(jid: int) -> Optional[Dict[str, Any]]:
+    c = _conn()
+    try:
+        r = c.execute("SELECT * FROM jobs WHERE id=?", (jid,)).fetchone()
+        if not r:
+            return None
+        d = _row_dict(r)
+        if d["estado"] == NA_FILA:
+            (d["posicao"],) = c.execute("SELECT COUNT(*) FROM jobs WHERE estado=? AND id<=?", (NA_FILA, jid)).fetchone()
+        return d
+    finally:
+        c.close()
+
+def listar(estado: Optional[str] = None, limite: int = 50) -> List[Dict[str, Any]]:
+    c = _conn()
+    try:
+        if estado:
+            rows = c.execute("SELECT * FROM jobs WHERE estado=? ORDER BY id DESC LIMIT ?", (estado, limite)).fetchall()
+        else:
+            rows = c.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limite,)).fetchall()
+        return [_row_dict(r) for r in rows]
+    finally:
+        c.close()
+
+def contagem() -> Dict[str, int]:
+    c = _conn()
+    try:
+        return {r[0]: r[1] for r in c.execute("SELECT estado, COUNT(*) FROM jobs GROUP BY estado")}
+    finally:
+        c.close()
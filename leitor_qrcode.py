@@ -1,7 +1,32 @@
+import os
+import sys
+import glob
+import json
+import time
 import argparse
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
 from pyzbar.pyzbar import decode, ZBarSymbol
 from PIL import Image, ImageOps
 
+from renomear_cte_mesma_pasta import parse_chave_acesso_from_payload, nct_from_chave, cnpj_from_chave, QR_DPI_ETAPAS
+
+SIMBOLOS = [
+    ZBarSymbol.QRCODE,
+    ZBarSymbol.CODE128,
+    ZBarSymbol.EAN13,
+    ZBarSymbol.EAN8,
+    ZBarSymbol.CODE39,
+    ZBarSymbol.ITF,
+    ZBarSymbol.UPCA,
+    ZBarSymbol.UPCE,
+    ZBarSymbol.DATABAR,
+    ZBarSymbol.DATABAR_EXP,
+]
+EXT_IMAGEM = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".gif", ".webp")
+
 def carregar_imagem(path: str) -> Image.Image:
     img = Image.open(path)
     if img.mode not in ("L", "LA", "RGB", "RGBA"):
@@ -10,21 +35,7 @@ def carregar_imagem(path: str) -> Image.Image:
 
 def tentar_decode(img: Image.Image):
     # 1) Direto, priorizando QR e códigos comuns
-    res = decode(
-        img,
-        symbols=[
-            ZBarSymbol.QRCODE,
-            ZBarSymbol.CODE128,
-            ZBarSymbol.EAN13,
-            ZBarSymbol.EAN8,
-            ZBarSymbol.CODE39,
-            ZBarSymbol.ITF,
-            ZBarSymbol.UPCA,
-            ZBarSymbol.UPCE,
-            ZBarSymbol.DATABAR,
-            ZBarSymbol.DATABAR_EXP,
-        ],
-    )
+    res = decode(img, symbols=SIMBOLOS)
     if res:
         return res
 
@@ -41,12 +52,204 @@ def tentar_decode(img: Image.Image):
 
     return []
 
+# ===== Lote: barato primeiro =====
+# Cada página/imagem sobe a escada só enquanto não achar a chave:
+#   qr_reduzido → só QR, cinza, reduzida (JPEG já decodificado em escala menor via draft)
+#   qr          → só QR, cinza, resolução cheia (PDF: próximos DPIs de QR_DPI_ETAPAS)
+#   todos       → todas as simbologias (o código de barras CODE128 do DACTE também traz a chave)
+#   rot90/180/270
+LADO_BARATO = int(os.getenv("QR_LADO_BARATO", "1700"))   # px do lado maior na 1ª tentativa (~150 DPI num A4)
+PDF_DPI_CHEIO = int(os.getenv("QR_PDF_DPI", "300"))
+
+def _cinza(img: Image.Image) -> Image.Image:
+    return img if img.mode == "L" else ImageOps.grayscale(img)
+
+def _escada(cheia, barata=None, extras=()):
+    """(etapa, imagem, símbolos) na ordem de custo; imagens produzidas só quando a etapa chega."""
+    if barata is not None:
+        yield "qr_reduzido", barata, [ZBarSymbol.QRCODE]
+    for nome, fn in extras:
+        yield nome, fn(), [ZBarSymbol.QRCODE]
+    img = cheia()
+    yield "qr", img, [ZBarSymbol.QRCODE]
+    yield "todos", img, SIMBOLOS
+    for ang in (90, 180, 270):
+        yield f"rot{ang}", img.rotate(ang, expand=True), SIMBOLOS
+
+def decodificar_escalonado(etapas) -> Tuple[str, List[Dict[str, str]], Optional[str]]:
+    """Roda as etapas até uma delas render uma chave de acesso. Retorna (etapa, códigos lidos, chave)."""
+    codigos: List[Dict[str, str]] = []
+    vistos = set()
+    primeira = "nenhum"   # sem chave: etapa em que apareceu o 1º código
+    for nome, img, simbolos in etapas:
+        try:
+            res = decode(img, symbols=simbolos)
+        except Exception:
+            res = []
+        chave = None
+        for r in res:
+            dados = r.data.decode("utf-8", errors="replace") if r.data else ""
+            if (r.type, dados) not in vistos:
+                vistos.add((r.type, dados))
+                codigos.append({"tipo": r.type, "dados": dados})
+            chave = chave or parse_chave_acesso_from_payload(dados)
+        if res and primeira == "nenhum":
+            primeira = nome
+        if chave:
+            return nome, codigos, chave
+    return primeira, codigos, None
+
+def _linha(arquivo: str, pagina: Optional[int], etapa: str, codigos, chave, t0: float, erro: Optional[str] = None):
+    return {"arquivo": arquivo, "pagina": pagina, "chave": chave,
+            "nct": nct_from_chave(chave) if chave else None, "cnpj": cnpj_from_chave(chave) if chave else None,
+            "etapa": etapa, "codigos": codigos, "ms": round((time.perf_counter() - t0) * 1000, 1), "erro": erro}
+
+def _ler_imagem(caminho: str) -> List[Dict[str, Any]]:
+    linhas = []
+    with Image.open(caminho) as base:
+        quadros = getattr(base, "n_frames", 1)   # TIFF multipágina
+        for q in range(quadros):
+            t0 = time.perf_counter()
+            try:
+                if q == 0 and base.format == "JPEG":
+                    # draft decodifica o JPEG direto em 1/2, 1/4 ou 1/8: a tentativa barata nem paga a resolução cheia
+                    with Image.open(caminho) as rascunho:
+                        rascunho.draft("L", (LADO_BARATO, LADO_BARATO))
+                        barata = _cinza(rascunho)
+                        barata.thumbnail((LADO_BARATO, LADO_BARATO))
+                else:
+                    base.seek(q)
+                    barata = ImageOps.grayscale(base)   # sempre cópia: o thumbnail não pode mexer no quadro original
+                    barata.thumbnail((LADO_BARATO, LADO_BARATO))
+                def _cheia(q=q):
+                    base.seek(q)
+                    return _cinza(base)
+                if max(barata.size) >= max(base.size):
+                    barata = None   # já é pequena: a etapa "qr" cobre
+                etapa, codigos, chave = decodificar_escalonado(_escada(_cheia, barata))
+                linhas.append(_linha(caminho, q + 1 if quadros > 1 else None, etapa, codigos, chave, t0))
+            except Exception as e:
+                linhas.append(_linha(caminho, q + 1 if quadros > 1 else None, "erro", [], None, t0, str(e)))
+    return linhas
+
+def _ler_pdf(caminho: str, paginas: range) -> List[Dict[str, Any]]:
+    import fitz  # PyMuPDF — só no modo lote com PDFs
+    def _render(page, dpi):
+        pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72.0, dpi / 72.0), colorspace=fitz.csGRAY, alpha=False)
+        return Image.frombuffer("L", (pix.width, pix.height), pix.samples, "raw", "L", 0, 1)
+    linhas = []
+    with fitz.open(caminho) as doc:
+        for i in paginas:
+            t0 = time.perf_counter()
+            try:
+                page = doc.load_page(i)
+                dpis = [d for d in QR_DPI_ETAPAS if d < PDF_DPI_CHEIO]
+                barata = _render(page, dpis[0]) if dpis else None
+                extras = [(f"qr@{d}", (lambda d=d: _render(page, d))) for d in dpis[1:]]
+                etapa, codigos, chave = decodificar_escalonado(_escada(lambda: _render(page, PDF_DPI_CHEIO), barata, extras))
+                linhas.append(_linha(caminho, i + 1, etapa, codigos, chave, t0))
+            except Exception as e:
+                linhas.append(_linha(caminho, i + 1, "erro", [], None, t0, str(e)))
+    return linhas
+
+def _tarefa(t: Tuple[str, Optional[Tuple[int, int]]]) -> List[Dict[str, Any]]:
+    caminho, faixa = t
+    try:
+        return _ler_pdf(caminho, range(*faixa)) if faixa else _ler_imagem(caminho)
+    except Exception as e:
+        return [_linha(caminho, None, "erro", [], None, time.perf_counter(), str(e))]
+
+def expandir_entradas(entradas: List[str], recursivo: bool = True) -> List[str]:
+    """Pastas, globs e arquivos → lista ordenada (sem repetição) de imagens e PDFs."""
+    achados = []
+    for e in entradas:
+        if os.path.isdir(e):
+            if recursivo:
+                for raiz, _, nomes in os.walk(e):
+                    achados += [os.path.join(raiz, n) for n in nomes]
+            else:
+                achados += [os.path.join(e, n) for n in os.listdir(e)]
+        elif glob.has_magic(e):
+            achados += glob.glob(e, recursive=True)
+        else:
+            achados.append(e)
+    vistos, saida = set(), []
+    for c in achados:
+        if os.path.isfile(c) and c.lower().endswith(EXT_IMAGEM + (".pdf",)) and os.path.abspath(c) not in vistos:
+            vistos.add(os.path.abspath(c))
+            saida.append(c)
+    return sorted(saida)
+
+def _tarefas(arquivos: List[str], paginas_por_tarefa: int) -> List[Tuple[str, Optional[Tuple[int, int]]]]:
+    """PDFs grandes viram várias tarefas (faixas de páginas) para espalhar no pool."""
+    tarefas = []
+    for c in arquivos:
+        if not c.lower().endswith(".pdf"):
+            tarefas.append((c, None)); continue
+        try:
+            import fitz
+            with fitz.open(c) as doc:
+                n = doc.page_count
+        except Exception as e:
+            print(f"⚠️ Não consegui abrir {c}: {e}", file=sys.stderr)
+            tarefas.append((c, (0, 0))); continue
+        tarefas += [(c, (i, min(n, i + paginas_por_tarefa))) for i in range(0, n, paginas_por_tarefa)]
+    return tarefas
+
+def processar_lote(entradas: List[str], saida, workers: int = 0, paginas_por_tarefa: int = 8, recursivo: bool = True) -> Dict[str, Any]:
+    """Lê tudo em paralelo e grava uma linha JSON por página/imagem em `saida`, na ordem dos arquivos."""
+    arquivos = expandir_entradas(entradas, recursivo)
+    tarefas = _tarefas(arquivos, max(1, paginas_por_tarefa))
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    etapas: Counter = Counter()
+    total = com_chave = 0
+    def _gravar(linhas):
+        nonlocal total, com_chave
+        for ln in linhas:
+            saida.write(json.dumps(ln, ensure_ascii=False) + "\n")
+            total += 1; com_chave += bool(ln["chave"]); etapas[ln["etapa"]] += 1
+        saida.flush()
+    if workers > 1 and len(tarefas) > 1:
+        ctx = multiprocessing.get_context(os.getenv("PDF_POOL_START", "spawn"))
+        with ProcessPoolExecutor(max_workers=min(workers, len(tarefas)), mp_context=ctx) as ex:
+            for linhas in ex.map(_tarefa, tarefas):
+                _gravar(linhas)
+    else:
+        for t in tarefas:
+            _gravar(_tarefa(t))
+    seg = time.perf_counter() - t0
+    resumo = {"arquivos": len(arquivos), "paginas": total, "com_chave": com_chave, "segundos": round(seg, 2),
+              "paginas_por_s": round(total / seg, 2) if seg else None, "etapas": dict(etapas)}
+    print(f"📊 {len(arquivos)} arquivo(s), {total} página(s)/imagem(ns), {com_chave} com chave, "
+          f"{resumo['paginas_por_s']} pág/s — etapas: {dict(etapas)}", file=sys.stderr)
+    return resumo
+
+def _modo_lote(args) -> bool:
+    if args.saida or len(args.entradas) != 1:
+        return True
+    e = args.entradas[0]
+    return os.path.isdir(e) or glob.has_magic(e) or e.lower().endswith(".pdf")
+
 def main():
-    parser = argparse.ArgumentParser(description="Leitor de QR/código de barras")
-    parser.add_argument("imagem", nargs="?", default="qrcode_teste.png", help="Caminho da imagem")
+    parser = argparse.ArgumentParser(description="Leitor de QR/código de barras (uma imagem, ou lote de pastas/globs/PDFs em JSONL)")
+    parser.add_argument("entradas", nargs="*", default=["qrcode_teste.png"],
+                        help="Imagem; ou pastas, globs e PDFs para o modo lote")
+    parser.add_argument("--saida", help="Arquivo JSONL do modo lote (padrão: stdout)")
+    parser.add_argument("--workers", type=int, default=0, help="Processos do pool (padrão: nº de CPUs)")
+    parser.add_argument("--paginas-por-tarefa", type=int, default=8)
+    parser.add_argument("--sem-recursao", action="store_true", help="Não desce em subpastas")
     args = parser.parse_args()
 
-    img = carregar_imagem(args.imagem)
+    if _modo_lote(args):
+        saida = open(args.saida, "w", encoding="utf-8") if args.saida and args.saida != "-" else sys.stdout
+        try:
+            processar_lote(args.entradas, saida, args.workers, args.paginas_por_tarefa, not args.sem_recursao)
+        finally:
+            if saida is not sys.stdout: saida.close()
+        return
+
+    img = carregar_imagem(args.entradas[0])
     resultados = tentar_decode(img)
 
     if not resultados:
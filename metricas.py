@@ -0,0 +1,316 @@
+# metricas.py
+# Instrumentação do caminho quente: histograma de tempo por etapa (render, zbar, OCR, gravação, download, envio…),
+# contadores e gauges, expostos no formato texto do Prometheus (/metrics do server).
+# O Coletor junta os tempos de um job/lote para o log de fim de job e é o que os workers do pool de páginas
+# devolvem ao processo principal.
+# Com compartilhar(), cada processo (worker do gunicorn) publica seu registro num SQLite comum e o /metrics
+# de qualquer um deles soma todos — o scrape não depende de qual worker atendeu.
+import os, json, time, uuid, sqlite3, threading
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Callable, Optional, Union, Iterator
+
+PREFIXO = "scanner"
+BALDES  = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)   # segundos
+
+Rotulos = Tuple[Tuple[str, str], ...]
+
+_AJUDA = {
+    "etapa_segundos":     "Tempo gasto por etapa do processamento",
+    "job_segundos":       "Duração total de um job (download + processamento + envio)",
+    "paginas_total":      "Páginas processadas por tier que resolveu (text|qr|ocr|cache) e resultado (ok|pendente|erro)",
+    "dpi_resolveu_total": "Páginas resolvidas por raster, por tier (qr|ocr) e DPI que resolveu",
+    "nome_fonte_total":   "Páginas extraídas por fonte do nome do emissor (fixed|canon|ocr)",
+    "jobs_total":         "Jobs finalizados por resultado",
+    "downloads_total":    "Mídias baixadas por resultado",
+    "midia_bytes_total":  "Bytes de mídia baixados",
+    "envios_total":       "Mensagens WhatsApp por resultado",
+    "envio_retries_total": "Novas tentativas de envio (429/5xx/rede)",
+    "cache_consultas_total": "Consultas ao cache de resultados por escopo (arquivo|pagina) e resultado (hit|miss)",
+    "cache_gravacoes_total": "Resultados gravados no cache por escopo",
+    "cache_removidos_total": "Entradas do cache removidas por validade/limite",
+    "faxina_bytes_total":  "Bytes liberados pela faxina por motivo (agendado|retencao|cota)",
+    "faxina_arquivos_total": "Arquivos removidos pela faxina por motivo (agendado|retencao|cota)",
+}
+
+_LOCK = threading.Lock()
+_HIST: Dict[Tuple[str, Rotulos], List[float]] = {}    # contagem por balde (+Inf no fim), soma, total
+_CONT: Dict[Tuple[str, Rotulos], float] = {}
+_GAUGES: Dict[str, Tuple[Callable[[], Union[float, Dict[Rotulos, float]]], str, bool]] = {}
+_LOCAL = threading.local()
+
+def _rotulos(kw: Dict[str, object]) -> Rotulos:
+    return tuple(sorted((k, str(v)) for k, v in kw.items()))
+
+# ===== Coletor por job =====
+class Coletor:
+    """Observações de um job (ou de uma página num worker do pool). Picklável: volta pelo ProcessPoolExecutor."""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.obs: List[Tuple[str, float]] = []                     # (etapa, segundos)
+        self.contagens: List[Tuple[str, Rotulos, float]] = []
+
+    def decorrido(self) -> float:
+        return time.perf_counter() - self.t0
+
+    def resumo(self) -> Dict[str, Dict[str, float]]:
+        """{etapa: {"n", "ms"}} na ordem em que cada etapa apareceu pela 1ª vez."""
+        out: Dict[str, Dict[str, float]] = {}
+        for etapa, s in self.obs:
+            e = out.setdefault(etapa, {"n": 0, "ms": 0.0})
+            e["n"] += 1; e["ms"] += s * 1000
+        for e in out.values():
+            e["ms"] = round(e["ms"], 1)
+        return out
+
+    def linha(self) -> str:
+        partes = [f"{etapa} {v['ms']/1000:.2f}s" + (f" ({v['n']}x)" if v["n"] > 1 else "")
+                  for etapa, v in self.resumo().items()]
+        tiers: Dict[str, float] = {}
+        for nome, rot, n in self.contagens:
+            if nome == "paginas_total":
+                d = dict(rot); k = d.get("tier", "?") if d.get("resultado") == "ok" else d.get("resultado", "?")
+                tiers[k] = tiers.get(k, 0) + n
+        if tiers:
+            partes.append("páginas " + " ".join(f"{k}={int(v)}" for k, v in tiers.items()))
+        partes.append(f"total {self.decorrido():.2f}s")
+        return " · ".join(partes)
+
+def _ativos() -> List[Coletor]:
+    pilha = getattr(_LOCAL, "pilha", None)
+    if pilha is None:
+        pilha = _LOCAL.pilha = []
+    return pilha
+
+@contextmanager
+def coletando() -> Iterator[Coletor]:
+    """Tudo que esta thread observar dentro do bloco também vai para o Coletor devolvido (aninhável)."""
+    col = Coletor()
+    pilha = _ativos()
+    pilha.append(col)
+    try:
+        yield col
+    finally:
+        pilha.remove(col)
+
+def anotar(etapa: str, segundos: float):
+    """Só nos coletores ativos (não entra no histograma): ex. espera por algo já medido em outra thread."""
+    for col in _ativos():
+        col.obs.append((etapa, segundos))
+
+# ===== Registro =====
+def histograma(nome: str, segundos: float, **rotulos):
+    chave = (nome, _rotulos(rotulos))
+    i = 0
+    while i < len(BALDES) and segundos > BALDES[i]:
+        i += 1
+    with _LOCK:
+        h = _HIST.get(chave)
+        if h is None:
+            h = _HIST[chave] = [0.0] * (len(BALDES) + 3)
+        h[i] += 1; h[-2] += segundos; h[-1] += 1
+
+def observar(etapa: str, segundos: float):
+    histograma("etapa_segundos", segundos, etapa=etapa)
+    anotar(etapa, segundos)
+
+@contextmanager
+def etapa(nome: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observar(nome, time.perf_counter() - t0)
+
+def contar(nome: str, n: float = 1, **rotulos):
+    rot = _rotulos(rotulos)
+    with _LOCK:
+        _CONT[(nome, rot)] = _CONT.get((nome, rot), 0) + n
+    for col in _ativos():
+        col.contagens.append((nome, rot, n))
+
+def absorver(col: Optional[Coletor]):
+    """Reaplica neste processo (registro + coletores ativos da thread) o que um worker do pool observou."""
+    if col is None:
+        return
+    for etapa_, s in col.obs:
+        observar(etapa_, s)
+    for nome, rot, n in col.contagens:
+        contar(nome, n, **dict(rot))
+
+def gauge(nome: str, fn: Callable[[], Union[float, Dict[Rotulos, float]]], ajuda: str = "", por_processo: bool = False):
+    """Valor lido na hora do scrape: número, ou {rótulos: valor} para uma série por rótulo.
+    `por_processo`: o valor é só deste processo (ex. jobs em execução) — compartilhado, vira a soma dos processos vivos."""
+    _GAUGES[nome] = (fn, ajuda, por_processo)
+
+def _ler_gauge(nome: str, fn) -> Optional[Dict[Rotulos, float]]:
+    try:
+        v = fn()
+    except Exception as e:
+        print(f"⚠️ Métrica {nome} indisponível: {e}")
+        return None
+    return dict(v) if isinstance(v, dict) else {(): v}
+
+# ===== Registro compartilhado entre processos (SQLite) =====
+# Uma linha por (processo, série) com o valor acumulado daquele processo; quem exporta soma as linhas.
+# Processo sem publicar há METRICAS_EXPIRA_SECONDS morreu: contadores/histogramas dele são somados na linha
+# consolidada ("*") — o total nunca diminui (rate() não vê reset falso) — e os gauges dele são descartados
+# (no /metrics, gauge só conta se foi publicado nos últimos 3 intervalos).
+def _default_db() -> str:
+    v = os.getenv("METRICAS_DB")
+    if v:
+        return v
+    base = "/data" if os.path.isdir("/data") else os.getcwd()
+    return os.path.join(base, "metricas.sqlite")
+
+METRICAS_DB               = _default_db()
+METRICAS_PUBLICAR_SECONDS = float(os.getenv("METRICAS_PUBLICAR_SECONDS", "10"))
+METRICAS_EXPIRA_SECONDS   = float(os.getenv("METRICAS_EXPIRA_SECONDS", "300"))
+_DB: Optional[str] = None
+_PROCESSO = ""
+
+def _conn() -> sqlite3.Connection:
+    return sqlite3.connect(_DB, timeout=15, isolation_level=None)   # transações explícitas
+
+def _publicar():
+    """Grava o acumulado deste processo (upsert por série) e consolida processos mortos."""
+    with _LOCK:
+        linhas = [("h", n, json.dumps(r), json.dumps(v)) for (n, r), v in _HIST.items()]
+        linhas += [("c", n, json.dumps(r), json.dumps(v)) for (n, r), v in _CONT.items()]
+    for nome, (fn, _, por_processo) in list(_GAUGES.items()):
+        v = _ler_gauge(nome, fn) if por_processo else None
+        linhas += [("g", nome, json.dumps(r), json.dumps(x)) for r, x in (v or {}).items()]
+    agora = time.time()
+    c = _conn()
+    try:
+        c.execute("BEGIN IMMEDIATE")
+        c.executemany("INSERT INTO serie (processo, tipo, nome, rotulos, valor, atualizado) VALUES (?,?,?,?,?,?) "
+                      "ON CONFLICT(processo, tipo, nome, rotulos) DO UPDATE SET valor=excluded.valor, atualizado=excluded.atualizado",
+                      [(_PROCESSO, t, n, r, v, agora) for t, n, r, v in linhas])
+        mortos = [p for (p,) in c.execute("SELECT processo FROM serie WHERE processo<>'*' GROUP BY processo HAVING MAX(atualizado) < ?",
+                                          (agora - METRICAS_EXPIRA_SECONDS,))]
+        for p in mortos:
+            for t, n, r, v in c.execute("SELECT tipo, nome, rotulos, valor FROM serie WHERE processo=? AND tipo<>'g'", (p,)).fetchall():
+                ant = c.execute("SELECT valor FROM serie WHERE processo='*' AND tipo=? AND nome=? AND rotulos=?", (t, n, r)).fetchone()
+                soma = _somar(t, json.loads(ant[0]) if ant else None, json.loads(v))
+                c.execute("INSERT INTO serie (processo, tipo, nome, rotulos, valor, atualizado) VALUES ('*',?,?,?,?,?) "
+                          "ON CONFLICT(processo, tipo, nome, rotulos) DO UPDATE SET valor=excluded.valor, atualizado=excluded.atualizado",
+                          (t, n, r, json.dumps(soma), agora))
+            c.execute("DELETE FROM serie WHERE processo=?", (p,))
+        c.execute("COMMIT")
+    finally:
+        c.close()
+
+def _somar(tipo: str, a, b):
+    if a is None:
+        return b
+    return [x + y for x, y in zip(a, b)] if tipo == "h" else a + b
+
+def _loop_publicar():
+    while True:
+        time.sleep(METRICAS_PUBLICAR_SECONDS)
+        try:
+            _publicar()
+        except Exception as e:
+            print(f"⚠️ Métricas: falha ao publicar: {e}")
+
+def compartilhar(db: Optional[str] = None):
+    """Passa a publicar o registro deste processo em `db` (padrão METRICAS_DB) e a exportar a soma de todos os processos (idempotente)."""
+    global _DB, _PROCESSO
+    with _LOCK:
+        if _DB is not None:
+            return
+        _DB, _PROCESSO = db or METRICAS_DB, f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    c = _conn()
+    try:
+        c.execute("PRAGMA journal_mode=WAL")
+        c.execute("""CREATE TABLE IF NOT EXISTS serie (
+                        processo   TEXT NOT NULL,
+                        tipo       TEXT NOT NULL,
+                        nome       TEXT NOT NULL,
+                        rotulos    TEXT NOT NULL,
+                        valor      TEXT NOT NULL,
+                        atualizado REAL NOT NULL,
+                        PRIMARY KEY (processo, tipo, nome, rotulos))""")
+    finally:
+        c.close()
+    threading.Thread(target=_loop_publicar, name="metricas-publicar", daemon=True).start()
+
+def _agregado() -> Tuple[Dict[Tuple[str, Rotulos], List[float]], Dict[Tuple[str, Rotulos], float], Dict[str, Dict[Rotulos, float]]]:
+    """Soma de todos os processos: histogramas e contadores (vivos + consolidado), gauges por processo (só vivos)."""
+    _publicar()
+    hist: Dict[Tuple[str, Rotulos], List[float]] = {}
+    cont: Dict[Tuple[str, Rotulos], float] = {}
+    gauges: Dict[str, Dict[Rotulos, float]] = {}
+    vivos = time.time() - 3 * METRICAS_PUBLICAR_SECONDS   # gauge de quem parou de publicar já não vale
+    c = _conn()
+    try:
+        linhas = c.execute("SELECT tipo, nome, rotulos, valor, atualizado FROM serie").fetchall()
+    finally:
+        c.close()
+    for t, n, r, v, atualizado in linhas:
+        chave = (n, tuple(tuple(x) for x in json.loads(r)))
+        v = json.loads(v)
+        if t == "h":
+            hist[chave] = _somar(t, hist.get(chave), v)
+        elif t == "c":
+            cont[chave] = cont.get(chave, 0) + v
+        elif atualizado >= vivos:
+            g = gauges.setdefault(n, {})
+            g[chave[1]] = g.get(chave[1], 0) + v
+    return hist, cont, gauges
+
+# ===== Exportação (Prometheus, formato texto 0.0.4) =====
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _fmt_rot(rot: Rotulos, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    itens = rot + extra
+    if not itens:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in itens) + "}"
+
+def _fmt_num(v: float) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def exportar() -> str:
+    somado: Optional[Dict[str, Dict[Rotulos, float]]] = None   # gauges por processo, somados (modo compartilhado)
+    if _DB is not None:
+        try:
+            hist, cont, somado = _agregado()
+        except Exception as e:
+            print(f"⚠️ Métricas: registro compartilhado indisponível, exportando só este processo: {e}")
+    if somado is None:
+        with _LOCK:
+            hist = {k: list(v) for k, v in _HIST.items()}
+            cont = dict(_CONT)
+    linhas: List[str] = []
+    def _cabecalho(nome: str, tipo: str, ajuda: str = ""):
+        linhas.append(f"# HELP {PREFIXO}_{nome} {ajuda or _AJUDA.get(nome, nome)}")
+        linhas.append(f"# TYPE {PREFIXO}_{nome} {tipo}")
+
+    for nome in sorted({k[0] for k in hist}):
+        _cabecalho(nome, "histogram")
+        for (n, rot), h in sorted(hist.items()):
+            if n != nome: continue
+            acum = 0.0
+            for le, c in zip([_fmt_num(b) for b in BALDES] + ["+Inf"], h[:len(BALDES) + 1]):
+                acum += c
+                linhas.append(f"{PREFIXO}_{nome}_bucket{_fmt_rot(rot, (('le', le),))} {_fmt_num(acum)}")
+            linhas.append(f"{PREFIXO}_{nome}_sum{_fmt_rot(rot)} {_fmt_num(round(h[-2], 6))}")
+            linhas.append(f"{PREFIXO}_{nome}_count{_fmt_rot(rot)} {_fmt_num(h[-1])}")
+
+    for nome in sorted({k[0] for k in cont}):
+        _cabecalho(nome, "counter")
+        for (n, rot), v in sorted(cont.items()):
+            if n == nome:
+                linhas.append(f"{PREFIXO}_{nome}{_fmt_rot(rot)} {_fmt_num(v)}")
+
+    for nome, (fn, ajuda, por_processo) in sorted(_GAUGES.items()):
+        v = somado.get(nome) if (por_processo and somado is not None) else _ler_gauge(nome, fn)
+        if v is None:
+            continue
+        _cabecalho(nome, "gauge", ajuda)
+        for rot, x in sorted(v.items()):
+            linhas.append(f"{PREFIXO}_{nome}{_fmt_rot(rot)} {_fmt_num(x)}")
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,185 @@
+# remetente_whatsapp.py
+# Cliente Twilio único por processo (conexões reaproveitadas) + envio concorrente com limite de taxa,
+# retry com backoff em 429/5xx e ordem preservada por destinatário.
+import os, time, random, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Optional, Dict, Any, List, Deque, Tuple
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as ErroConexao, ConnectTimeout
+from urllib3.exceptions import NewConnectionError, ConnectTimeoutError
+from twilio.rest import Client
+from twilio.http.http_client import TwilioHttpClient
+from twilio.base.exceptions import TwilioRestException
+import metricas
+
+TWILIO_API_BASE = (os.getenv("TWILIO_API_BASE") or "").strip().rstrip("/")   # ex.: http://127.0.0.1:8099 (stub local)
+
+TWILIO_MAX_PARALELO = int(os.getenv("TWILIO_MAX_PARALELO", "4"))
+TWILIO_POR_DESTINO  = int(os.getenv("TWILIO_POR_DESTINO", "1"))       # envios simultâneos por destinatário (1 = ordem garantida)
+TWILIO_RATE_PER_SEC = float(os.getenv("TWILIO_RATE_PER_SEC", "10"))
+TWILIO_TENTATIVAS   = int(os.getenv("TWILIO_TENTATIVAS", "4"))
+TWILIO_TIMEOUT      = float(os.getenv("TWILIO_TIMEOUT", "15"))
+
+class _HttpClient(TwilioHttpClient):
+    """Sessão HTTP com pool dimensionado; opcionalmente reescreve o host da API (TWILIO_API_BASE)."""
+
+    def __init__(self, base: str = "", pool: int = 8, **kw):
+        super().__init__(pool_connections=True, timeout=TWILIO_TIMEOUT, **kw)
+        self.base = base
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, *a, **kw):
+        if self.base:
+            u = urlparse(url)
+            url = self.base + u.path + (("?" + u.query) if u.query else "")
+        return super().request(method, url, *a, **kw)
+
+_CLIENT: Optional[Client] = None
+_CLIENT_LOCK = threading.Lock()
+
+def cliente() -> Optional[Client]:
+    global _CLIENT
+    sid, token = os.getenv("TWILIO_ACCOUNT_SID"), os.getenv("TWILIO_AUTH_TOKEN")   # lidos na hora (.env já carregado)
+    if not (sid and token):
+        return None
+    with _CLIENT_LOCK:
+        if _CLIENT is None:
+            try:
+                _CLIENT = Client(sid, token,
+                                 http_client=_HttpClient(TWILIO_API_BASE, pool=max(4, TWILIO_MAX_PARALELO * 2)))
+            except Exception as e:
+                print(f"⚠️ Erro ao criar cliente Twilio: {e}")
+                return None
+        return _CLIENT
+
+class _Limitador:
+    """Espaça as chamadas para no máximo `por_seg` por segundo (todas as threads do processo)."""
+
+    def __init__(self, por_seg: float):
+        self.intervalo = 1.0 / por_seg if por_seg > 0 else 0.0
+        self.proximo = 0.0
+        self.lock = threading.Lock()
+
+    def aguardar(self):
+        if not self.intervalo:
+            return
+        with self.lock:
+            agora = time.monotonic()
+            vez = max(agora, self.proximo)
+            self.proximo = vez + self.intervalo
+        if vez > agora:
+            time.sleep(vez - agora)
+
+def _antes_do_envio(e: Exception) -> bool:
+    """Falha ao abrir a conexão (DNS, recusa, connect timeout): o POST não saiu, reenviar não duplica mensagem.
+    Read timeout / conexão derrubada no meio podem ter sido entregues — esses não são repetidos."""
+    if isinstance(e, ConnectTimeout):
+        return True
+    if not isinstance(e, ErroConexao):
+        return False
+    causa = e.args[0] if e.args else None
+    return isinstance(getattr(causa, "reason", causa), (NewConnectionError, ConnectTimeoutError))
+
+def _retentavel(e: Exception) -> bool:
+    if isinstance(e, TwilioRestException):
+        return e.status == 429 or (e.status or 0) >= 500
+    return _antes_do_envio(e)
+
+class Remetente:
+    """`cliente` permite injetar um stand-in do Client (ex.: stub em bench/); padrão é o Client do processo."""
+
+    def __init__(self, max_paralelo: int = TWILIO_MAX_PARALELO, por_seg: float = TWILIO_RATE_PER_SEC,
+                 por_destino: int = TWILIO_POR_DESTINO, tentativas: int = TWILIO_TENTATIVAS, cliente=None):
+        self._ex = ThreadPoolExecutor(max_workers=max(1, max_paralelo), thread_name_prefix="twilio")
+        self._limite = _Limitador(por_seg)
+        self.por_destino = max(1, por_destino)
+        self.tentativas = max(1, tentativas)
+        self._cliente = cliente
+        self._lock = threading.Lock()
+        self._filas: Dict[str, Deque[Tuple[Dict[str, Any], Future]]] = {}
+        self._ativos: Dict[str, int] = {}
+        self._lat: Deque[float] = deque(maxlen=1000)
+        self._stats = {"enviados": 0, "falhas": 0, "retries": 0}
+
+    def enviar(self, from_: str, to: str, body: Optional[str] = None, media_url: Optional[List[str]] = None) -> Future:
+        params: Dict[str, Any] = {"from_": from_, "to": to}
+        if body: params["body"] = body
+        if media_url: params["media_url"] = media_url
+        fut: Future = Future()
+        with self._lock:
+            self._filas.setdefault(to, deque()).append((params, fut))
+            self._despachar(to)
+        return fut
+
+    def _despachar(self, to: str):
+        # chamado com self._lock
+        fila = self._filas.get(to)
+        while fila and self._ativos.get(to, 0) < self.por_destino:
+            params, fut = fila.popleft()
+            self._ativos[to] = self._ativos.get(to, 0) + 1
+            self._ex.submit(self._executar, to, params, fut)
+        if not fila:
+            self._filas.pop(to, None)
+
+    def _executar(self, to: str, params: Dict[str, Any], fut: Future):
+        try:
+            fut.set_result(self._criar(params))
+        except Exception as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._ativos[to] -= 1
+                if not self._ativos[to]:
+                    self._ativos.pop(to)
+                self._despachar(to)
+
+    def _criar(self, params: Dict[str, Any]):
+        c = self._cliente or cliente()
+        if c is None:
+            raise RuntimeError("Twilio não configurado")
+        t0 = time.perf_counter()
+        for k in range(self.tentativas):
+            self._limite.aguardar()
+            try:
+                msg = c.messages.create(**params)
+                lat = time.perf_counter() - t0
+                with self._lock:
+                    self._stats["enviados"] += 1
+                    self._lat.append(lat)
+                metricas.observar("envio", lat)
+                metricas.contar("envios_total", resultado="ok")
+                return msg
+            except Exception as e:
+                if k + 1 >= self.tentativas or not _retentavel(e):
+                    with self._lock:
+                        self._stats["falhas"] += 1
+                    metricas.observar("envio", time.perf_counter() - t0)
+                    metricas.contar("envios_total", resultado="falha")
+                    raise
+                with self._lock:
+                    self._stats["retries"] += 1
+                metricas.contar("envio_retries_total")
+                time.sleep(min(8.0, 0.5 * (2 ** k)) + random.uniform(0, 0.25))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            lat = sorted(self._lat)
+            s["pendentes"] = sum(len(f) for f in self._filas.values()) + sum(self._ativos.values())
+        if lat:
+            s["latencia_p50_ms"] = round(lat[len(lat) // 2] * 1000, 1)
+            s["latencia_p95_ms"] = round(lat[min(len(lat) - 1, int(len(lat) * 0.95))] * 1000, 1)
+        return s
+
+_REMETENTE: Optional[Remetente] = None
+
+def remetente() -> Remetente:
+    global _REMETENTE
+    with _CLIENT_LOCK:
+        if _REMETENTE is None:
+            _REMETENTE = Remetente()
+        return _REMETENTE
@@ -1,36 +1,67 @@
 # renomear_cte_mesma_pasta.py
-import os, re, sys, shutil, unicodedata, subprocess, argparse, statistics, json
-from typing import Optional, Tuple, List, Dict, Any
-import fitz  # PyMuPDF
-from PIL import Image, ImageOps, ImageFilter
-from pyzbar.pyzbar import decode as zbar_decode
-import pytesseract
-from pytesseract import Output
+from __future__ import annotations
+import os, re, sys, shutil, unicodedata, subprocess, argparse, statistics, json, threading, multiprocessing, hashlib, time, ctypes, importlib
+from concurrent.futures import ProcessPoolExecutor, CancelledError
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from collections import Counter
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple, List, Dict, Any, NamedTuple, Callable, Iterator, Union
 from urllib.parse import urlparse, parse_qs
 from dotenv import load_dotenv
-
-# ===== Ambiente / Poppler / Tesseract (diagnóstico) =====
-for p in ("/usr/bin", "/usr/local/bin"):
-    if p not in os.environ.get("PATH", ""):
-        os.environ["PATH"] = os.environ.get("PATH", "") + os.pathsep + p
-os.environ.setdefault("POPPLER_PATH", "/usr/bin")
-
-def _diag():
-    try:
-        print("🔎 Diagnóstico do ambiente")
-        print("• sys.platform:", sys.platform)
-        print("• PATH contém /usr/bin?:", "/usr/bin" in os.environ.get("PATH", ""))
-        print("• pdftoppm:", shutil.which("pdftoppm") or "NÃO ENCONTRADO")
-        if shutil.which("pdftoppm"):
-            out = subprocess.check_output(["pdftoppm","-v"], stderr=subprocess.STDOUT).decode(errors="replace").splitlines()[0]
-            print("•", out)
-        print("• tesseract:", shutil.which("tesseract") or "NÃO ENCONTRADO")
-    except Exception as e:
-        print("• Aviso: diagnóstico falhou:", e)
-_diag()
+import cache_resultados as cache
+import catalogo
+import metricas
+
+# ===== Imports pesados (carregados no primeiro uso) =====
+# Importar este módulo não carrega PyMuPDF/NumPy/PIL/zbar/Tesseract: o server e os workers do pool sobem
+# rápido e só pagam por uma biblioteca quando ela é usada de fato.
+class _Preguicoso:
+    """Stand-in de um módulo: importa no primeiro acesso a atributo e se troca pelo módulo real nos globais."""
+
+    def __init__(self, modulo: str, alias: str):
+        self._modulo, self._alias = modulo, alias
+
+    def __getattr__(self, attr):
+        mod = importlib.import_module(self._modulo)
+        globals()[self._alias] = mod
+        return getattr(mod, attr)
+
+fitz        = _Preguicoso("fitz", "fitz")   # PyMuPDF
+np          = _Preguicoso("numpy", "np")
+Image       = _Preguicoso("PIL.Image", "Image")
+ImageOps    = _Preguicoso("PIL.ImageOps", "ImageOps")
+ImageFilter = _Preguicoso("PIL.ImageFilter", "ImageFilter")
+pytesseract = _Preguicoso("pytesseract", "pytesseract")
+_pyzbar     = _Preguicoso("pyzbar.pyzbar", "_pyzbar")
+
+_TESSEROCR: Any = None   # None = não tentado; False = indisponível
+def _tesserocr():
+    """tesserocr é opcional (libtesseract em processo): o módulo, ou None se não estiver instalado."""
+    global _TESSEROCR
+    if _TESSEROCR is None:
+        try:
+            import tesserocr
+            _TESSEROCR = tesserocr
+        except Exception:
+            _TESSEROCR = False
+    return _TESSEROCR or None
+
+def aquecer():
+    """Carrega as bibliotecas pesadas agora (ex.: antes do 1º lote, para não cair no tempo da requisição)."""
+    for m in (fitz, np, Image, ImageOps, ImageFilter, pytesseract, _pyzbar):
+        if isinstance(m, _Preguicoso): getattr(m, "__name__")
+    _tesserocr()
+
+# ===== Ambiente / Poppler / Tesseract =====
+def _preparar_ambiente():
+    for p in ("/usr/bin", "/usr/local/bin"):
+        if p not in os.environ.get("PATH", ""):
+            os.environ["PATH"] = os.environ.get("PATH", "") + os.pathsep + p
+    os.environ.setdefault("POPPLER_PATH", "/usr/bin")
 
 # ===== Config =====
-load_dotenv()
+load_dotenv()   # só lê o .env (sem sobrescrever o ambiente): os parâmetros abaixo dependem dele
 
 def _dirs_from_env():
     base = os.getcwd()
@@ -43,8 +74,6 @@ def _dirs_from_env():
     return input_dir, output_dir, pendentes_dir, processed_dir, disposition, overwrite_mode
 
 (PASTA_ENTRADAS, PASTA_SAIDA, PASTA_PENDENTES, PASTA_PROCESSADOS, INPUT_DISPOSITION, OUTPUT_OVERWRITE) = _dirs_from_env()
-for pasta in (PASTA_ENTRADAS, PASTA_SAIDA, PASTA_PENDENTES, PASTA_PROCESSADOS):
-    os.makedirs(pasta, exist_ok=True)
 
 # ===== Parâmetros de OCR por ENV =====
 def _as_int(env, default):
@@ -52,8 +81,27 @@ def _as_int(env, default):
         return int(os.getenv(env, str(default)))
     except Exception:
         return default
+def _as_dpis(env, default):
+    try:
+        return tuple(int(x) for x in os.getenv(env, default).split(",") if x.strip())
+    except Exception:
+        return tuple(int(x) for x in default.split(","))
 OCR_DPI   = _as_int("OCR_DPI", 300)
+OCR_DPI_MIN  = _as_int("OCR_DPI_MIN", 200)     # 1ª tentativa do raster da página inteira
+OCR_CONF_MIN = _as_int("OCR_CONF_MIN", 60)     # confiança média abaixo disso → sobe para OCR_DPI
 FORCE_OCR = (os.getenv("FORCE_OCR", "false").lower() == "true")
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto").lower()   # auto|tesserocr|pytesseract
+PRE_BACKEND   = os.getenv("PREPROCESS_BACKEND", "numpy").lower()              # numpy|pil (pil = caminho antigo)
+PRE_BINARIZAR = (os.getenv("PREPROCESS_BINARIZE", "false").lower() == "true")   # Otsu depois da mediana
+PRE_DESKEW    = (os.getenv("PREPROCESS_DESKEW", "false").lower() == "true")     # endireita até ±3°
+
+# ===== Parâmetros de gravação (split) por ENV =====
+SPLIT_PERFIS = {
+    "fast":    {"garbage": 1, "deflate": True},   # só descarta objetos sem uso
+    "compact": {"garbage": 4, "deflate": True},   # GC + deduplicação completa por página (arquivo menor, bem mais lento)
+}
+SPLIT_PROFILE = os.getenv("SPLIT_PROFILE", "fast").lower()
+if SPLIT_PROFILE not in SPLIT_PERFIS: SPLIT_PROFILE = "fast"
 
 # ===== Modo Emissor Fixo =====
 EMISSOR_CHOICES = {
@@ -74,14 +122,18 @@ def slugify(nome: str) -> str:
     nome = re.sub(r"_+", "_", nome).strip("_")
     return nome or "DESCONHECIDO"
 
-def _resolve_emissor_fixo() -> Optional[str]:
-    if EMISSOR_FIXO_NAME:
-        return slugify(EMISSOR_FIXO_NAME)
-    if EMISSOR_FIXO_ID and EMISSOR_FIXO_ID in EMISSOR_CHOICES:
-        return slugify(EMISSOR_CHOICES[EMISSOR_FIXO_ID])
+def resolver_emissor(emissor_id: Optional[str] = None, emissor_nome: Optional[str] = None) -> Optional[str]:
+    if emissor_nome:
+        return slugify(emissor_nome)
+    if emissor_id and emissor_id in EMISSOR_CHOICES:
+        return slugify(EMISSOR_CHOICES[emissor_id])
     return None
 
-# >>> Setter em tempo de execução (chamado pelo server após o cliente escolher 1/2)
+def _resolve_emissor_fixo() -> Optional[str]:
+    return resolver_emissor(EMISSOR_FIXO_ID, EMISSOR_FIXO_NAME)
+
+# >>> Setter em tempo de execução: altera só o padrão do processo (CLI/env).
+# Lotes concorrentes devem passar OpcoesProcessamento em vez de mexer aqui.
 def set_emissor_fixo_runtime(emissor_id: Optional[str] = None, emissor_nome: Optional[str] = None):
     global EMISSOR_FIXO_ID, EMISSOR_FIXO_NAME, EMISSOR_FIXO
     if emissor_nome:
@@ -98,15 +150,45 @@ def set_emissor_fixo_runtime(emissor_id: Optional[str] = None, emissor_nome: Opt
 
 EMISSOR_FIXO = _resolve_emissor_fixo()
 
-print("🔧 PASTA_ENTRADAS:", PASTA_ENTRADAS)
-print("📂 PASTA_SAIDA:", PASTA_SAIDA)
-print("📂 PASTA_PENDENTES:", PASTA_PENDENTES)
-print("📦 PASTA_PROCESSADOS:", PASTA_PROCESSADOS)
-print("📝 OUTPUT_OVERWRITE:", OUTPUT_OVERWRITE)
-print("⚙️ INPUT_DISPOSITION:", INPUT_DISPOSITION)
-print("🖨️ OCR_DPI:", OCR_DPI)
-print("🧲 FORCE_OCR:", FORCE_OCR)
-print("🏷️ MODO:", "fixed" if EMISSOR_FIXO else "auto", "— emissor_fixo=", EMISSOR_FIXO or "-")
+# ===== Opções por lote =====
+@dataclass(frozen=True)
+class OpcoesProcessamento:
+    """Tudo que um lote precisa, passado explicitamente (jobs concorrentes não compartilham globais)."""
+    emissor_fixo: Optional[str]    # slug já resolvido; None = modo auto
+    ocr_dpi: int
+    force_ocr: bool
+    pasta_saida: str
+    pasta_pendentes: str
+    pasta_processados: str
+    overwrite: str                 # skip|replace
+    disposition: str               # move|delete|keep
+    split_perfil: str = "fast"     # fast|compact (SPLIT_PERFIS)
+
+    def com_emissor(self, emissor_id: Optional[str] = None, emissor_nome: Optional[str] = None) -> "OpcoesProcessamento":
+        return replace(self, emissor_fixo=resolver_emissor(emissor_id, emissor_nome))
+
+def opcoes_padrao(**kw) -> OpcoesProcessamento:
+    """Opções a partir da configuração do processo (env/CLI); kw sobrepõe campos."""
+    o = OpcoesProcessamento(
+        emissor_fixo=EMISSOR_FIXO, ocr_dpi=OCR_DPI, force_ocr=FORCE_OCR,
+        pasta_saida=PASTA_SAIDA, pasta_pendentes=PASTA_PENDENTES, pasta_processados=PASTA_PROCESSADOS,
+        overwrite=OUTPUT_OVERWRITE, disposition=INPUT_DISPOSITION,
+        split_perfil=SPLIT_PROFILE,
+    )
+    return replace(o, **kw) if kw else o
+
+def imprimir_config():
+    print("🔧 PASTA_ENTRADAS:", PASTA_ENTRADAS)
+    print("📂 PASTA_SAIDA:", PASTA_SAIDA)
+    print("📂 PASTA_PENDENTES:", PASTA_PENDENTES)
+    print("📦 PASTA_PROCESSADOS:", PASTA_PROCESSADOS)
+    print("📝 OUTPUT_OVERWRITE:", OUTPUT_OVERWRITE)
+    print("⚙️ INPUT_DISPOSITION:", INPUT_DISPOSITION)
+    print("🖨️ OCR_DPI:", OCR_DPI)
+    print("🧲 FORCE_OCR:", FORCE_OCR)
+    print("🏷️ MODO:", "fixed" if EMISSOR_FIXO else "auto", "— emissor_fixo=", EMISSOR_FIXO or "-")
+    if CNPJ_CANON:
+        print(f"🔒 CNPJ_CANON carregado ({len(CNPJ_CANON)} entr.)")
 
 # ===== Mapa CNPJ → Nome canônico (usado só no modo auto) =====
 def _load_cnpj_canon() -> Dict[str, str]:
@@ -129,8 +211,57 @@ def _load_cnpj_canon() -> Dict[str, str]:
     return d
 
 CNPJ_CANON: Dict[str, str] = _load_cnpj_canon()
-if CNPJ_CANON:
-    print(f"🔒 CNPJ_CANON carregado ({len(CNPJ_CANON)} entr.)")
+
+# ===== Diagnóstico (sob demanda: --diag no CLI, /diag no server) =====
+_DIAG_LIBS = (("pymupdf", "PyMuPDF", "fitz"), ("numpy", "numpy", "numpy"), ("pillow", "Pillow", "PIL.Image"),
+              ("pyzbar", "pyzbar", "pyzbar.pyzbar"), ("pytesseract", "pytesseract", "pytesseract"),
+              ("tesserocr", "tesserocr", "tesserocr"))
+
+def diagnostico(imprimir: bool = True) -> Dict[str, Any]:
+    """Binários externos, bibliotecas (versão + se carregam) e configuração efetiva. Carrega as libs pesadas."""
+    from importlib import metadata
+    _preparar_ambiente()
+    d: Dict[str, Any] = {"platform": sys.platform, "python": sys.version.split()[0],
+                         "path_usr_bin": "/usr/bin" in os.environ.get("PATH", "")}
+    for exe, args in (("pdftoppm", ["-v"]), ("tesseract", ["--version"])):
+        info: Dict[str, Any] = {"caminho": shutil.which(exe)}
+        if info["caminho"]:
+            try:
+                out = subprocess.check_output([exe, *args], stderr=subprocess.STDOUT, timeout=15)
+                info["versao"] = out.decode(errors="replace").splitlines()[0]
+            except Exception as e:
+                info["erro"] = str(e)
+        d[exe] = info
+    libs: Dict[str, Any] = {}
+    for nome, dist, modulo in _DIAG_LIBS:
+        try: versao = metadata.version(dist)
+        except Exception: versao = None
+        try:
+            importlib.import_module(modulo); libs[nome] = {"versao": versao, "ok": True}
+        except Exception as e:
+            libs[nome] = {"versao": versao, "ok": False, "erro": str(e)}
+    d["libs"] = libs
+    d["dpi_resolveu"] = dpi_stats()   # deste processo, desde que subiu
+    d["ocr_backend"] = ocr_engine().nome if libs["pytesseract"]["ok"] or libs["tesserocr"]["ok"] else None
+    d["config"] = {
+        "pasta_entradas": PASTA_ENTRADAS, "pasta_saida": PASTA_SAIDA, "pasta_pendentes": PASTA_PENDENTES,
+        "pasta_processados": PASTA_PROCESSADOS, "overwrite": OUTPUT_OVERWRITE, "disposition": INPUT_DISPOSITION,
+        "ocr_dpi": OCR_DPI, "ocr_dpi_min": OCR_DPI_MIN, "force_ocr": FORCE_OCR, "preprocess": PRE_BACKEND,
+        "split_profile": SPLIT_PROFILE, "emissor_fixo": EMISSOR_FIXO,
+        "cnpj_canon": len(CNPJ_CANON), "pdf_workers": PDF_WORKERS,
+    }
+    if imprimir:
+        print("🔎 Diagnóstico do ambiente")
+        print("• sys.platform:", d["platform"], "— python", d["python"])
+        print("• PATH contém /usr/bin?:", d["path_usr_bin"])
+        for exe in ("pdftoppm", "tesseract"):
+            i = d[exe]
+            print(f"• {exe}:", i["caminho"] or "NÃO ENCONTRADO", i.get("versao") or i.get("erro") or "")
+        for nome, i in libs.items():
+            print(f"• {nome}:", i["versao"] or "-", "ok" if i["ok"] else f"FALHOU ({i['erro']})")
+        print("• OCR backend:", d["ocr_backend"] or "-")
+        imprimir_config()
+    return d
 
 # ===== Util =====
 NEG_TOKENS = (
@@ -155,17 +286,26 @@ def identificar_tipo(texto: str) -> str:
     if "BOLETO" in up or "FICHA DE COMPENSAC" in up:        return "BOLETO"
     return "DESCONHECIDO"
 
+# qr_roi: região (x0, y0, x1, y1) em fração da página onde o QR costuma ficar (palpite do layout).
+# Tabela estática, só leitura: o que se aprende em runtime vai para _ROI_APRENDIDA.
 MODELOS = {
     "WANDER_PEREIRA_DE_MATOS": {
         "regex_emissor": re.compile(r"\n([A-Z ]{5,})\s+CNPJ:\s*[\d./-]+\s+IE:", re.I),
         "regex_cte":     re.compile(r"S[ÉE]RIE\s*1\s*(\d{3,6})", re.I),
+        "qr_roi":        (0.55, 0.0, 1.0, 0.35),
     },
     "WASHINGTON_BALTAZAR_SOUZA_LIMA_ME": {
         "regex_emissor": re.compile(r"(WASHINGTON\s+BALTAZAR\s+SOUZA\s+LIMA\s+ME)", re.I),
         "regex_cte":     re.compile(r"N[ÚU]MERO\s+(\d{3,6})", re.I),
+        "qr_roi":        (0.55, 0.0, 1.0, 0.35),
     },
 }
 
+# ===== Localização do QR por região =====
+QR_ROI_PADRAO = (0.45, 0.0, 1.0, 0.40)   # cabeçalho, lado direito (DACTE)
+QR_ROI_AMPLA  = (0.0, 0.0, 1.0, 0.55)    # metade superior inteira
+QR_DPI_ETAPAS = _as_dpis("QR_DPI_ETAPAS", "110,200")
+
 # ===== Raster / pré-processamento =====
 def page_to_pil(page: fitz.Page, dpi: Optional[int] = None) -> Image.Image:
     d = dpi or OCR_DPI
@@ -180,6 +320,88 @@ def preprocess(img: Image.Image) -> Image.Image:
     g = g.filter(ImageFilter.MedianFilter(3))
     return g
 
+# ===== Pré-processamento vetorizado (NumPy) =====
+Raster = Union["Image.Image", "np.ndarray"]   # zbar e OCR aceitam os dois
+
+def _vista_cinza(pix: fitz.Pixmap) -> np.ndarray:
+    """ndarray (h, w) uint8 sobre o buffer do pixmap cinza, sem cópia — só vale enquanto `pix` existir."""
+    return np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+def esticar_contraste(a: np.ndarray) -> np.ndarray:
+    """Equivalente ao ImageOps.autocontrast: leva [mín, máx] para [0, 255] via LUT (sempre devolve array novo)."""
+    nz = np.flatnonzero(np.bincount(a.ravel(), minlength=256))
+    lo, hi = int(nz[0]), int(nz[-1])
+    if hi <= lo:
+        return np.array(a)
+    lut = np.clip((np.arange(256) - lo) * (255.0 / (hi - lo)), 0, 255).astype(np.uint8)
+    return lut[a]
+
+def _med3(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    return np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+
+def mediana3(a: np.ndarray) -> np.ndarray:
+    """Mediana 3x3 separável (mediana-de-3 nas linhas, depois nas colunas) só com mín/máx."""
+    p = np.pad(a, 1, mode="edge")
+    h = _med3(p[:, :-2], p[:, 1:-1], p[:, 2:])
+    return _med3(h[:-2], h[1:-1], h[2:])
+
+def limiar_otsu(a: np.ndarray) -> int:
+    p = np.bincount(a.ravel(), minlength=256).astype(np.float64)
+    p /= p.sum()
+    w0 = np.cumsum(p)
+    mu = np.cumsum(p * np.arange(256))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        entre = (mu[-1] * w0 - mu) ** 2 / (w0 * (1.0 - w0))
+    return int(np.nanargmax(entre)) if np.isfinite(entre).any() else 127
+
+def binarizar(a: np.ndarray) -> np.ndarray:
+    return np.where(a > limiar_otsu(a), 255, 0).astype(np.uint8)
+
+def angulo_inclinacao(a: np.ndarray, max_graus: float = 3.0, passo: float = 0.25) -> float:
+    """Ângulo (graus) que deixa as linhas de texto mais "nítidas" na projeção horizontal (amostra 1/4)."""
+    ys, xs = np.nonzero(a[::4, ::4] < 128)
+    if ys.size < 200:
+        return 0.0
+    if ys.size > 200_000:
+        sel = np.random.default_rng(0).choice(ys.size, 200_000, replace=False)
+        ys, xs = ys[sel], xs[sel]
+    melhor, score_melhor = 0.0, -1.0
+    for ang in np.arange(-max_graus, max_graus + 1e-9, passo):
+        linhas = np.rint(ys - xs * np.tan(np.radians(ang))).astype(np.int64)
+        score = float(np.square(np.bincount(linhas - linhas.min()).astype(np.float64)).sum())
+        if score > score_melhor:
+            melhor, score_melhor = float(ang), score
+    return melhor
+
+def endireitar(a: np.ndarray) -> np.ndarray:
+    ang = angulo_inclinacao(a)
+    if abs(ang) < 0.2:
+        return a
+    return np.asarray(Image.fromarray(a).rotate(ang, resample=Image.BILINEAR, fillcolor=255))
+
+def preprocess_array(a: np.ndarray, binariza: Optional[bool] = None, deskew: Optional[bool] = None) -> np.ndarray:
+    """Contraste → (deskew) → mediana 3x3 → (Otsu). A entrada pode ser a vista do pixmap: nada é escrito nela."""
+    g = esticar_contraste(a)
+    if PRE_DESKEW if deskew is None else deskew:
+        g = endireitar(g)
+    g = mediana3(g)
+    if PRE_BINARIZAR if binariza is None else binariza:
+        g = binarizar(g)
+    return g
+
+def preprocess_pix(pix: fitz.Pixmap) -> Raster:
+    """Pixmap cinza → imagem pronta para zbar/OCR (NumPy por padrão; PREPROCESS_BACKEND=pil usa o caminho antigo)."""
+    with metricas.etapa("preprocess"):
+        if PRE_BACKEND == "pil":
+            return preprocess(Image.frombytes("L", [pix.width, pix.height], pix.samples))
+        return preprocess_array(_vista_cinza(pix))
+
+def raster_cinza(page: fitz.Page, dpi: int) -> Raster:
+    """Renderiza direto em tons de cinza (1 byte/pixel) e pré-processa lendo o buffer do pixmap."""
+    with metricas.etapa("render"):
+        pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72.0, dpi/72.0), colorspace=fitz.csGRAY, alpha=False)
+    return preprocess_pix(pix)
+
 def _digits_only(s: str) -> str:
     return re.sub(r"\D+", "", s or "")
 
@@ -199,12 +421,135 @@ def parse_chave_acesso_from_payload(payload: str) -> Optional[str]:
     m = re.search(r"(\d{44})", d)
     return m.group(1) if m else None
 
-def decode_qr_from_image(img: Image.Image) -> List[str]:
+def _zbar_entrada(img: Raster):
+    """ndarray contíguo e gravável vai para o zbar como (buffer, w, h) sem o tobytes() que o pyzbar faria."""
+    if isinstance(img, np.ndarray) and img.ndim == 2 and img.dtype == np.uint8 \
+            and img.flags.c_contiguous and img.flags.writeable:
+        return (ctypes.c_ubyte * img.size).from_buffer(img), img.shape[1], img.shape[0]
+    return img
+
+def _zbar(img: Raster, so_qr: bool = False) -> list:
     try:
-        return [r.data.decode("utf-8","replace") for r in zbar_decode(img) if r.data]
+        with metricas.etapa("zbar"):
+            entrada = _zbar_entrada(img)
+            return _pyzbar.decode(entrada, symbols=[_pyzbar.ZBarSymbol.QRCODE]) if so_qr else _pyzbar.decode(entrada)
     except Exception:
         return []
 
+_ROI_LOCK = threading.Lock()
+_ROI_APRENDIDA: Dict[str, Tuple[float, float, float, float]] = {}   # layout → região onde o último QR foi achado
+
+def _roi_qr(layout: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    with _ROI_LOCK:
+        roi = _ROI_APRENDIDA.get(layout) if layout else None
+    return roi or (MODELOS.get(layout) or {}).get("qr_roi")
+
+def decode_qr_from_image(img: Raster) -> List[str]:
+    return [r.data.decode("utf-8","replace") for r in _zbar(img) if r.data]
+
+def _render_clip(page: fitz.Page, roi: Tuple[float, float, float, float], dpi: int) -> Tuple[np.ndarray, fitz.Rect]:
+    r = page.rect
+    clip = fitz.Rect(r.x0 + roi[0]*r.width, r.y0 + roi[1]*r.height,
+                     r.x0 + roi[2]*r.width, r.y0 + roi[3]*r.height)
+    with metricas.etapa("render"):
+        pix = page.get_pixmap(matrix=fitz.Matrix(dpi/72.0, dpi/72.0), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+        return np.array(_vista_cinza(pix)), clip
+
+def _aprender_roi(layout: Optional[str], page: fitz.Page, clip: fitz.Rect, rect, dpi: int):
+    """Guarda em _ROI_APRENDIDA a região (com folga) onde o QR foi achado (por processo: cada worker aprende a sua)."""
+    if not (layout in MODELOS and rect): return
+    esc = dpi / 72.0
+    r = page.rect
+    x0 = clip.x0 + rect.left/esc; y0 = clip.y0 + rect.top/esc
+    x1 = x0 + rect.width/esc;     y1 = y0 + rect.height/esc
+    fx = max((x1 - x0) * 0.5, r.width * 0.05); fy = max((y1 - y0) * 0.5, r.height * 0.05)
+    roi = (max(0.0, (x0 - fx - r.x0) / r.width), max(0.0, (y0 - fy - r.y0) / r.height),
+           min(1.0, (x1 + fx - r.x0) / r.width), min(1.0, (y1 + fy - r.y0) / r.height))
+    with _ROI_LOCK:
+        _ROI_APRENDIDA[layout] = tuple(round(v, 3) for v in roi)
+
+def localizar_qr(page: fitz.Page, layout: Optional[str] = None) -> Tuple[Optional[str], Optional[int]]:
+    """Procura a chave no QR renderizando só recortes em DPI baixo; alarga a região/DPI a cada falha.
+    Retorna (chave, dpi) ou (None, None) se nenhum recorte decodificar (aí o chamador cai no raster da página inteira)."""
+    rois: List[Tuple[float, float, float, float]] = []
+    for roi in (_roi_qr(layout), QR_ROI_PADRAO, QR_ROI_AMPLA):
+        if roi and roi not in rois: rois.append(roi)
+    for roi in rois:
+        for dpi in QR_DPI_ETAPAS:
+            img, clip = _render_clip(page, roi, dpi)
+            for res in _zbar(img, so_qr=True):
+                chave = parse_chave_acesso_from_payload(res.data.decode("utf-8","replace") if res.data else "")
+                if chave:
+                    _aprender_roi(layout, page, clip, res.rect, dpi)
+                    print(f"🔳 QR achado no recorte {roi} a {dpi} DPI")
+                    return chave, dpi
+    return None, None
+
+# ===== Raster adaptativo da página inteira =====
+def _escada_dpi(opts_dpi: int) -> Tuple[int, ...]:
+    return (OCR_DPI_MIN, opts_dpi) if 0 < OCR_DPI_MIN < opts_dpi else (opts_dpi,)
+
+def _imagem_embutida(page: fitz.Page, dpi_alvo: int) -> Optional[Tuple[int, fitz.Rect, int]]:
+    """Scan de página inteira: a própria imagem embutida serve (sem re-renderizar) se a resolução
+    dela já estiver perto do DPI pedido. Só inspeciona; retorna (xref, bbox na página, dpi efetivo) ou None."""
+    if page.rotation:
+        return None
+    try:
+        infos = page.get_image_info(xrefs=True)
+    except Exception:
+        return None
+    if len(infos) != 1 or not infos[0].get("xref"):
+        return None
+    info = infos[0]
+    bbox = fitz.Rect(info["bbox"])
+    if bbox.get_area() < 0.9 * page.rect.get_area():
+        return None
+    a, b, c, d = info["transform"][:4]
+    if abs(b) > 1e-3 or abs(c) > 1e-3 or a <= 0 or d <= 0:
+        return None  # girada/espelhada: deixa o render resolver
+    dpi_img = int(round(info["width"] / (bbox.width / 72.0)))
+    if not (0.75 * dpi_alvo <= dpi_img <= 1.5 * dpi_alvo):
+        return None
+    return info["xref"], bbox, dpi_img
+
+def _raster_pagina(page: fitz.Page, dpi: int, emb: Optional[Tuple[int, fitz.Rect, int]] = None) -> Tuple[Raster, fitz.Rect, int]:
+    """Imagem pré-processada da página inteira: (imagem, região da página que ela cobre, dpi efetivo).
+    `emb` é o resultado de _imagem_embutida para este DPI (o chamador já consultou)."""
+    if emb:
+        xref, bbox, dpi_img = emb
+        with metricas.etapa("render"):
+            pix = fitz.Pixmap(page.parent, xref)
+            if pix.alpha:
+                pix = fitz.Pixmap(pix, 0)
+            if pix.n != 1:
+                pix = fitz.Pixmap(fitz.csGRAY, pix)
+        return preprocess_pix(pix), bbox, dpi_img
+    return raster_cinza(page, dpi), page.rect, dpi
+
+def _conf_media(data: Dict[str, Any]) -> float:
+    confs = []
+    for w, c in zip(data.get("text", []), data.get("conf", [])):
+        try: c = float(c)
+        except Exception: continue
+        if c >= 0 and (w or "").strip(): confs.append(c)
+    return sum(confs) / len(confs) if confs else 0.0
+
+# Estatística de qual DPI resolveu cada página (alimentada no processo principal a partir do MetaPagina)
+_DPI_STATS: Counter = Counter()
+_DPI_LOCK = threading.Lock()
+
+def registrar_dpi(meta: Optional["MetaPagina"]):
+    if meta is None or meta.tier in ("text", "cache"):
+        return
+    with _DPI_LOCK:
+        _DPI_STATS[f"{meta.tier}@{meta.dpi or '?'}"] += 1
+    # no /metrics (somado entre workers e sem zerar no restart do processo): base para ajustar OCR_DPI_MIN/QR_DPI_ETAPAS
+    metricas.contar("dpi_resolveu_total", tier=meta.tier, dpi=meta.dpi or "?")
+
+def dpi_stats() -> Dict[str, int]:
+    with _DPI_LOCK:
+        return dict(_DPI_STATS)
+
 def nct_from_chave(chave44: str) -> Optional[str]:
     if not (chave44 and len(chave44)==44 and chave44.isdigit()): return None
     if chave44[20:22] not in ("57","67"): return None
@@ -215,95 +560,319 @@ def cnpj_from_chave(chave44: str) -> Optional[str]:
     if not (chave44 and len(chave44)==44 and chave44.isdigit()): return None
     return chave44[6:20]
 
-# ===== OCR =====
-def ocr_text(img: Image.Image) -> str:
-    cfg = "--oem 1 --psm 6"
-    try:    return pytesseract.image_to_string(img, lang="por", config=cfg) or ""
-    except Exception:
-        try: return pytesseract.image_to_string(img, config=cfg) or ""
-        except Exception: return ""
+def dv_chave_ok(chave44: str) -> bool:
+    # módulo 11 com pesos 2..9 da direita p/ esquerda (padrão NF-e/CT-e)
+    if not (chave44 and len(chave44)==44 and chave44.isdigit()): return False
+    soma = sum(int(d) * (2 + k % 8) for k, d in enumerate(reversed(chave44[:43])))
+    resto = soma % 11
+    return int(chave44[43]) == (0 if resto < 2 else 11 - resto)
+
+# chave impressa no DACTE costuma vir em grupos de 4 dígitos ("3524 1012 ...")
+RE_CHAVE_TEXTO = re.compile(r"(?<!\d)(\d(?:[ .\u00a0]?\d){43})(?!\d)")
+
+def chave_from_texto(texto: str) -> Optional[str]:
+    # o DACTE também lista as chaves das NF-e (modelo 55) da carga: só vale chave de CT-e (57) / CT-e OS (67)
+    for m in RE_CHAVE_TEXTO.finditer(texto or ""):
+        d = _digits_only(m.group(1))
+        if d[20:22] in ("57","67") and dv_chave_ok(d): return d
+    return None
 
-def ocr_data(img: Image.Image) -> Dict[str, Any]:
-    cfg = "--oem 1 --psm 6"
-    try:
-        return pytesseract.image_to_data(img, lang="por", config=cfg, output_type=Output.DICT)
-    except Exception:
-        return {"text": [], "conf": [], "left": [], "top": [], "width": [], "height": [], "line_num": [], "block_num": [], "par_num": []}
+# ===== OCR =====
+_TSV_COLS = ("level", "page_num", "block_num", "par_num", "line_num", "word_num",
+             "left", "top", "width", "height", "conf", "text")
+
+def _data_vazio() -> Dict[str, Any]:
+    return {"text": [], "conf": [], "left": [], "top": [], "width": [], "height": [], "line_num": [], "block_num": [], "par_num": []}
+
+def _data_from_tsv(tsv: str) -> Dict[str, Any]:
+    """Converte o TSV do Tesseract no mesmo formato de image_to_data(output_type=DICT)."""
+    data: Dict[str, Any] = {k: [] for k in _TSV_COLS}
+    for ln in (tsv or "").splitlines():
+        partes = ln.split("\t", 11)
+        if len(partes) < 11 or not partes[0].isdigit():
+            continue  # cabeçalho / linha truncada
+        if len(partes) == 11: partes.append("")
+        for k, v in zip(_TSV_COLS[:10], partes[:10]):
+            data[k].append(int(v))
+        data["conf"].append(float(partes[10]))
+        data["text"].append(partes[11])
+    return data
+
+class _OcrPytesseract:
+    """Fallback: um processo `tesseract` por chamada (via pytesseract)."""
+    nome = "pytesseract"
+
+    def data(self, img: Raster) -> Dict[str, Any]:
+        cfg = "--oem 1 --psm 6"
+        try:
+            return pytesseract.image_to_data(img, lang="por", config=cfg, output_type=pytesseract.Output.DICT)
+        except Exception:
+            try: return pytesseract.image_to_data(img, config=cfg, output_type=pytesseract.Output.DICT)
+            except Exception: return _data_vazio()
+
+class _OcrTesserocr:
+    """libtesseract em processo: um handle por thread, criado uma vez (traineddata carregado uma vez)."""
+    nome = "tesserocr"
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            tc = _tesserocr()
+            kw = {"psm": tc.PSM.SINGLE_BLOCK, "oem": tc.OEM.LSTM_ONLY}
+            try:
+                api = tc.PyTessBaseAPI(lang="por", **kw)
+            except RuntimeError:
+                api = tc.PyTessBaseAPI(**kw)
+            self._local.api = api
+        return api
+
+    def data(self, img: Raster) -> Dict[str, Any]:
+        api = self._api()
+        if isinstance(img, np.ndarray):
+            # SetImageBytes só aceita bytes: uma cópia da página em cinza (1 byte/pixel), sem PIL nem arquivo
+            h, w = img.shape[:2]
+            api.SetImageBytes(np.ascontiguousarray(img).tobytes(), w, h, 1, w)
+        else:
+            api.SetImage(img)  # buffer em memória, sem arquivo temporário
+        return _data_from_tsv(api.GetTSVText(0))
+
+_OCR_ENGINE = None
+_OCR_LOCK = threading.Lock()
+
+def ocr_engine():
+    global _OCR_ENGINE
+    if _OCR_ENGINE is None:
+        with _OCR_LOCK:
+            if _OCR_ENGINE is None:
+                _preparar_ambiente()   # tesseract no PATH para o pytesseract
+                if OCR_BACKEND in ("auto", "tesserocr") and _tesserocr() is not None:
+                    _OCR_ENGINE = _OcrTesserocr()
+                else:
+                    if OCR_BACKEND == "tesserocr":
+                        print("⚠️ OCR_BACKEND=tesserocr mas tesserocr não está instalado — usando pytesseract")
+                    _OCR_ENGINE = _OcrPytesseract()
+                print("🔤 OCR backend:", _OCR_ENGINE.nome)
+    return _OCR_ENGINE
+
+def ocr_data(img: Raster) -> Dict[str, Any]:
+    eng = ocr_engine()
+    with metricas.etapa("ocr"):
+        try:
+            return eng.data(img)
+        except Exception as e:
+            print(f"⚠️ OCR {eng.nome} falhou ({e}); tentando pytesseract")
+            return _OcrPytesseract().data(img)
+
+def texto_from_data(data: Dict[str, Any]) -> str:
+    """Remonta o texto (uma linha por (block, par, line)) a partir do image_to_data."""
+    linhas: List[str] = []
+    atual: List[str] = []
+    chave_atual = None
+    for i, w in enumerate(data.get("text", [])):
+        w = (w or "").strip()
+        if not w: continue
+        k = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if k != chave_atual and atual:
+            linhas.append(" ".join(atual)); atual = []
+        chave_atual = k
+        atual.append(w)
+    if atual: linhas.append(" ".join(atual))
+    return "\n".join(linhas)
+
+def ocr_pagina(img: Raster) -> Tuple[Dict[str, Any], str]:
+    """Uma única chamada ao Tesseract: caixas por palavra + texto por linha."""
+    data = ocr_data(img)
+    return data, texto_from_data(data)
+
+def ocr_text(img: Raster) -> str:
+    return ocr_pagina(img)[1]
 
 # ===== Heurísticas =====
-def _is_bad_line(s: str) -> bool:
+ADDR_TOKENS  = ("AVENIDA", "AV ", "AV.", "RUA", "R.", "RODOVIA", "ROD.", "BR-", "BA-", "KM", "CEP", "BAIRRO", "SALA", "LOTE", "QUADRA")
+LABEL_TOKENS = ("EMITENTE", "EMISSOR", "PRESTADOR", "TRANSPORTADOR")
+_RE_PREFIXO_EMPRESA = re.compile(r"^(RAZAO\s+SOCIAL|RAZAO|EMITENTE|EMISSOR|PRESTADOR(?:\s+DE\s+SERVI[ÇC]O)?|EMPRESA)\s*[:\-]*\s*", re.I)
+_RE_CORTE_EMPRESA   = re.compile(r"\b(" + "|".join(list(ROLE_TOKENS) + ["MUNICIPIO", "CEP", "ENDERECO", "ENDEREÇO", "UF"]) + r")\b", re.I)
+_RE_NUM_ENDERECO    = re.compile(r"\b\d{2,5}\b")
+_RE_ESPACOS         = re.compile(r"\s{2,}")
+
+class _Casador:
+    """Busca todos os conjuntos de tokens (por substring, como o `in`) numa passada só: um lookahead por
+    posição com as alternativas da mais longa para a mais curta. Os tokens que casam numa mesma posição são
+    prefixos uns dos outros, então o mais longo achado traz junto todos os menores que também casariam ali."""
+
+    def __init__(self, conjuntos: Dict[str, Tuple[str, ...]]):
+        tokens = sorted({t for ts in conjuntos.values() for t in ts}, key=len, reverse=True)
+        self._re = re.compile("(?=(" + "|".join(map(re.escape, tokens)) + "))")
+        self._prefixos = {t: frozenset(p for p in tokens if t.startswith(p)) for t in tokens}
+        self.conjuntos = {k: frozenset(v) for k, v in conjuntos.items()}
+
+    def tokens(self, u: str) -> frozenset:
+        achados: set = set()
+        for m in self._re.finditer(u):
+            achados |= self._prefixos[m.group(1)]
+        return frozenset(achados)
+
+_CASADOR = _Casador({
+    "neg": NEG_TOKENS, "addr": ADDR_TOKENS, "pref": PREF_TOKENS,
+    "addr_num": ("CEP", "RUA", "AV", "KM"), "canhoto": ("DECLARO", "RECEBI", "VOLUMES"),
+    "label": LABEL_TOKENS, "dacte": ("DACTE",), "cnpj": ("CNPJ",),
+})
+_NEG, _ADDR, _PREF, _ADDR_NUM, _CANHOTO, _LABEL = (_CASADOR.conjuntos[k] for k in ("neg", "addr", "pref", "addr_num", "canhoto", "label"))
+
+@lru_cache(maxsize=8192)
+def _analisar(s: str) -> Tuple[str, frozenset]:
+    """Normaliza a linha uma vez (sem acento, maiúscula) e devolve (u, tokens achados) — memoizado."""
     u = remover_acentos(s).upper()
+    return u, _CASADOR.tokens(u)
+
+def _ruim(u: str, toks: frozenset) -> bool:
     if sum(c.isdigit() for c in u) > max(2, len(u)//4):
         return True
-    return any(tok in u for tok in NEG_TOKENS)
+    return bool(toks & _NEG)
 
-def _looks_like_address(s: str) -> bool:
-    u = remover_acentos(s).upper()
-    if any(tok in u for tok in ("AVENIDA", "AV ", "AV.", "RUA", "R.", "RODOVIA", "ROD.", "BR-", "BA-", "KM", "CEP", "BAIRRO", "SALA", "LOTE", "QUADRA")):
-        return True
-    if re.search(r"\b\d{2,5}\b", u) and ("CEP" in u or "RUA" in u or "AV" in u or "KM" in u):
+def _endereco(u: str, toks: frozenset) -> bool:
+    if toks & _ADDR:
         return True
-    return False
+    return bool(toks & _ADDR_NUM) and _RE_NUM_ENDERECO.search(u) is not None
+
+def _is_bad_line(s: str) -> bool:
+    return _ruim(*_analisar(s))
+
+def _looks_like_address(s: str) -> bool:
+    return _endereco(*_analisar(s))
 
 def _clean_company_line(s: str) -> str:
     s = s.strip(" :.-\t")
-    s = re.sub(r"^(RAZAO\s+SOCIAL|RAZAO|EMITENTE|EMISSOR|PRESTADOR(?:\s+DE\s+SERVI[ÇC]O)?|EMPRESA)\s*[:\-]*\s*", "", s, flags=re.I)
-    cut_regex = r"\b(" + "|".join(list(ROLE_TOKENS) + ["MUNICIPIO", "CEP", "ENDERECO", "ENDEREÇO", "UF"]) + r")\b"
-    s = re.split(cut_regex, remover_acentos(s), maxsplit=1, flags=re.I)[0]
-    s = re.sub(r"\s{2,}", " ", s).strip()
+    s = _RE_PREFIXO_EMPRESA.sub("", s, count=1)
+    s = _RE_CORTE_EMPRESA.split(remover_acentos(s), maxsplit=1)[0]
+    s = _RE_ESPACOS.sub(" ", s).strip()
     return s
 
 def _score_company_line(s: str) -> int:
-    u = remover_acentos(s).upper()
-    score = len(u)
-    for t in PREF_TOKENS:
-        if t in u: score += 25
-    if _is_bad_line(u) or _looks_like_address(u): score -= 200
-    if "DECLARO" in u or "RECEBI" in u or "VOLUMES" in u: score -= 300
+    u, toks = _analisar(s)
+    score = len(u) + 25 * len(toks & _PREF)
+    if _ruim(u, toks) or _endereco(u, toks): score -= 200
+    if toks & _CANHOTO: score -= 300
     return score
 
-def guess_emissor_from_data(data: Dict[str, Any], cnpj14: Optional[str]) -> Optional[str]:
+def _candidato_empresa(s: str) -> Optional[Tuple[str, int]]:
+    """Limpa a linha e, se ela não for papelada/endereço, devolve (nome, score)."""
+    cand = _clean_company_line(s)
+    if not cand: return None
+    u, toks = _analisar(cand)
+    if _ruim(u, toks) or _endereco(u, toks): return None
+    return cand, _score_company_line(cand)
+
+class LinhasOcr(NamedTuple):
+    """Linhas do OCR, uma posição por linha (block, par, line) na ordem em que aparecem."""
+    chave: List[Tuple[int, int, int]]
+    top: List[int]
+    bottom: List[int]
+    left: List[int]
+    right: List[int]
+    inicio: List[int]        # fatia [inicio, fim) de `palavras`/`xs` que pertence à linha
+    fim: List[int]
+    palavras: List[str]      # palavras com conf >= 35, agrupadas por linha
+    xs: List[float]          # centro x de cada palavra
+
+    def texto(self, i: int) -> str:
+        return " ".join(self.palavras[self.inicio[i]:self.fim[i]])
+
+def _linhas_ocr_dict(data: Dict[str, Any], conf_min: int = 35) -> LinhasOcr:
+    """Agrupa palavra a palavra num dict por (block, par, line): o mais rápido em páginas comuns."""
     n = len(data.get("text", []))
-    if n == 0: return None
-
-    # monta linhas por (block, par, line)
-    lines: Dict[Tuple[int,int,int], Dict[str, Any]] = {}
-    page_h = 0
+    grupos: Dict[Tuple[int, int, int], List[Tuple[str, int, int, int, int]]] = {}
     for i in range(n):
         txt = (data["text"][i] or "").strip()
         if not txt: continue
-        conf_raw = str(data.get("conf", ["-1"])[i])
-        try: conf = int(float(conf_raw))
-        except: conf = -1
-        if conf < 35: continue
-        b = int(data.get("block_num", [0])[i] or 0)
-        p = int(data.get("par_num", [0])[i] or 0)
-        ln = int(data.get("line_num", [0])[i] or 0)
-        key = (b,p,ln)
-        rec = lines.setdefault(key, {"words": [], "xs": [], "left": 10**9, "right": -1, "top": 10**9, "bottom": -1, "block": b})
-        left = int(data.get("left", [0])[i] or 0)
-        width = int(data.get("width", [0])[i] or 0)
-        top = int(data.get("top", [0])[i] or 0)
-        h   = int(data.get("height", [0])[i] or 0)
-        x_center = left + width/2.0
-        rec["words"].append(txt)
-        rec["xs"].append(x_center)
-        rec["left"] = min(rec["left"], left)
-        rec["right"] = max(rec["right"], left + width)
-        rec["top"] = min(rec["top"], top)
-        rec["bottom"] = max(rec["bottom"], top+h)
-        page_h = max(page_h, rec["bottom"])
-
-    # âncoras
-    dacte_top = None
-    label_blocks: set[int] = set()
-    for (b,p,ln), rec in lines.items():
-        uline = remover_acentos(" ".join(rec["words"])).upper()
-        if "DACTE" in uline:
-            if dacte_top is None or rec["top"] < dacte_top:
-                dacte_top = rec["top"]
-        if any(tok in uline for tok in ("EMITENTE", "EMISSOR", "PRESTADOR", "TRANSPORTADOR")):
-            label_blocks.add(b)
+        try: conf = int(float(str(data.get("conf", ["-1"])[i])))
+        except Exception: conf = -1
+        if conf < conf_min: continue
+        k = (int(data.get("block_num", [0])[i] or 0), int(data.get("par_num", [0])[i] or 0), int(data.get("line_num", [0])[i] or 0))
+        grupos.setdefault(k, []).append((txt, int(data.get("left", [0])[i] or 0), int(data.get("width", [0])[i] or 0),
+                                         int(data.get("top", [0])[i] or 0), int(data.get("height", [0])[i] or 0)))
+    L = LinhasOcr([], [], [], [], [], [], [], [], [])
+    for k, ws in grupos.items():
+        L.chave.append(k); L.inicio.append(len(L.palavras))
+        L.top.append(min(w[3] for w in ws)); L.bottom.append(max(w[3] + w[4] for w in ws))
+        L.left.append(min(w[1] for w in ws)); L.right.append(max(w[1] + w[2] for w in ws))
+        L.palavras.extend(w[0] for w in ws); L.xs.extend(w[1] + w[2] / 2.0 for w in ws)
+        L.fim.append(len(L.palavras))
+    return L
+
+def _coluna(data: Dict[str, Any], k: str, n: int, dtype) -> np.ndarray:
+    v = data.get(k)
+    if v is None or len(v) != n:
+        return np.zeros(n, dtype=dtype)
+    try:
+        return np.asarray(v, dtype=dtype)
+    except (TypeError, ValueError):   # valores soltos (str/None) — converte um a um
+        conv = []
+        for x in v:
+            try: conv.append(float(str(x)) if x not in (None, "") else 0)
+            except ValueError: conv.append(-1 if k == "conf" else 0)
+        return np.asarray(conv, dtype=np.float64).astype(dtype)
+
+def _linhas_ocr_colunas(data: Dict[str, Any], conf_min: int = 35) -> LinhasOcr:
+    """Mesmo agrupamento com operações vetorizadas: compensa em páginas densas, com centenas de palavras."""
+    textos = data.get("text", [])
+    n = len(textos)
+    palavras_todas = np.array([(w or "").strip() for w in textos], dtype=object)
+    conf = _coluna(data, "conf", n, np.float64)
+    ok = np.flatnonzero((palavras_todas != "") & (np.trunc(conf) >= conf_min)) if n else np.zeros(0, dtype=np.int64)
+    if not ok.size:
+        return LinhasOcr([], [], [], [], [], [], [], [], [])
+    chave = np.stack([_coluna(data, k, n, np.int64)[ok] for k in ("block_num", "par_num", "line_num")], axis=1)
+    k1 = (chave[:, 0] << 42) | (chave[:, 1] << 21) | chave[:, 2]   # chave única em 1 inteiro (índices < 2^21)
+    left, width = _coluna(data, "left", n, np.int64)[ok], _coluna(data, "width", n, np.int64)[ok]
+    top, height = _coluna(data, "top", n, np.int64)[ok], _coluna(data, "height", n, np.int64)[ok]
+
+    # id da linha = ordem da 1ª aparição; palavras ordenadas por linha mantendo a ordem original
+    _, primeira, inv = np.unique(k1, return_index=True, return_inverse=True)
+    rank = np.empty(primeira.size, dtype=np.int64)
+    rank[np.argsort(primeira, kind="stable")] = np.arange(primeira.size)
+    lid = rank[inv]
+    ordem = np.argsort(lid, kind="stable")
+    lid_o = lid[ordem]
+    inicio = np.flatnonzero(np.r_[True, lid_o[1:] != lid_o[:-1]])
+    fim = np.r_[inicio[1:], lid_o.size]
+
+    left, width, top, height = left[ordem], width[ordem], top[ordem], height[ordem]
+    return LinhasOcr(
+        chave=[tuple(k) for k in chave[ordem][inicio].tolist()],
+        top=np.minimum.reduceat(top, inicio).tolist(),
+        bottom=np.maximum.reduceat(top + height, inicio).tolist(),
+        left=np.minimum.reduceat(left, inicio).tolist(),
+        right=np.maximum.reduceat(left + width, inicio).tolist(),
+        inicio=inicio.tolist(), fim=fim.tolist(),
+        palavras=palavras_todas[ok][ordem].tolist(),
+        xs=(left + width / 2.0).tolist(),
+    )
+
+# Abaixo de HEURISTICA_NUMPY_MIN palavras o custo fixo das colunas NumPy passa do que elas economizam
+HEURISTICA_NUMPY_MIN = _as_int("HEURISTICA_NUMPY_MIN", 50)
+
+def linhas_ocr(data: Dict[str, Any], conf_min: int = 35) -> LinhasOcr:
+    """Agrupa as palavras do image_to_data por (block, par, line); a montagem escolhida depende da densidade."""
+    n = len(data.get("text") or [])
+    return (_linhas_ocr_colunas if n >= HEURISTICA_NUMPY_MIN else _linhas_ocr_dict)(data, conf_min)
+
+def guess_emissor_from_data(data: Dict[str, Any], cnpj14: Optional[str]) -> Optional[str]:
+    if not data.get("text"): return None
+    L = linhas_ocr(data)
+    nl = len(L.top)
+    if nl == 0: return None
+    page_h = max(L.bottom)
+    indice = {k: i for i, k in enumerate(L.chave)}
+
+    # uma normalização por linha; âncoras viram índices
+    analises = [_analisar(L.texto(i)) for i in range(nl)]
+    dacte = [L.top[i] for i, (_, toks) in enumerate(analises) if "DACTE" in toks]
+    dacte_top = min(dacte) if dacte else None
+    label_blocks = {L.chave[i][0] for i, (_, toks) in enumerate(analises) if toks & _LABEL}
 
     # CNPJs detectados
     def _fmt_cnpj(c):
@@ -311,71 +880,73 @@ def guess_emissor_from_data(data: Dict[str, Any], cnpj14: Optional[str]) -> Opti
         return f"{c[0:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:14]}"
     cnpj_fmt = _fmt_cnpj(cnpj14)
 
-    candidates = []
-    for key, rec in lines.items():
-        line_text = " ".join(rec["words"])
-        u = remover_acentos(line_text).upper()
-        if "CNPJ" in u or (cnpj14 and cnpj14 in _digits_only(u)) or (cnpj_fmt and cnpj_fmt in u):
-            candidates.append((key, rec))
-
-    if not candidates:
+    cand = [i for i, (u, toks) in enumerate(analises)
+            if "CNPJ" in toks or (cnpj14 and cnpj14 in _digits_only(u)) or (cnpj_fmt and cnpj_fmt in u)]
+    if not cand:
         return None
 
-    by_label = [(k,r) for (k,r) in candidates if r.get("block") in label_blocks]
-    if by_label:
-        candidates = by_label
-
-    candidates.sort(key=lambda kv: kv[1]["top"])
+    if label_blocks:
+        cand = [i for i in cand if L.chave[i][0] in label_blocks] or cand
+    cand.sort(key=lambda i: L.top[i])
     if dacte_top is not None:
-        near = [kv for kv in candidates if kv[1]["top"] <= dacte_top + 220]
-        if near:
-            candidates = near
-
-    top_half = [kv for kv in candidates if kv[1]["top"] <= page_h * 0.60]
-    if top_half:
-        candidates = top_half
+        cand = [i for i in cand if L.top[i] <= dacte_top + 220] or cand
+    cand = [i for i in cand if L.top[i] <= page_h * 0.60] or cand
 
-    (b,p,ln), cnpj_rec = candidates[0]
-    cnpj_x_med = statistics.median(cnpj_rec["xs"]) if cnpj_rec["xs"] else (cnpj_rec["left"] + cnpj_rec["right"]) / 2.0
+    c0 = cand[0]
+    b, p, ln = L.chave[c0]
+    xs0 = L.xs[L.inicio[c0]:L.fim[c0]]
+    cnpj_x_med = statistics.median(xs0) if xs0 else (L.left[c0] + L.right[c0]) / 2.0
 
     best_name = None
     best_score = -10**9
 
     for offset in (1,2,3,4,5):
-        prev_key = (b,p,ln - offset)
-        prev = lines.get(prev_key)
-        if not prev: continue
-        if prev["top"] > page_h * 0.60:
+        i = indice.get((b, p, ln - offset))
+        if i is None: continue
+        if L.top[i] > page_h * 0.60:
             continue
-        words_filtered = [w for w,x in zip(prev["words"], prev["xs"]) if x <= cnpj_x_med + 40]
-        cand = _clean_company_line(" ".join(words_filtered)) if words_filtered else _clean_company_line(" ".join(prev["words"]))
-        if not cand: continue
-        if _is_bad_line(cand) or _looks_like_address(cand): continue
-        sc = _score_company_line(cand)
-        if sc > best_score:
-            best_score, best_name = sc, cand
+        ini, fim = L.inicio[i], L.fim[i]
+        palavras = L.palavras[ini:fim]
+        perto = [w for w, x in zip(palavras, L.xs[ini:fim]) if x <= cnpj_x_med + 40]
+        r = _candidato_empresa(" ".join(perto or palavras))
+        if r and r[1] > best_score:
+            best_name, best_score = r
 
     if not best_name:
         cutoff = page_h * 0.30
-        for (kb,kp,kl), rec in sorted(lines.items(), key=lambda kv: kv[1]["top"]):
-            if rec["top"] > cutoff: break
-            cand = _clean_company_line(" ".join(rec["words"]))
-            if not cand or len(remover_acentos(cand)) < 8: continue
-            if _is_bad_line(cand) or _looks_like_address(cand): continue
-            sc = _score_company_line(cand)
-            if sc > best_score:
-                best_score, best_name = sc, cand
+        for i in sorted(range(nl), key=lambda i: L.top[i]):
+            if L.top[i] > cutoff: break
+            r = _candidato_empresa(L.texto(i))
+            if not r or len(remover_acentos(r[0])) < 8: continue
+            if r[1] > best_score:
+                best_name, best_score = r
 
     return best_name
 
+# ===== Gravação das páginas (split) =====
+def salvar_pagina(doc: fitz.Document, indice: int, destino: str, perfil: str = "fast") -> float:
+    """Grava a página `indice` em seu próprio PDF com o perfil de SPLIT_PERFIS. Retorna os ms gastos."""
+    kw = SPLIT_PERFIS.get(perfil, SPLIT_PERFIS["fast"])
+    t0 = time.perf_counter()
+    try:
+        nova = fitz.open()
+        try:
+            nova.insert_pdf(doc, from_page=indice, to_page=indice)
+            nova.save(destino, **kw)
+        finally:
+            nova.close()
+    finally:
+        metricas.observar("salvar", time.perf_counter() - t0)
+    return (time.perf_counter() - t0) * 1000
+
 # ===== Disposição da entrada =====
-def _dispor_entrada(caminho_pdf: str):
+def _dispor_entrada(caminho_pdf: str, opts: OpcoesProcessamento):
     try:
-        if INPUT_DISPOSITION == "delete":
+        if opts.disposition == "delete":
             os.remove(caminho_pdf); print(f"🗑️ Entrada removida: {os.path.basename(caminho_pdf)}")
-        elif INPUT_DISPOSITION == "move":
-            os.makedirs(PASTA_PROCESSADOS, exist_ok=True)
-            destino = os.path.join(PASTA_PROCESSADOS, os.path.basename(caminho_pdf))
+        elif opts.disposition == "move":
+            os.makedirs(opts.pasta_processados, exist_ok=True)
+            destino = os.path.join(opts.pasta_processados, os.path.basename(caminho_pdf))
             if os.path.exists(destino):
                 base, ext = os.path.splitext(destino); k = 1
                 while os.path.exists(f"{base}__{k}{ext}"): k += 1
@@ -387,50 +958,122 @@ def _dispor_entrada(caminho_pdf: str):
         print(f"⚠️ Falha ao dispor entrada: {e}")
 
 # ===== Núcleo =====
-def extrair_meta_pagina(pagina: fitz.Page) -> Tuple[str, str, str]:
-    # 1) Texto embutido (para número via modelos) — nome pode ser ignorado se modo fixo
-    texto = pagina.get_text("text") or ""
+class MetaPagina(NamedTuple):
+    tipo: str
+    emissor: str
+    numero: str
+    tier: str                    # text|qr|ocr — etapa que resolveu a página
+    chave: Optional[str] = None
+    dpi: Optional[int] = None    # DPI do raster que resolveu (qr/ocr)
+
+def _meta_resolvida(m: MetaPagina) -> bool:
+    """CT-e com número e emissor: só isso vai para o cache (pendente pode ser falha transitória do OCR)."""
+    return m.tipo == "CTE" and m.numero != "000" and m.emissor != "EMISSOR_DESCONHECIDO"
+
+def _decidir_nome(nome_emissor_auto: str, chave: Optional[str], opts: OpcoesProcessamento) -> Tuple[str, str]:
+    if opts.emissor_fixo:
+        return opts.emissor_fixo, "fixed"
+    cnpj14 = cnpj_from_chave(chave) if chave else None
+    nome_canon = CNPJ_CANON.get(cnpj14) if cnpj14 else None
+    if nome_canon:
+        return slugify(nome_canon), "canon"
+    return nome_emissor_auto, "ocr"
+
+def extrair_meta_pagina(pagina: fitz.Page, opts: Optional[OpcoesProcessamento] = None) -> MetaPagina:
+    opts = opts or opcoes_padrao()
+    # 1) Texto embutido: modelos + chave de 44 dígitos impressa — sem raster se bastar
+    with metricas.etapa("texto"):
+        texto = pagina.get_text("text") or ""
     tipo_doc = identificar_tipo(texto)
     has_text = bool(texto.strip())
     numero_doc = "000"
     nome_emissor_auto = "EMISSOR_DESCONHECIDO"
+    chave = chave_from_texto(texto) if has_text else None
+    tier = "text"
+    layout = opts.emissor_fixo if opts.emissor_fixo in MODELOS else None
 
-    mode = "fixed" if EMISSOR_FIXO else "auto"
-    print(f"🧭 Estratégia: mode={mode} has_text={has_text} force_ocr={FORCE_OCR}")
+    mode = "fixed" if opts.emissor_fixo else "auto"
+    print(f"🧭 Estratégia: mode={mode} has_text={has_text} force_ocr={opts.force_ocr}")
 
     # Se texto embutido e bater com modelos, extrai NÚMERO (nome só se auto)
     if tipo_doc == "CTE" and has_text:
-        for _, regras in MODELOS.items():
+        for nome_modelo, regras in MODELOS.items():
             if regras["regex_cte"].search(texto) or regras["regex_emissor"].search(texto):
+                layout = nome_modelo
                 m_num = regras["regex_cte"].search(texto)
                 if m_num:
                     numero_doc = str(int(m_num.group(1)))
-                if not EMISSOR_FIXO:
+                if not opts.emissor_fixo:
                     m_emp = regras["regex_emissor"].search(texto)
                     if m_emp:
                         nome_emissor_auto = slugify(m_emp.group(1))
                 print("→ Caminho: TEXT-EMBUTIDO/MODELO (número coletado)")
 
-    # 2) Raster + QR para número (prioritário)
-    img = page_to_pil(pagina, dpi=OCR_DPI)
-    img_p = preprocess(img)
-    chave = None
-    for payload in decode_qr_from_image(img_p):
-        c = parse_chave_acesso_from_payload(payload)
-        if c: chave = c; break
     nct = nct_from_chave(chave) if chave else None
     if nct:
         numero_doc = nct
         tipo_doc = "CTE"
 
-    # 3) Se ainda sem número, OCR texto e tenta heurística (auto) — nome só se auto
-    if numero_doc == "000":
-        ocr = ocr_text(img_p)
+    nome_emissor, fonte_nome = _decidir_nome(nome_emissor_auto, chave, opts)
+    if tipo_doc == "CTE" and numero_doc != "000" and nome_emissor != "EMISSOR_DESCONHECIDO" and not opts.force_ocr:
+        print(f"→ Nome: {nome_emissor} (fonte={fonte_nome}); nCT={numero_doc}; tier=text")
+        metricas.contar("nome_fonte_total", fonte=fonte_nome)
+        return MetaPagina(tipo_doc, nome_emissor, numero_doc, "text", chave)
+
+    # 2) QR para número (prioritário): recortes em DPI baixo, depois a página inteira subindo o DPI
+    escada = _escada_dpi(opts.ocr_dpi)
+    rasters: Dict[Tuple[str, int], Tuple[Raster, fitz.Rect, int]] = {}
+    def _rasters() -> Iterator[Tuple[Raster, fitz.Rect, int]]:
+        """Um raster por degrau da escada, identificado pela imagem que sai dele (xref embutido ou DPI de render):
+        um scan de 300 DPI serve tanto ao degrau 200 quanto ao 300 — o degrau repetido é pulado, não reprocessado."""
+        usados = set()
+        for dpi in escada:
+            emb = _imagem_embutida(pagina, dpi)
+            k = ("xref", emb[0]) if emb else ("dpi", dpi)
+            if k in usados: continue
+            usados.add(k)
+            if k not in rasters: rasters[k] = _raster_pagina(pagina, dpi, emb)
+            yield rasters[k]
+
+    dpi_res: Optional[int] = None
+    chave_qr, dpi_qr = localizar_qr(pagina, layout)
+    if not chave_qr:
+        for img_p, regiao, dpi_efetivo in _rasters():
+            for res in _zbar(img_p):
+                c = parse_chave_acesso_from_payload(res.data.decode("utf-8","replace") if res.data else "")
+                if c:
+                    chave_qr, dpi_qr = c, dpi_efetivo
+                    _aprender_roi(layout, pagina, regiao, res.rect, dpi_efetivo)
+                    break
+            if chave_qr: break
+    nct = nct_from_chave(chave_qr) if chave_qr else None
+    if chave_qr:
+        chave = chave_qr
+    if nct:
+        numero_doc = nct
+        tipo_doc = "CTE"
+        tier = "qr"
+        dpi_res = dpi_qr
+
+    # 3) Se ainda sem número (ou force_ocr), OCR texto e tenta heurística (auto) — nome só se auto
+    if numero_doc == "000" or opts.force_ocr:
+        # DPI baixo primeiro; sobe só se a confiança média do Tesseract ficar abaixo de OCR_CONF_MIN
+        melhor = None
+        for img_p, _, dpi_efetivo in _rasters():
+            data, ocr = ocr_pagina(img_p)
+            conf = _conf_media(data)
+            if melhor is None or conf > melhor[2]:
+                melhor = (data, ocr, conf, dpi_efetivo)
+            if conf >= OCR_CONF_MIN: break
+            print(f"🔁 OCR conf={conf:.0f} a {dpi_efetivo} DPI (< {OCR_CONF_MIN})")
+        data, ocr, _, dpi_ocr = melhor
+        if numero_doc == "000":
+            tier = "ocr"; dpi_res = dpi_ocr
         if tipo_doc == "DESCONHECIDO":
             tipo_doc = identificar_tipo(ocr)
-        if not EMISSOR_FIXO:
-            data = ocr_data(img_p)
-            nome_guess = guess_emissor_from_data(data, cnpj_from_chave(chave) if chave else None) or ""
+        if not opts.emissor_fixo:
+            with metricas.etapa("heuristica"):
+                nome_guess = guess_emissor_from_data(data, cnpj_from_chave(chave) if chave else None) or ""
             if not nome_guess and ocr:
                 linhas = [l.strip() for l in ocr.splitlines() if l.strip()]
                 for i,l in enumerate(linhas):
@@ -443,76 +1086,295 @@ def extrair_meta_pagina(pagina: fitz.Page) -> Tuple[str, str, str]:
             nome_emissor_auto = slugify(nome_guess) if nome_guess else nome_emissor_auto
 
     # 4) Decide o nome conforme modo
-    if EMISSOR_FIXO:
-        nome_emissor = EMISSOR_FIXO; fonte_nome = "fixed"
-    else:
-        cnpj14 = cnpj_from_chave(chave) if chave else None
-        nome_canon = CNPJ_CANON.get(cnpj14) if cnpj14 else None
-        if nome_canon:
-            nome_emissor = slugify(nome_canon); fonte_nome = "canon"
-        else:
-            nome_emissor = nome_emissor_auto; fonte_nome = "ocr"
-    print(f"→ Nome: {nome_emissor} (fonte={fonte_nome}); nCT={numero_doc}")
+    nome_emissor, fonte_nome = _decidir_nome(nome_emissor_auto, chave, opts)
+    print(f"→ Nome: {nome_emissor} (fonte={fonte_nome}); nCT={numero_doc}; tier={tier}")
+    metricas.contar("nome_fonte_total", fonte=fonte_nome)
 
-    return (tipo_doc, nome_emissor, numero_doc)
-
-def processar_pdf(caminho_pdf: str) -> List[str]:
-    print(f"\n📄 Processando: {os.path.basename(caminho_pdf)}")
-    saidas_cte: List[str] = []
-    try:
-        doc = fitz.open(caminho_pdf)
-    except Exception as e:
-        print(f"⚠️ Erro ao abrir '{caminho_pdf}': {e}"); return saidas_cte
+    return MetaPagina(tipo_doc, nome_emissor, numero_doc, tier, chave, dpi_res)
 
+# ===== Cache por conteúdo =====
+def _modo_cache(opts: OpcoesProcessamento) -> str:
+    if opts.emissor_fixo:
+        modo = f"fixed:{opts.emissor_fixo}"
+    else:
+        modo = "auto:" + hashlib.sha1(json.dumps(CNPJ_CANON, sort_keys=True).encode()).hexdigest()[:8]
+    return f"{modo}|dpi={opts.ocr_dpi}|ocr={int(opts.force_ocr)}|v1"
+
+def _hash_pagina(doc: fitz.Document, pagina: fitz.Page) -> str:
+    """Hash do content stream da página + imagens referenciadas (em scans o stream é só 'q ... Do Q')."""
+    h = hashlib.sha256()
+    h.update(f"{tuple(pagina.rect)}|{pagina.rotation}".encode())
+    h.update(pagina.read_contents() or b"")
+    for img in pagina.get_images(full=True):
+        try: h.update(doc.xref_stream_raw(img[0]) or b"")
+        except Exception: h.update(str(img[0]).encode())
+    return h.hexdigest()
+
+def _meta_do_cache(v: Dict[str, Any]) -> MetaPagina:
+    return MetaPagina(v["tipo"], v["emissor"], v["numero"], "cache", v.get("chave"))
+
+def _consultar_cache(caminho_pdf: str, doc: fitz.Document, modo: str) -> Tuple[Dict[int, MetaPagina], Tuple[Optional[str], List[str]]]:
+    """Procura o arquivo inteiro e depois cada página. Retorna (páginas resolvidas, (hash_arquivo, hashes_páginas))."""
+    resolvidas: Dict[int, MetaPagina] = {}
+    dig_arq: Optional[str] = None
+    dig_pags: List[str] = []
+    t0 = time.perf_counter()
     try:
+        dig_arq = cache.sha256_arquivo(caminho_pdf)
+        hit = cache.obter("arquivo", dig_arq, modo)
+        metas = [_meta_do_cache(v) for v in hit] if hit and len(hit) == doc.page_count else []
+        if metas and all(_meta_resolvida(m) for m in metas):   # entradas pendentes gravadas por versões antigas: reprocessa
+            print(f"♻️ Cache: {os.path.basename(caminho_pdf)} já processado antes")
+            metricas.observar("cache", time.perf_counter() - t0)
+            return dict(enumerate(metas)), (dig_arq, [])
         for i in range(doc.page_count):
+            d = _hash_pagina(doc, doc.load_page(i))
+            dig_pags.append(d)
+            v = cache.obter("pagina", d, modo)
+            m = _meta_do_cache(v) if v else None
+            if m and _meta_resolvida(m): resolvidas[i] = m
+    except Exception as e:
+        print(f"⚠️ Cache ignorado para {os.path.basename(caminho_pdf)}: {e}")
+    metricas.observar("cache", time.perf_counter() - t0)
+    return resolvidas, (dig_arq, dig_pags)
+
+def _registrar_cache(digests: Tuple[Optional[str], List[str]], resultados: List[Optional[Tuple[MetaPagina, str]]], modo: str):
+    dig_arq, dig_pags = digests
+    ok = [r is not None and _meta_resolvida(r[0]) for r in resultados]
+    valores = [{**r[0]._asdict(), "nome": r[1]} if k else None for r, k in zip(resultados, ok)]
+    for i, v in enumerate(valores):
+        if v and v["tier"] != "cache" and i < len(dig_pags):
+            cache.gravar("pagina", dig_pags[i], modo, v)
+    if dig_arq and valores and all(ok) and any(v["tier"] != "cache" for v in valores):
+        cache.gravar("arquivo", dig_arq, modo, valores)
+
+# ===== Execução paralela por página =====
+# Cada worker reabre o PDF pelo caminho e extrai só a página pedida (nada de fitz é serializado).
+PDF_WORKERS    = _as_int("PDF_WORKERS", os.cpu_count() or 1)
+PDF_POOL_START = os.getenv("PDF_POOL_START", "spawn")   # spawn|forkserver|fork
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+_DOC_WORKER: Dict[str, Any] = {}   # último PDF aberto neste worker: {"chave": (caminho, mtime), "doc": fitz.Document}
+
+def _pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(PDF_POOL_START))
+            print(f"🧵 Pool de páginas iniciado: {PDF_WORKERS} worker(s) ({PDF_POOL_START})")
+        return _POOL
+
+def _descartar_pool(quebrado: ProcessPoolExecutor):
+    """Desliga `quebrado` se ele ainda for o pool atual. Outra thread (job) pode já ter trocado por um pool novo,
+    com páginas dela em andamento — esse não é tocado."""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is quebrado:
+            try: _POOL.shutdown(wait=False, cancel_futures=True)
+            except Exception: pass
+            _POOL = None
+
+def _extrair_pagina_worker(caminho_pdf: str, indice: int, opts: OpcoesProcessamento) -> Tuple[MetaPagina, metricas.Coletor]:
+    """Roda no worker do pool; os tempos/contadores da página voltam junto (ver metricas.absorver)."""
+    chave = (caminho_pdf, os.path.getmtime(caminho_pdf))
+    if _DOC_WORKER.get("chave") != chave:
+        antigo = _DOC_WORKER.pop("doc", None)
+        if antigo is not None: antigo.close()
+        _DOC_WORKER["doc"] = fitz.open(caminho_pdf)
+        _DOC_WORKER["chave"] = chave
+    with metricas.coletando() as col:
+        meta = extrair_meta_pagina(_DOC_WORKER["doc"].load_page(indice), opts)
+    return meta, col
+
+def _agendar_paginas(caminho_pdf: str, doc: fitz.Document, opts: OpcoesProcessamento, paralelo: bool,
+                     resolvidas: Optional[Dict[int, MetaPagina]] = None) -> List[Callable[[], MetaPagina]]:
+    """Uma função por página que devolve o MetaPagina (cache, futuro do pool ou extração local sob demanda)."""
+    resolvidas = resolvidas or {}
+    if not paralelo:
+        return [(lambda i=i: resolvidas[i] if i in resolvidas else extrair_meta_pagina(doc.load_page(i), opts))
+                for i in range(doc.page_count)]
+    def _local(i: int) -> MetaPagina:
+        return extrair_meta_pagina(doc.load_page(i), opts)
+    def _submeter(pool: ProcessPoolExecutor, i: int):
+        try:
+            return pool.submit(_extrair_pagina_worker, caminho_pdf, i, opts)
+        except (BrokenProcessPool, RuntimeError):   # quebrado, ou desligado por outra thread depois do _pool()
+            _descartar_pool(pool)
+            return None
+    pool = _pool()
+    obter: List[Callable[[], MetaPagina]] = []
+    for i in range(doc.page_count):
+        if i in resolvidas:
+            obter.append(lambda m=resolvidas[i]: m); continue
+        fut = _submeter(pool, i)
+        if fut is None:
+            pool = _pool()   # uma tentativa num pool novo; falhou de novo → esta página sai local
+            fut = _submeter(pool, i)
+        if fut is None:
+            obter.append(lambda i=i: _local(i)); continue
+        def _resultado(fut=fut, pool=pool, i=i) -> MetaPagina:
             try:
-                pagina = doc.load_page(i)
-                tipo_doc, nome_emissor, numero_doc = extrair_meta_pagina(pagina)
-                if not numero_doc.isdigit(): numero_doc = "000"
-
-                nome_final = f"{slugify(nome_emissor)}_{tipo_doc}_{numero_doc}.pdf"
-                is_cte_ok = (tipo_doc == "CTE" and nome_emissor != "EMISSOR_DESCONHECIDO" and numero_doc != "000")
-                destino_base = PASTA_SAIDA if is_cte_ok else PASTA_PENDENTES
-                destino = os.path.join(destino_base, nome_final)
-
-                if os.path.exists(destino) and OUTPUT_OVERWRITE == "skip":
-                    print(f"⏭️  Saída já existe, pulando: {os.path.basename(destino)}")
-                    if is_cte_ok: saidas_cte.append(os.path.basename(destino))
-                    continue
-
-                nova = fitz.open(); nova.insert_pdf(doc, from_page=i, to_page=i)
-                nova.save(destino, deflate=True, garbage=4); nova.close()
-
-                if is_cte_ok:
-                    print(f"✅ Página {i+1} (CTE) salva: {os.path.basename(destino)}")
-                    saidas_cte.append(os.path.basename(destino))
-                else:
-                    print(f"➜ Página {i+1} movida p/ pendentes: {os.path.basename(destino)}")
-            except Exception as e_pag:
-                print(f"⚠️ Erro na página {i+1}: {e_pag}")
-    finally:
-        try: doc.close()
-        except Exception: pass
-
-    _dispor_entrada(caminho_pdf)
-    return saidas_cte
+                meta, col = fut.result()
+                metricas.absorver(col)
+                return meta
+            except (BrokenProcessPool, CancelledError):
+                # worker morreu (ex.: crash nativo) e o pool foi desligado: recria no próximo lote, esta página sai local
+                _descartar_pool(pool)
+                return _local(i)
+        obter.append(_resultado)
+    return obter
+
+class ResultadoPagina(NamedTuple):
+    arquivo: str                  # PDF de entrada
+    pagina: int                   # 1-based
+    meta: Optional[MetaPagina]    # None se a extração falhou
+    nome: Optional[str]           # nome do arquivo de saída
+    cte_ok: bool                  # True → pasta_saida; False → pendentes (ou erro)
+    erro: Optional[str] = None
+
+def _catalogar(caminho_pdf: str, i: int, meta: MetaPagina, nome_final: str, is_cte_ok: bool, destino: str):
+    """Registra no catálogo (ver catalogo.py) a página recém-gravada — é o que o /files consulta."""
+    try: tamanho = os.path.getsize(destino)
+    except OSError: return
+    catalogo.registrar(caminho=os.path.abspath(destino), nome=nome_final, emissor=slugify(meta.emissor),
+                       tipo=meta.tipo, numero=int(meta.numero) if meta.numero.isdigit() else 0,
+                       chave=meta.chave, tier=meta.tier, origem=os.path.basename(caminho_pdf),
+                       pagina=i + 1, tamanho=tamanho, pendente=0 if is_cte_ok else 1)
+
+def _executar_plano(caminho_pdf: str, doc: fitz.Document, opts: OpcoesProcessamento, i: int, meta: MetaPagina,
+                    nome_final: str, is_cte_ok: bool, destino: str, gravar: bool) -> ResultadoPagina:
+    if gravar:
+        try:
+            ms = salvar_pagina(doc, i, destino, opts.split_perfil)
+        except Exception as e:
+            print(f"⚠️ Erro na página {i+1} de {os.path.basename(caminho_pdf)}: {e}")
+            return ResultadoPagina(caminho_pdf, i + 1, meta, nome_final, False, str(e))
+        _catalogar(caminho_pdf, i, meta, nome_final, is_cte_ok, destino)
+        if is_cte_ok:
+            print(f"✅ Página {i+1} (CTE, tier={meta.tier}) salva em {ms:.0f} ms: {os.path.basename(destino)}")
+        else:
+            print(f"➜ Página {i+1} (tier={meta.tier}) movida p/ pendentes em {ms:.0f} ms: {os.path.basename(destino)}")
+    return ResultadoPagina(caminho_pdf, i + 1, meta, nome_final, is_cte_ok)
+
+def _gravar_paginas(caminho_pdf: str, doc: fitz.Document, opts: OpcoesProcessamento,
+                    paginas: List[Callable[[], MetaPagina]]) -> Iterator[ResultadoPagina]:
+    """Grava as páginas na ordem, entregando cada uma assim que estiver salva."""
+    for i, obter in enumerate(paginas):
+        meta, nome_final = None, None
+        try:
+            meta = obter()
+            tipo_doc, nome_emissor, numero_doc = meta.tipo, meta.emissor, meta.numero
+            if not numero_doc.isdigit(): numero_doc = "000"
+
+            nome_final = f"{slugify(nome_emissor)}_{tipo_doc}_{numero_doc}.pdf"
+            is_cte_ok = (tipo_doc == "CTE" and nome_emissor != "EMISSOR_DESCONHECIDO" and numero_doc != "000")
+            destino_base = opts.pasta_saida if is_cte_ok else opts.pasta_pendentes
+            destino = os.path.join(destino_base, nome_final)
+
+            gravar = not (os.path.exists(destino) and opts.overwrite == "skip")
+            if not gravar:
+                print(f"⏭️  Saída já existe, pulando: {os.path.basename(destino)}")
+        except Exception as e_pag:
+            print(f"⚠️ Erro na página {i+1} de {os.path.basename(caminho_pdf)}: {e_pag}")
+            yield ResultadoPagina(caminho_pdf, i + 1, meta, nome_final, False, str(e_pag))
+            continue
+        yield _executar_plano(caminho_pdf, doc, opts, i, meta, nome_final, is_cte_ok, destino, gravar)
+
+def iterar_paginas(caminhos: List[str], opts: Optional[OpcoesProcessamento] = None) -> Iterator[ResultadoPagina]:
+    """Entrega cada página assim que é gravada, na ordem (arquivo, página). Cada PDF é aberto, consultado no
+    cache e agendado no pool só quando é alcançado — o do próximo arquivo enquanto o pool ainda trabalha nas
+    páginas do atual. A entrada é disposta quando todas as suas páginas saem."""
+    opts = opts or opcoes_padrao()
+    for pasta in (opts.pasta_saida, opts.pasta_pendentes):
+        os.makedirs(pasta, exist_ok=True)
+    modo = _modo_cache(opts)
+    varios = len(caminhos) > 1
+    abertos: List[fitz.Document] = []
+    restantes = iter(caminhos)
 
-def processar_arquivos(caminhos: list) -> List[str]:
-    out: List[str] = []
-    for c in caminhos:
-        if c and c.lower().endswith(".pdf") and os.path.exists(c):
-            out.extend(processar_pdf(c))
-    return out
+    def _proximo():
+        for c in restantes:
+            try:
+                doc = fitz.open(c)
+            except Exception as e:
+                print(f"⚠️ Erro ao abrir '{c}': {e}"); continue
+            abertos.append(doc)
+            resolvidas, digests = _consultar_cache(c, doc, modo)
+            pendentes = doc.page_count - len(resolvidas)
+            paralelo = PDF_WORKERS > 1 and pendentes > 0 and (varios or pendentes > 1)
+            return c, doc, digests, _agendar_paginas(c, doc, opts, paralelo, resolvidas)
+        return None
 
-def processar():
+    try:
+        atual = _proximo()
+        while atual:
+            c, doc, digests, paginas = atual
+            seguinte, adiantado = None, False
+            print(f"\n📄 Processando: {os.path.basename(c)}")
+            resultados: List[Optional[Tuple[MetaPagina, str]]] = []
+            for r in _gravar_paginas(c, doc, opts, paginas):
+                registrar_dpi(r.meta)
+                metricas.contar("paginas_total", tier=r.meta.tier if r.meta else "erro",
+                                resultado="erro" if r.erro else ("ok" if r.cte_ok else "pendente"))
+                resultados.append((r.meta, r.nome) if (r.meta and r.nome and not r.erro) else None)
+                yield r
+                if not adiantado:   # o resto deste arquivo já está no pool: consulta/agenda o próximo enquanto isso
+                    seguinte, adiantado = _proximo(), True
+            if not adiantado:
+                seguinte = _proximo()
+            _registrar_cache(digests, resultados, modo)
+            try: doc.close()
+            except Exception: pass
+            _dispor_entrada(c, opts)
+            atual = seguinte
+        if abertos:
+            print(f"📊 DPI que resolveu (acumulado): {dpi_stats()}")
+    finally:
+        for doc in abertos:
+            if not doc.is_closed:
+                try: doc.close()
+                except Exception: pass
+
+def _processar_lote(caminhos: List[str], opts: Optional[OpcoesProcessamento] = None,
+                    on_pagina: Optional[Callable[[ResultadoPagina], None]] = None) -> List[str]:
+    saidas: List[str] = []
+    for r in iterar_paginas(caminhos, opts):
+        if r.cte_ok: saidas.append(r.nome)
+        if on_pagina:
+            try: on_pagina(r)
+            except Exception as e: print(f"⚠️ Callback on_pagina falhou: {e}")
+    return saidas
+
+def processar_pdf(caminho_pdf: str, opts: Optional[OpcoesProcessamento] = None,
+                  on_pagina: Optional[Callable[[ResultadoPagina], None]] = None) -> List[str]:
+    return _processar_lote([caminho_pdf], opts, on_pagina)
+
+def processar_arquivos(caminhos: list, opts: Optional[OpcoesProcessamento] = None,
+                       on_pagina: Optional[Callable[[ResultadoPagina], None]] = None) -> List[str]:
+    """Retorna os nomes das saídas CTE; on_pagina (opcional) é chamado para cada página assim que ela é gravada."""
+    return _processar_lote([c for c in caminhos if c and c.lower().endswith(".pdf") and os.path.exists(c)], opts, on_pagina)
+
+def processar(opts: Optional[OpcoesProcessamento] = None):
+    os.makedirs(PASTA_ENTRADAS, exist_ok=True)
     arquivos = [f for f in os.listdir(PASTA_ENTRADAS) if f.lower().endswith(".pdf")]
     if not arquivos:
         print("ℹ️ Nenhum PDF em", PASTA_ENTRADAS); return
-    for nome in arquivos:
-        processar_pdf(os.path.join(PASTA_ENTRADAS, nome))
+    with metricas.coletando() as col:
+        processar_arquivos([os.path.join(PASTA_ENTRADAS, nome) for nome in sorted(arquivos)], opts)
+    print(f"⏱️ Lote: {col.linha()}")
+
+def vigiar_entradas(opts: Optional[OpcoesProcessamento] = None, workers: Optional[int] = None):
+    """Modo contínuo: cada PDF que chegar (e terminar de ser gravado) em PASTA_ENTRADAS é processado sozinho."""
+    import vigia_pasta as vigia
+    opts = opts or opcoes_padrao()
+    def _tratar(caminho: str):
+        with metricas.coletando() as col:
+            processar_pdf(caminho, opts)
+        print(f"⏱️ {os.path.basename(caminho)}: {col.linha()}")
+    vigia.vigiar(PASTA_ENTRADAS, _tratar, workers=workers or vigia.WATCH_WORKERS)
 
 if __name__ == "__main__":
+    import vigia_pasta as vigia
     p = argparse.ArgumentParser(description="Processa PDFs (escaneados ou digitais) e renomeia por tipo/emissor/número.")
     p.add_argument("--input",     default=PASTA_ENTRADAS)
     p.add_argument("--output",    default=PASTA_SAIDA)
@@ -520,9 +1382,15 @@ if __name__ == "__main__":
     p.add_argument("--processed", default=PASTA_PROCESSADOS)
     p.add_argument("--disposition", default=INPUT_DISPOSITION, choices=["move","delete","keep"])
     p.add_argument("--overwrite", default=OUTPUT_OVERWRITE, choices=["skip","replace"])
+    p.add_argument("--split-profile", default=SPLIT_PROFILE, choices=list(SPLIT_PERFIS.keys()))
     # Novo: modo emissor fixo
     p.add_argument("--emissor-id", choices=list(EMISSOR_CHOICES.keys()))
     p.add_argument("--emissor-fixo", help="Nome canônico do emissor para o lote (sobrepõe emissor-id)")
+    # Modo contínuo (também por WATCH_MODE=true, p/ o start command do deploy)
+    p.add_argument("--watch", action="store_true", default=(os.getenv("WATCH_MODE", "false").lower() == "true"),
+                   help="Fica vigiando a pasta de entrada em vez de processar uma vez e sair")
+    p.add_argument("--watch-workers", type=int, default=vigia.WATCH_WORKERS)
+    p.add_argument("--diag", action="store_true", help="Mostra o diagnóstico do ambiente (binários, libs, config) e sai")
     a = p.parse_args()
 
     # aplica CLI sobre env
@@ -537,6 +1405,14 @@ if __name__ == "__main__":
 
     PASTA_ENTRADAS, PASTA_SAIDA, PASTA_PENDENTES, PASTA_PROCESSADOS = a.input, a.output, a.pendentes, a.processed
     INPUT_DISPOSITION, OUTPUT_OVERWRITE = a.disposition, a.overwrite
+    SPLIT_PROFILE = a.split_profile
+    if a.diag:
+        diagnostico()
+        sys.exit(0)
+    imprimir_config()
     for pasta in (PASTA_ENTRADAS, PASTA_SAIDA, PASTA_PENDENTES, PASTA_PROCESSADOS):
         os.makedirs(pasta, exist_ok=True)
-    processar()
+    if a.watch:
+        vigiar_entradas(opcoes_padrao(), workers=a.watch_workers)
+    else:
+        processar(opcoes_padrao())
@@ -1,16 +1,26 @@
 # server.py
 import os
+import time
+import uuid
 import threading
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, Response, send_from_directory, jsonify
 from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
 
 # processamento
 import renomear_cte_mesma_pasta as proc
+import fila_jobs as fila
+import sessoes
+import catalogo
+import cache_resultados
+import metricas
+import faxina
 
 # WhatsApp (Twilio)
-from twilio.rest import Client
+import remetente_whatsapp as zap
 
 load_dotenv()
 
@@ -49,10 +59,10 @@ DELETE_DELAY_SECONDS     = int(os.getenv("DELETE_DELAY_SECONDS", "180"))
 
 app = Flask(__name__)  # server:app
 
-# ===== Sessões simples por número (menu 1/2) =====
-from threading import Lock
-SESSIONS = {}  # { from_number: {"pending": [filenames], "emissor": "1"|"2"|None} }
-SESS_LOCK = Lock()
+# ===== Sessões por número (PDFs pendentes até a escolha 1/2) =====
+# backend compartilhado entre workers/réplicas (SESSION_BACKEND=memory|sqlite|redis)
+SESSOES = sessoes.criar_backend()
+print(f"🗂️ Sessões: backend={SESSOES.nome}")
 
 EMISSOR_CHOICES = {
     "1": "WANDER_PEREIRA_DE_MATOS",
@@ -67,36 +77,42 @@ MENU_TXT = (
 )
 
 def _twilio_client():
-    if not (TWILIO_SID and TWILIO_TOKEN):
-        return None
-    try:
-        return Client(TWILIO_SID, TWILIO_TOKEN)
-    except Exception:
-        return None
+    return zap.cliente()  # um cliente por processo, conexões reaproveitadas
 
-def _send_text_whatsapp(body, to_number):
-    client = _twilio_client()
-    if not (client and TWILIO_FROM and to_number):
-        return
-    try:
-        client.messages.create(from_=TWILIO_FROM, to=to_number, body=body)
-    except Exception as e:
+def _log_falha_envio(fut):
+    e = fut.exception()
+    if e:
         print(f"⚠️ Erro ao enviar texto WhatsApp: {e}")
 
-def _send_media_whatsapp(urls, to_number):
-    client = _twilio_client()
-    if not (client and TWILIO_FROM and to_number):
+def _send_text_whatsapp(body, to_number):
+    if not (_twilio_client() and TWILIO_FROM and to_number):
         return
-    first = True
-    for u in urls:
-        params = {"from_": TWILIO_FROM, "to": to_number, "media_url": [u]}
-        if first:
-            params["body"] = "✅ Processado. Segue o PDF."
+    # não bloqueia o webhook; a ordem por destinatário é mantida pelo remetente
+    zap.remetente().enviar(TWILIO_FROM, to_number, body=body).add_done_callback(_log_falha_envio)
+
+def _enfileirar_midias(urls, to_number, legenda=True):
+    """Entrega as mídias ao remetente sem esperar; retorna os futures (1 mensagem por PDF)."""
+    if not (_twilio_client() and TWILIO_FROM and to_number):
+        return []
+    return [zap.remetente().enviar(TWILIO_FROM, to_number,
+                                   body="✅ Processado. Segue o PDF." if (legenda and k == 0) else None, media_url=[u])
+            for k, u in enumerate(urls)]
+
+def _aguardar_envios(futs, t0):
+    t_espera = time.perf_counter()
+    falhas = 0
+    for f in futs:
         try:
-            client.messages.create(**params)
+            f.result()
         except Exception as e:
+            falhas += 1
             print(f"⚠️ Erro ao enviar mídia: {e}")
-        first = False
+    # cada envio já entra no histograma (thread do remetente); no job fica o quanto ele esperou por eles
+    metricas.anotar("envio_espera", time.perf_counter() - t_espera)
+    print(f"📤 {len(futs) - falhas}/{len(futs)} mídia(s) enviada(s) em {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+def _send_media_whatsapp(urls, to_number):
+    _aguardar_envios(_enfileirar_midias(urls, to_number), time.perf_counter())
 
 def _safe_remove(path):
     try:
@@ -106,20 +122,49 @@ def _safe_remove(path):
         pass
     except Exception as e:
         print(f"⚠️ Erro ao remover {path}: {e}")
+        return
+    catalogo.marcar_removido(path)
+
+# ===== Limpeza (uma thread por processo; agenda persistida — ver faxina.py) =====
+# renomeados saem pela agenda pós-envio; as demais pastas só por retenção/cota (FAXINA_<PASTA>_HORAS / _MB)
+faxina.iniciar({
+    INPUT_DIR:                faxina.politica("ENTRADAS", horas_padrao=24),     # > SESSION_TTL: ainda pode vir o "1/2"
+    PENDENTES_DIR:            faxina.politica("PENDENTES", horas_padrao=7 * 24),
+    proc.PASTA_PROCESSADOS:   faxina.politica("PROCESSADOS", horas_padrao=7 * 24),
+    OUTPUT_DIR:               faxina.politica("RENOMEADOS"),
+}, ao_remover=catalogo.marcar_removido)
 
 def _schedule_delete(paths, delay):
-    def _job():
-        for p in paths:
-            absp = os.path.abspath(p)
-            if absp.startswith(os.path.abspath(OUTPUT_DIR)) or absp.startswith(os.path.abspath(PENDENTES_DIR)):
-                _safe_remove(absp)
-    threading.Timer(delay, _job).start()
-    print(f"⏳ Limpeza agendada em {delay}s para {len(paths)} arquivo(s).")
+    permitidas = (os.path.abspath(OUTPUT_DIR), os.path.abspath(PENDENTES_DIR))
+    n = faxina.agendar([p for p in map(os.path.abspath, paths) if p.startswith(permitidas)], delay)
+    print(f"⏳ Limpeza agendada em {delay}s para {n} arquivo(s).")
 
 @app.get("/health")
 def health():
     return {"status": "ok"}, 200
 
+# ===== Métricas (Prometheus) =====
+def _fila_por_estado():
+    cont = fila.contagem()
+    return {(("estado", e),): cont.get(e, 0) for e in (fila.NA_FILA, fila.PROCESSANDO, fila.CONCLUIDO, fila.FALHOU)}
+
+metricas.gauge("fila_jobs", _fila_por_estado, "Jobs na fila persistida, por estado (todas as instâncias)")
+metricas.gauge("jobs_em_andamento", fila.ocupados, "Jobs em execução (soma dos workers)", por_processo=True)
+metricas.gauge("fila_workers_livres", fila.livres, "Workers da fila ociosos (soma dos workers)", por_processo=True)
+metricas.gauge("envios_pendentes", lambda: zap.remetente().stats()["pendentes"], "Mensagens aguardando envio ao Twilio",
+               por_processo=True)
+# gunicorn -w N: cada worker publica o seu registro no METRICAS_DB e qualquer um responde o /metrics com a soma
+metricas.compartilhar()
+
+@app.get("/metrics")
+def metrics():
+    return Response(metricas.exportar(), 200, content_type=metricas.CONTENT_TYPE)
+
+@app.get("/diag")
+def diag():
+    # sob demanda: binários (pdftoppm/tesseract), libs pesadas e config efetiva do processamento
+    return jsonify({**proc.diagnostico(imprimir=False), "faxina": faxina.stats(), "cache": cache_resultados.stats()}), 200
+
 def _compute_base_url(req):
     if PUBLIC_BASE_URL:
         return PUBLIC_BASE_URL
@@ -128,17 +173,66 @@ def _compute_base_url(req):
         root = "https://" + root[len("http://"):]
     return root
 
+# ===== Catálogo de saídas (/files) =====
+# volumes com arquivos anteriores ao catálogo: importa uma vez, em background
+threading.Thread(target=catalogo.importar_pastas, args=({OUTPUT_DIR: False, PENDENTES_DIR: True},),
+                 name="catalogo-import", daemon=True).start()
+
+def _arg_int(nome):
+    v = (request.args.get(nome) or "").strip()
+    return int(v) if v.lstrip("-").isdigit() else None
+
+def _arg_bool(nome):
+    v = (request.args.get(nome) or "").strip().lower()
+    return {"1": True, "true": True, "sim": True, "0": False, "false": False, "nao": False}.get(v)
+
+def _arg_data(nome, fim_do_dia=False):
+    """AAAA-MM-DD (dia local inteiro) ou epoch em segundos."""
+    v = (request.args.get(nome) or "").strip()
+    if not v:
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        pass
+    try:
+        d = datetime.strptime(v, "%Y-%m-%d")
+    except ValueError:
+        return None
+    return d.timestamp() + (86400 if fim_do_dia else 0)
+
+def _doc_publico(d):
+    pasta = "pendentes" if d["pendente"] else "renomeados"
+    return {"id": d["id"], "nome": d["nome"], "emissor": d["emissor"], "tipo": d["tipo"], "numero": d["numero"],
+            "chave": d["chave"], "origem": d["origem"], "pagina": d["pagina"], "tamanho": d["tamanho"],
+            "pendente": bool(d["pendente"]), "status": d["status"], "tier": d["tier"],
+            "criado": d["criado"], "atualizado": d["atualizado"], "removido": d["removido"],
+            "url": f"/files/{pasta}/{d['nome']}" if d["status"] == catalogo.ATIVO else None}
+
 @app.get("/files")
 def list_files():
-    out_files = sorted([f for f in os.listdir(OUTPUT_DIR) if f.lower().endswith(".pdf")])
-    pen_files = sorted([f for f in os.listdir(PENDENTES_DIR) if f.lower().endswith(".pdf")])
+    # ?emissor=PREFIXO&numero_de=&numero_ate=&desde=AAAA-MM-DD&ate=AAAA-MM-DD&pendente=true|false
+    # &status=ativo|removido|todos&chave=&limite=100&cursor=<proximo_cursor>
+    status = (request.args.get("status") or catalogo.ATIVO).lower()
+    res = catalogo.consultar(
+        emissor=(request.args.get("emissor") or "").strip() or None,
+        numero_de=_arg_int("numero_de"), numero_ate=_arg_int("numero_ate"),
+        desde=_arg_data("desde"), ate=_arg_data("ate", fim_do_dia=True),
+        pendente=_arg_bool("pendente"), status=None if status == "todos" else status,
+        chave=(request.args.get("chave") or "").strip() or None,
+        limite=_arg_int("limite") or 100, cursor=_arg_int("cursor"),
+    )
+    itens = [_doc_publico(d) for d in res["itens"]]
+    cont = catalogo.contagem()
     return jsonify({
         "output_dir": OUTPUT_DIR,
         "pendentes_dir": PENDENTES_DIR,
-        "output_count": len(out_files),
-        "pendentes_count": len(pen_files),
-        "output_files": out_files,
-        "pendentes_files": pen_files,
+        "output_count": cont["ativos"],
+        "pendentes_count": cont["pendentes"],
+        "output_files": [d["nome"] for d in itens if not d["pendente"]],
+        "pendentes_files": [d["nome"] for d in itens if d["pendente"]],
+        "itens": itens,
+        "proximo_cursor": res["proximo_cursor"],
     }), 200
 
 @app.get("/files/renomeados/<path:fname>")
@@ -149,51 +243,157 @@ def download_renomeado(fname):
 def download_pendente(fname):
     return send_from_directory(PENDENTES_DIR, fname, as_attachment=True, mimetype="application/pdf")
 
+# ===== Download das mídias (1ª etapa do job) =====
+MEDIA_DOWNLOAD_PARALELO = int(os.getenv("MEDIA_DOWNLOAD_PARALELO", "4"))
+MEDIA_DOWNLOAD_TIMEOUT  = int(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "30"))
+_HTTP = None
+_HTTP_LOCK = threading.Lock()
+
+def _http_session():
+    """requests.Session compartilhada (keep-alive + pool de conexões) para baixar mídia do Twilio."""
+    global _HTTP
+    with _HTTP_LOCK:
+        if _HTTP is None:
+            sess = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(4, MEDIA_DOWNLOAD_PARALELO * 2))
+            sess.mount("https://", adapter)
+            sess.mount("http://", adapter)
+            if TWILIO_SID and TWILIO_TOKEN:
+                sess.auth = (TWILIO_SID, TWILIO_TOKEN)
+            _HTTP = sess
+        return _HTTP
+
+def _baixar_midia(item):
+    """Baixa uma mídia para INPUT_DIR. Retorna {"nome", "ms", "bytes", "erro"}."""
+    nome = item["nome"]
+    caminho = os.path.join(INPUT_DIR, nome)
+    t0 = time.perf_counter()
+    n = 0
+    try:
+        with _http_session().get(item["url"], stream=True, timeout=MEDIA_DOWNLOAD_TIMEOUT) as r:
+            r.raise_for_status()
+            with open(caminho + ".part", "wb") as f:
+                for chunk in r.iter_content(chunk_size=64 * 1024):
+                    if chunk:
+                        f.write(chunk); n += len(chunk)
+        os.replace(caminho + ".part", caminho)
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"📥 PDF salvo: {nome} ({n/1024:.0f} KiB em {ms:.0f} ms)")
+        return {"nome": nome, "ms": round(ms, 1), "bytes": n, "erro": None}
+    except Exception as e:
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"⚠️ Falha ao baixar mídia {nome} ({ms:.0f} ms): {e}")
+        _safe_remove(caminho + ".part")
+        return {"nome": nome, "ms": round(ms, 1), "bytes": n, "erro": str(e)}
+
+def _baixar_midias(itens):
+    """Baixa em paralelo (até MEDIA_DOWNLOAD_PARALELO). Itens já em disco (str) passam direto."""
+    a_baixar = [i for i in itens if isinstance(i, dict)]
+    downloads = []
+    if a_baixar:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(MEDIA_DOWNLOAD_PARALELO, len(a_baixar)))) as ex:
+            downloads = list(ex.map(_baixar_midia, a_baixar))
+        for d in downloads:
+            metricas.observar("download", d["ms"] / 1000)
+            metricas.contar("downloads_total", resultado="erro" if d["erro"] else "ok")
+            metricas.contar("midia_bytes_total", d["bytes"])
+        print(f"📥 {len(a_baixar)} mídia(s) em {(time.perf_counter() - t0) * 1000:.0f} ms")
+    ok = {d["nome"] for d in downloads if not d["erro"]}
+    salvos = [i if isinstance(i, str) else i["nome"] for i in itens
+              if isinstance(i, str) or i["nome"] in ok]
+    return salvos, downloads
+
 # ===== Worker que processa já com o emissor escolhido =====
+STREAM_LOTE = max(1, int(os.getenv("STREAM_LOTE", "1")))   # páginas agrupadas por despacho ao WhatsApp
+
 def _processar_e_notificar(salvos, to_number, base_url, emissor_id=None, emissor_nome=None):
     try:
-        # fixa o emissor no módulo (se suportado) apenas durante este lote
-        if hasattr(proc, "set_emissor_fixo_runtime"):
-            if emissor_nome:
-                proc.set_emissor_fixo_runtime(emissor_nome=emissor_nome)
-            elif emissor_id in ("1", "2"):
-                proc.set_emissor_fixo_runtime(emissor_id=emissor_id)
+        # opções só deste lote: lotes concorrentes não compartilham o emissor escolhido
+        opts = proc.opcoes_padrao(pasta_saida=OUTPUT_DIR, pasta_pendentes=PENDENTES_DIR)
+        if emissor_nome or emissor_id in ("1", "2"):
+            opts = opts.com_emissor(emissor_id=emissor_id, emissor_nome=emissor_nome)
+
+        # cada CT-e sai para o WhatsApp assim que a página é gravada (em grupos de STREAM_LOTE)
+        t0 = time.perf_counter()
+        futs, buffer = [], []
+        def _despachar():
+            if buffer:
+                links = [f"{base_url}/files/renomeados/{b}" for b in buffer]
+                futs.extend(_enfileirar_midias(links, to_number, legenda=not futs))
+                buffer.clear()
+        def _on_pagina(r):
+            if r.cte_ok:
+                buffer.append(r.nome)
+                if len(buffer) >= STREAM_LOTE:
+                    _despachar()
 
         caminhos_abs = [os.path.join(INPUT_DIR, n) for n in salvos]
-        basenames = proc.processar_arquivos(caminhos_abs)
+        basenames = proc.processar_arquivos(caminhos_abs, opts, on_pagina=_on_pagina)
+        _despachar()
 
-        links = [f"{base_url}/files/renomeados/{b}" for b in basenames]
         paths_abs = [os.path.join(OUTPUT_DIR, b) for b in basenames]
 
-        if links:
-            _send_media_whatsapp(links, to_number)
+        if basenames:
+            _aguardar_envios(futs, t0)
             if DELETE_OUTPUT_AFTER_SEND and paths_abs:
                 _schedule_delete(paths_abs, DELETE_DELAY_SECONDS)
         else:
             print("ℹ️ Nada novo para enviar (sem renomeados gerados).")
+        return basenames
     except Exception as e:
         print(f"⚠️ Falha no worker: {e}")
-    finally:
-        # reseta o emissor fixo no módulo para evitar vazar para próximo lote
-        if hasattr(proc, "set_emissor_fixo_runtime"):
-            try:
-                proc.set_emissor_fixo_runtime()
-            except Exception as e:
-                print(f"⚠️ Falha ao resetar emissor runtime: {e}")
-
-def _session_get_or_create(num):
-    with SESS_LOCK:
-        sess = SESSIONS.get(num)
-        if not sess:
-            sess = {"pending": [], "emissor": None}
-            SESSIONS[num] = sess
-        return sess
-
-def _set_emissor(sess, choice):
-    if choice in ("1","2"):
-        sess["emissor"] = choice
-        return True
-    return False
+        raise
+
+def _etapas_job(payload):
+    salvos, downloads = _baixar_midias(payload["salvos"])
+    if not salvos:
+        _send_text_whatsapp("⚠️ Não consegui baixar os PDFs enviados. Envie novamente, por favor.", payload["to_number"])
+        return {"enviados": [], "downloads": downloads}
+    enviados = _processar_e_notificar(
+        salvos, payload["to_number"], payload["base_url"],
+        payload.get("emissor_id"), payload.get("emissor_nome"),
+    )
+    return {"enviados": enviados or [], "downloads": downloads}
+
+def _executar_job(payload):
+    # tempos por etapa deste job: uma linha no log ao terminar e uma cópia no resultado gravado na fila
+    with metricas.coletando() as col:
+        resultado = "falha"
+        try:
+            res = _etapas_job(payload)
+            resultado = "ok"
+        finally:
+            metricas.histograma("job_segundos", col.decorrido())
+            metricas.contar("jobs_total", resultado=resultado)
+            print(f"⏱️ Job {fila.job_atual() or '-'} ({resultado}): {col.linha()}")
+    res["tempos"] = col.resumo()
+    return res
+
+fila.iniciar(_executar_job)
+
+def _job_publico(job):
+    # sem payload: não expõe o número do remetente
+    out = {k: job.get(k) for k in ("id", "estado", "criado", "iniciado", "finalizado", "erro", "posicao") if k in job}
+    out["arquivos"] = len((job.get("payload") or {}).get("salvos") or [])
+    out["enviados"] = len((job.get("resultado") or {}).get("enviados") or [])
+    return out
+
+@app.get("/jobs")
+def list_jobs():
+    estado = request.args.get("estado") or None
+    limite = max(1, min(_arg_int("limit") or 50, 500))
+    return jsonify({
+        "contagem": fila.contagem(),
+        "jobs": [_job_publico(j) for j in fila.listar(estado, limite)],
+    }), 200
+
+@app.get("/jobs/<int:job_id>")
+def get_job(job_id):
+    job = fila.consultar(job_id)
+    if not job:
+        return jsonify({"erro": "job não encontrado"}), 404
+    return jsonify(_job_publico(job)), 200
 
 # ===== Webhook Twilio =====
 @app.post("/whatsapp")
@@ -204,69 +404,57 @@ def whatsapp_webhook():
     num_media = int(request.form.get("NumMedia", "0") or 0)
 
     base_url = _compute_base_url(request)
-    sess = _session_get_or_create(from_number)
 
-    # 1) Escolha recebida (sem mídia): processa o que estiver pendente e SEMPRE zera a escolha
+    # 1) Escolha recebida (sem mídia): processa o que estiver pendente; a escolha vale só para este lote
     if num_media <= 0 and body in ("1","2"):
-        _set_emissor(sess, body)
-        pend = list(sess["pending"])
-        sess["pending"].clear()
+        pend = SESSOES.retirar_pendentes(from_number)
         if pend:
-            _send_text_whatsapp(f"Ok, emissor: {EMISSOR_CHOICES[body]}. Processando {len(pend)} arquivo(s)…", from_number)
-            # single-use: zera para forçar menu no próximo envio
-            sess["emissor"] = None
-            threading.Thread(
-                target=_processar_e_notificar,
-                args=(pend, from_number, base_url, body, None),
-                daemon=True
-            ).start()
-            return Response("Processando.", 200)
+            try:
+                job_id, posicao = fila.enfileirar({
+                    "salvos": pend, "to_number": from_number, "base_url": base_url, "emissor_id": body,
+                })
+            except fila.FilaCheia as e:
+                print(f"⚠️ Fila cheia ({e}); lote de {from_number} devolvido à sessão")
+                SESSOES.anexar_pendentes(from_number, pend)
+                _send_text_whatsapp("⏳ Fila cheia no momento. Responda 1 ou 2 novamente em alguns minutos.", from_number)
+                return Response("Fila cheia.", 200)
+            if posicao <= fila.livres():
+                _send_text_whatsapp(f"Ok, emissor: {EMISSOR_CHOICES[body]}. Processando {len(pend)} arquivo(s)…", from_number)
+            else:
+                _send_text_whatsapp(f"Ok, emissor: {EMISSOR_CHOICES[body]}. {len(pend)} arquivo(s) na fila, posição {posicao}.", from_number)
+            return Response(f"Job {job_id} na fila.", 200)
         else:
             # nenhuma pendência: não mantém escolha; obriga novo menu no próximo envio
-            sess["emissor"] = None
             _send_text_whatsapp("Escolha registrada. Envie os PDFs agora que eu vou perguntar novamente o emissor.", from_number)
             return Response("Aguardando PDFs.", 200)
 
     # 2) Recebimento de PDFs: SEMPRE exigir escolha a cada lote
     if num_media > 0:
+        # responde já: o download vira a primeira etapa do job (após a escolha 1/2)
+        stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+        lote  = uuid.uuid4().hex[:6]
         salvos = []
         for i in range(num_media):
             content_type = (request.form.get(f"MediaContentType{i}", "") or "").lower()
             media_url    = request.form.get(f"MediaUrl{i}", "") or ""
             if "pdf" not in content_type or not media_url:
                 continue
-            try:
-                auth = (TWILIO_SID, TWILIO_TOKEN) if (TWILIO_SID and TWILIO_TOKEN) else None
-                with requests.get(media_url, stream=True, timeout=30, auth=auth) as r:
-                    r.raise_for_status()
-                    stamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-                    nome  = f"zap_{stamp}_{i+1}.pdf"
-                    caminho = os.path.join(INPUT_DIR, nome)
-                    with open(caminho, "wb") as f:
-                        for chunk in r.iter_content(chunk_size=8192):
-                            if chunk:
-                                f.write(chunk)
-                    salvos.append(nome)
-                    print(f"📥 PDF salvo de {from_number}: {nome}")
-            except Exception as e:
-                print(f"⚠️ Falha ao baixar mídia {i}: {e}")
+            salvos.append({"url": media_url, "nome": f"zap_{stamp}_{lote}_{i+1}.pdf"})
+            print(f"📎 PDF recebido de {from_number}: {salvos[-1]['nome']}")
 
         if not salvos:
             return Response("Nenhum PDF válido encontrado no envio.", 200)
 
         # Empilha e força perguntar SEMPRE (não usa escolha anterior)
-        sess["pending"].extend(salvos)
-        sess["emissor"] = None  # invalida qualquer escolha anterior
+        SESSOES.anexar_pendentes(from_number, salvos)
         _send_text_whatsapp(MENU_TXT, from_number)
         return Response("Escolha requerida.", 200)
 
     # 3) Comandos auxiliares
     if body in ("menu","opcoes","opções","emissor"):
-        sess["emissor"] = None  # garante que vai perguntar
         _send_text_whatsapp(MENU_TXT, from_number)
         return Response("Menu enviado.", 200)
     if body in ("trocar","reset","alterar"):
-        sess["emissor"] = None
         _send_text_whatsapp("Emissor limpo. " + MENU_TXT, from_number)
         return Response("Emissor resetado.", 200)
 
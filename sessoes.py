@@ -0,0 +1,147 @@
+# sessoes.py
+# Sessões do WhatsApp (PDFs pendentes por remetente) com backend plugável:
+# memória (1 processo), SQLite em WAL (volume compartilhado /data) ou Redis.
+import os, json, time, sqlite3, threading
+from typing import List, Any, Dict, Optional
+
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+
+class SessoesMemoria:
+    """Só serve para um único processo (ex.: dev, gunicorn -w 1)."""
+    nome = "memory"
+
+    def __init__(self, ttl: int = SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._d: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _viva(self, numero: str) -> Optional[Dict[str, Any]]:
+        s = self._d.get(numero)
+        if s and s["expira"] < time.time():
+            self._d.pop(numero, None)
+            return None
+        return s
+
+    def anexar_pendentes(self, numero: str, itens: List[Any]) -> int:
+        with self._lock:
+            s = self._viva(numero) or {"itens": []}
+            s["itens"] = s["itens"] + list(itens)
+            s["expira"] = time.time() + self.ttl
+            self._d[numero] = s
+            return len(s["itens"])
+
+    def retirar_pendentes(self, numero: str) -> List[Any]:
+        with self._lock:
+            s = self._viva(numero)
+            self._d.pop(numero, None)
+            return list(s["itens"]) if s else []
+
+    def limpar(self, numero: str):
+        with self._lock:
+            self._d.pop(numero, None)
+
+class SessoesSQLite:
+    """Arquivo SQLite em WAL: vários workers/réplicas no mesmo volume enxergam as mesmas sessões."""
+    nome = "sqlite"
+
+    def __init__(self, caminho: str, ttl: int = SESSION_TTL_SECONDS):
+        self.caminho = caminho
+        self.ttl = ttl
+        c = self._conn()
+        try:
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("""CREATE TABLE IF NOT EXISTS sessoes (
+                            numero TEXT PRIMARY KEY,
+                            itens  TEXT NOT NULL,
+                            expira REAL NOT NULL)""")
+        finally:
+            c.close()
+
+    def _conn(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.caminho, timeout=15, isolation_level=None)
+
+    def anexar_pendentes(self, numero: str, itens: List[Any]) -> int:
+        agora = time.time()
+        c = self._conn()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            c.execute("DELETE FROM sessoes WHERE expira < ?", (agora,))
+            row = c.execute("SELECT itens FROM sessoes WHERE numero=?", (numero,)).fetchone()
+            atuais = (json.loads(row[0]) if row else []) + list(itens)
+            c.execute("INSERT OR REPLACE INTO sessoes (numero, itens, expira) VALUES (?,?,?)",
+                      (numero, json.dumps(atuais, ensure_ascii=False), agora + self.ttl))
+            c.execute("COMMIT")
+            return len(atuais)
+        except Exception:
+            if c.in_transaction:   # BEGIN pode ter falhado (database is locked): não mascarar o erro original
+                c.execute("ROLLBACK")
+            raise
+        finally:
+            c.close()
+
+    def retirar_pendentes(self, numero: str) -> List[Any]:
+        c = self._conn()
+        try:
+            c.execute("BEGIN IMMEDIATE")
+            row = c.execute("SELECT itens, expira FROM sessoes WHERE numero=?", (numero,)).fetchone()
+            c.execute("DELETE FROM sessoes WHERE numero=?", (numero,))
+            c.execute("COMMIT")
+        except Exception:
+            if c.in_transaction:   # BEGIN pode ter falhado (database is locked): não mascarar o erro original
+                c.execute("ROLLBACK")
+            raise
+        finally:
+            c.close()
+        if not row or row[1] < time.time():
+            return []
+        return json.loads(row[0])
+
+    def limpar(self, numero: str):
+        c = self._conn()
+        try:
+            c.execute("DELETE FROM sessoes WHERE numero=?", (numero,))
+        finally:
+            c.close()
+
+class SessoesRedis:
+    """Lista por remetente (RPUSH/EXPIRE; retirada atômica com MULTI LRANGE+DEL).
+    `cliente` permite injetar um stand-in local (ex.: fakeredis)."""
+    nome = "redis"
+
+    def __init__(self, url: Optional[str] = None, ttl: int = SESSION_TTL_SECONDS, prefixo: str = "scanner:sess:", cliente=None):
+        if cliente is None:
+            import redis  # opcional: só quando SESSION_BACKEND=redis
+            cliente = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self.r = cliente
+        self.ttl = ttl
+        self.prefixo = prefixo
+
+    def anexar_pendentes(self, numero: str, itens: List[Any]) -> int:
+        k = self.prefixo + numero
+        pipe = self.r.pipeline(transaction=True)
+        if itens:
+            pipe.rpush(k, *[json.dumps(i, ensure_ascii=False) for i in itens])
+        pipe.expire(k, self.ttl)
+        pipe.llen(k)
+        return int(pipe.execute()[-1])
+
+    def retirar_pendentes(self, numero: str) -> List[Any]:
+        k = self.prefixo + numero
+        pipe = self.r.pipeline(transaction=True)
+        pipe.lrange(k, 0, -1)
+        pipe.delete(k)
+        brutos = pipe.execute()[0] or []
+        return [json.loads(b) for b in brutos]
+
+    def limpar(self, numero: str):
+        self.r.delete(self.prefixo + numero)
+
+def criar_backend():
+    """SESSION_BACKEND=memory|sqlite|redis. Padrão: sqlite se existir /data (volume compartilhado), senão memory."""
+    tipo = (os.getenv("SESSION_BACKEND") or ("sqlite" if os.path.isdir("/data") else "memory")).lower()
+    if tipo == "redis":
+        return SessoesRedis(os.getenv("REDIS_URL"))
+    if tipo == "sqlite":
+        base = "/data" if os.path.isdir("/data") else os.getcwd()
+        return SessoesSQLite(os.getenv("SESSION_DB") or os.path.join(base, "sessoes.sqlite"))
+    return SessoesMemoria()
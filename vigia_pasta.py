@@ -0,0 +1,196 @@
+# vigia_pasta.py
+# Ingestão contínua de uma pasta: inotify (inotify_simple, opcional) com fallback para polling.
+# Um arquivo só é entregue quando para de mudar (ou chega por rename) e nunca duas vezes na mesma versão
+# (tamanho, mtime); erro em um arquivo não derruba o laço.
+import os, stat, time, signal, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Set, Tuple, Any
+try:
+    from inotify_simple import INotify, flags as iflags  # opcional: só Linux
+except Exception:
+    INotify = None
+
+WATCH_WORKERS         = int(os.getenv("WATCH_WORKERS", "2"))            # arquivos processados ao mesmo tempo
+WATCH_BACKEND         = os.getenv("WATCH_BACKEND", "auto").lower()       # auto|inotify|poll
+WATCH_POLL_SECONDS    = float(os.getenv("WATCH_POLL_SECONDS", "2"))
+WATCH_ESTAVEL_SECONDS = float(os.getenv("WATCH_ESTAVEL_SECONDS", "3"))   # tamanho/mtime parados por esse tempo
+WATCH_RESCAN_SECONDS  = float(os.getenv("WATCH_RESCAN_SECONDS", "60"))   # varredura completa mesmo com inotify
+
+IGNORAR_SUFIXOS = (".part", ".tmp", ".crdownload", ".partial", ".swp")
+
+Assinatura = Tuple[int, float]   # (tamanho, mtime)
+
+def _interessa(nome: str, extensoes: Tuple[str, ...]) -> bool:
+    n = nome.lower()
+    if n.startswith((".", "~$")) or n.endswith(IGNORAR_SUFIXOS):
+        return False
+    return n.endswith(extensoes)
+
+def _assinatura(caminho: str) -> Optional[Assinatura]:
+    try:
+        st = os.stat(caminho)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return st.st_size, st.st_mtime
+
+class Vigia:
+    def __init__(self, pasta: str, tratar: Callable[[str], Any], workers: int = WATCH_WORKERS,
+                 extensoes: Tuple[str, ...] = (".pdf",), estavel: float = WATCH_ESTAVEL_SECONDS,
+                 poll: float = WATCH_POLL_SECONDS, backend: str = WATCH_BACKEND):
+        self.pasta = pasta
+        self.tratar = tratar
+        self.workers = max(1, workers)
+        self.extensoes = tuple(e.lower() for e in extensoes)
+        self.estavel = estavel
+        self.poll = poll
+        self.backend = backend
+        self._ex = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="vigia")
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._observados: Dict[str, Tuple[Assinatura, float]] = {}   # caminho → (assinatura, estável desde)
+        self._em_andamento: Set[str] = set()
+        self._feitos: Dict[str, Assinatura] = {}    # versão já entregue que continua na pasta (keep/erro)
+        self._stats = {"processados": 0, "erros": 0}
+
+    # --- descoberta ---
+    def _notar(self, caminho: str, pronto: bool = False):
+        """Registra/atualiza um candidato. `pronto` (rename para dentro da pasta) dispensa a espera de estabilidade."""
+        sig = _assinatura(caminho)
+        with self._lock:
+            if sig is None:
+                self._observados.pop(caminho, None)
+                return
+            if caminho in self._em_andamento or self._feitos.get(caminho) == sig:
+                return
+        agora = time.monotonic()
+        anterior = self._observados.get(caminho)
+        if pronto:
+            desde = agora - self.estavel
+        elif anterior and anterior[0] == sig:
+            desde = anterior[1]
+        else:
+            desde = agora
+        self._observados[caminho] = (sig, desde)
+
+    def _varrer(self):
+        try:
+            nomes = [e.name for e in os.scandir(self.pasta) if e.is_file() and _interessa(e.name, self.extensoes)]
+        except OSError as e:
+            print(f"⚠️ Vigia: não consegui listar {self.pasta}: {e}")
+            return
+        presentes = {os.path.join(self.pasta, n) for n in nomes}
+        with self._lock:
+            for c in [c for c in self._feitos if c not in presentes]:
+                self._feitos.pop(c)
+        for c in [c for c in self._observados if c not in presentes]:
+            self._observados.pop(c)
+        for c in sorted(presentes):
+            self._notar(c)
+
+    # --- entrega ---
+    def _liberar(self):
+        """Entrega ao pool o que ficou estável, sem passar de 2x workers em voo (o resto espera na pasta)."""
+        agora = time.monotonic()
+        for c, (sig, desde) in sorted(self._observados.items(), key=lambda kv: kv[1][1]):
+            with self._lock:
+                if len(self._em_andamento) >= self.workers * 2:
+                    return
+            atual = _assinatura(c)
+            if atual is None:
+                self._observados.pop(c, None); continue
+            if atual != sig:
+                self._observados[c] = (atual, agora); continue
+            if atual[0] == 0 or agora - desde < self.estavel:
+                continue
+            self._observados.pop(c, None)
+            with self._lock:
+                self._em_andamento.add(c)
+            self._ex.submit(self._executar, c, atual)
+
+    def _executar(self, caminho: str, sig: Assinatura):
+        t0 = time.perf_counter()
+        try:
+            print(f"📥 Vigia: processando {os.path.basename(caminho)}")
+            self.tratar(caminho)
+            with self._lock: self._stats["processados"] += 1
+            print(f"✅ Vigia: {os.path.basename(caminho)} em {time.perf_counter() - t0:.1f}s")
+        except Exception as e:
+            with self._lock: self._stats["erros"] += 1
+            print(f"⚠️ Vigia: falha em {os.path.basename(caminho)}: {e}")
+        finally:
+            with self._lock:
+                self._em_andamento.discard(caminho)
+                if _assinatura(caminho) == sig:
+                    self._feitos[caminho] = sig   # ficou na pasta igual: só volta se mudar
+
+    # --- laço ---
+    def _abrir_inotify(self):
+        if self.backend == "poll":
+            return None
+        if INotify is None:
+            if self.backend == "inotify":
+                print("⚠️ WATCH_BACKEND=inotify mas inotify_simple não está disponível — usando polling")
+            return None
+        try:
+            ino = INotify()
+            ino.add_watch(self.pasta, iflags.CREATE | iflags.CLOSE_WRITE | iflags.MOVED_TO |
+                          iflags.DELETE | iflags.MOVED_FROM)
+            return ino
+        except OSError as e:
+            print(f"⚠️ inotify indisponível ({e}) — usando polling")
+            return None
+
+    def parar(self, *_):
+        self._parar.set()
+
+    def rodar(self):
+        os.makedirs(self.pasta, exist_ok=True)
+        ino = self._abrir_inotify()
+        print(f"👀 Vigiando {self.pasta} ({'inotify' if ino else f'polling {self.poll}s'}, {self.workers} worker(s), "
+              f"estável após {self.estavel}s)")
+        self._varrer()
+        ultima_varredura = time.monotonic()
+        try:
+            while not self._parar.is_set():
+                if ino:
+                    espera = 0.5 if self._observados else self.poll
+                    for ev in ino.read(timeout=int(espera * 1000)):
+                        if ev.mask & iflags.Q_OVERFLOW:
+                            self._varrer(); continue
+                        if not (ev.name and _interessa(ev.name, self.extensoes)):
+                            continue
+                        c = os.path.join(self.pasta, ev.name)
+                        if ev.mask & (iflags.DELETE | iflags.MOVED_FROM):
+                            self._observados.pop(c, None)
+                        else:
+                            self._notar(c, pronto=bool(ev.mask & iflags.MOVED_TO))
+                    if time.monotonic() - ultima_varredura >= WATCH_RESCAN_SECONDS:
+                        self._varrer(); ultima_varredura = time.monotonic()
+                else:
+                    self._parar.wait(min(self.poll, 0.5) if self._observados else self.poll)
+                    self._varrer()
+                self._liberar()
+        finally:
+            if ino:
+                ino.close()
+            print("⏹️ Vigia: parando — aguardando arquivos em processamento…")
+            self._ex.shutdown(wait=True)
+            print(f"⏹️ Vigia encerrado: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s["em_andamento"] = len(self._em_andamento)
+        s["aguardando"] = len(self._observados)
+        return s
+
+def vigiar(pasta: str, tratar: Callable[[str], Any], **kw):
+    """Roda até SIGTERM/SIGINT (Ctrl+C). Bloqueia o chamador."""
+    v = Vigia(pasta, tratar, **kw)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, v.parar)
+        signal.signal(signal.SIGINT, v.parar)
+    v.rodar()
+    return v